@@ -0,0 +1,163 @@
+"""
+Fixed benchmark corpus: one program per grading outcome for every language.
+
+Every entry is (name, kind, source). The kinds are clean, warning (fails at one reward
+level, the name says which), compile_error, runtime_error and timeout. Keep the programs
+stable, results are only comparable across commits while the corpus does not change.
+"""
+
+c = [
+    ("clean", "clean", """
+#include <stdio.h>
+int main(){
+    printf("Hello World");
+    return 0;
+}"""),
+    ("warning_default", "warning", """
+#include <stdio.h>
+int main(){
+    int *p = 1;
+    printf("%d", p == 0);
+    return 0;
+}"""),
+    ("warning_wall", "warning", """
+#include <stdio.h>
+int main(){
+    int unused;
+    printf("Hello World");
+    return 0;
+}"""),
+    ("warning_wextra", "warning", """
+int main(){
+    unsigned u = 1;
+    int i = -1;
+    return u < i;
+}"""),
+    ("compile_error", "compile_error", """
+int main(){
+    return x;
+}"""),
+    ("runtime_error", "runtime_error", """
+int main(){
+    int *p = 0;
+    return *p;
+}"""),
+    ("timeout", "timeout", """
+int main(){
+    while (1);
+}"""),
+]
+
+cpp = [
+    ("clean", "clean", """
+#include <iostream>
+int main(){
+    std::cout << "Hello World";
+    return 0;
+}"""),
+    ("clean_stl", "clean", """
+#include <bits/stdc++.h>
+using namespace std;
+int main(){
+    vector<int> v = {3, 1, 2};
+    sort(v.begin(), v.end());
+    map<int, string> m;
+    m[v[0]] = "one";
+    cout << m[1];
+    return 0;
+}"""),
+    ("warning_wall", "warning", """
+#include <vector>
+int main(){
+    std::vector<int> v;
+    for (int i = 0; i < v.size(); i++) {}
+    return 0;
+}"""),
+    ("warning_wextra", "warning", """
+struct Point { int x, y; };
+int main(){
+    Point p = { 1 };
+    return p.x - 1;
+}"""),
+    ("compile_error", "compile_error", """
+int main(){
+    undefined_call();
+}"""),
+    ("runtime_error", "runtime_error", """
+#include <stdexcept>
+int main(){
+    throw std::runtime_error("boom");
+}"""),
+    ("timeout", "timeout", """
+int main(){
+    while (true);
+}"""),
+]
+
+go = [
+    ("clean", "clean", """
+package main
+
+import "fmt"
+
+func main() {
+    fmt.Print("Hello World")
+}"""),
+    ("compile_error", "compile_error", """
+package main
+
+func main() {
+    x := 1
+}"""),
+    ("runtime_error", "runtime_error", """
+package main
+
+func main() {
+    panic("boom")
+}"""),
+    ("timeout", "timeout", """
+package main
+
+func main() {
+    for {
+    }
+}"""),
+]
+
+java = [
+    ("clean", "clean", """
+public class Main {
+    public static void main(String[] args) {
+        System.out.print("Hello World");
+    }
+}"""),
+    ("warning_xlint", "warning", """
+import java.util.*;
+public class Main {
+    public static void main(String[] args) {
+        List list = new ArrayList();
+        list.add("x");
+        System.out.print(list.size());
+    }
+}"""),
+    ("compile_error", "compile_error", """
+public class Main {
+    public static void main(String[] args) {
+        int x = "abc";
+    }
+}"""),
+    ("runtime_error", "runtime_error", """
+public class Main {
+    public static void main(String[] args) {
+        throw new RuntimeException("boom");
+    }
+}"""),
+    ("timeout", "timeout", """
+public class Main {
+    public static void main(String[] args) {
+        while (true) {}
+    }
+}"""),
+]
+
+corpus = {"c": c, "cpp": cpp, "go": go, "java": java}
@@ -0,0 +1,77 @@
+"""
+Measures grading throughput through a GradingDaemon against in-process grading with a plain
+CodeCompilerEnv.step loop and with CodeCompilerVecEnv, on the same worker count.
+
+Usage:
+    python benchmarks/daemon_throughput.py --batch 64 --batches 4 --clients 1 4 --workers 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from coderl.daemon import DaemonClient, GradingDaemon
+from coderl.main import CodeCompilerEnv
+from coderl.vec_env import CodeCompilerVecEnv
+
+SOURCE = """
+#include<stdio.h>
+int main(){
+    printf("Hello World");
+    return 0;
+}"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch", type=int, default=64, help="number of sources per request")
+    parser.add_argument("--batches", type=int, default=4, help="requests sent by every client")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4], help="concurrent client counts to measure")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    args = parser.parse_args()
+    sources = [SOURCE] * args.batch
+
+    env = CodeCompilerEnv()
+    start = time.perf_counter()
+    for source in sources:
+        env.step(source)
+    baseline = args.batch / (time.perf_counter() - start)
+    env.close()
+    print(f"step loop: {baseline:.1f} samples/s")
+
+    vec_env = CodeCompilerVecEnv(num_workers=args.workers)
+    try:
+        vec_env.step_batch(sources[:args.workers])
+        start = time.perf_counter()
+        vec_env.step_batch(sources)
+        throughput = args.batch / (time.perf_counter() - start)
+    finally:
+        vec_env.close()
+    print(f"vec env, {args.workers} workers: {throughput:.1f} samples/s ({throughput / baseline:.2f}x)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        daemon = GradingDaemon(os.path.join(directory, "grading.sock"), num_workers=args.workers).start()
+        try:
+            for clients in sorted(set(args.clients)):
+                def run_client(_):
+                    client = DaemonClient(daemon.path)
+                    try:
+                        for _ in range(args.batches):
+                            client.step_batch(sources)
+                    finally:
+                        client.close()
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(clients) as pool:
+                    list(pool.map(run_client, range(clients)))
+                throughput = clients * args.batches * args.batch / (time.perf_counter() - start)
+                print(f"daemon, {args.workers} workers, {clients} clients: {throughput:.1f} samples/s "
+                      f"({throughput / baseline:.2f}x)")
+        finally:
+            daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares step latency with the built program in a memory file (config["memfd"]) against the
+on-disk path, on the programs of corpus.py that build and run. The on-disk path is measured
+in the default scratch directory and in any directories given with --scratch-dir.
+
+Usage:
+    python benchmarks/memfd_benchmark.py --languages c cpp --repeat 10 --scratch-dir /tmp
+"""
+
+import argparse
+import statistics
+import time
+
+from coderl import memfd
+from coderl.main import CodeCompilerEnv, default_configs
+
+from corpus import corpus
+
+
+def measure(config, sources, repeat):
+    """
+    Returns the median step latency in milliseconds, after one warm-up pass.
+    """
+    env = CodeCompilerEnv(config)
+    try:
+        for source in sources:
+            env.step(source)
+        latencies = []
+        for _ in range(repeat):
+            for source in sources:
+                start = time.perf_counter()
+                env.step(source)
+                latencies.append(time.perf_counter() - start)
+    finally:
+        env.close()
+    return 1000 * statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--languages", nargs="+", default=["c", "cpp"], help="corpus languages to measure")
+    parser.add_argument("--repeat", type=int, default=10, help="passes over the programs")
+    parser.add_argument("--scratch-dir", nargs="*", default=[], help="more scratch directories for the disk path")
+    args = parser.parse_args()
+    if not memfd.supported:
+        parser.error("memfd_create is not available on this platform")
+
+    for lang in args.languages:
+        sources = [source for name, kind, source in corpus[lang] if kind in ("clean", "runtime_error")]
+        config = default_configs[lang]
+        disk = measure(config, sources, args.repeat)
+        print(f"{lang}, disk (default scratch): {disk:.1f} ms/step")
+        for directory in args.scratch_dir:
+            latency = measure(dict(config, scratch_dir=directory), sources, args.repeat)
+            print(f"{lang}, disk ({directory}): {latency:.1f} ms/step")
+        latency = measure(dict(config, memfd=True), sources, args.repeat)
+        print(f"{lang}, memfd: {latency:.1f} ms/step ({disk / latency:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Measures CodeCompilerEnv step latency, batch throughput and start-up time on the corpus in
+corpus.py, and writes the results as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmarks/step_benchmark.py --languages c cpp --repeat 5 --concurrency 1 2 4 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from coderl import toolchains
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP, defaultConfigGo, defaultConfigJava
+from corpus import corpus
+
+configs = {"c": defaultConfig, "cpp": defaultConfigCPP, "go": defaultConfigGo, "java": defaultConfigJava}
+
+percentiles = (50, 95, 99)
+
+# Run in a fresh interpreter: import, build the env and grade one sample
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from coderl.main import CodeCompilerEnv
+env = CodeCompilerEnv(json.loads(sys.argv[1]))
+env.step(sys.argv[2])
+cold = time.perf_counter() - start
+start = time.perf_counter()
+env.step(sys.argv[2])
+print(json.dumps({"cold_start": cold, "warm_step": time.perf_counter() - start}))
+"""
+
+
+def available_languages():
+    """
+    Returns the corpus languages whose toolchain is installed.
+    """
+    return [lang for lang in corpus if toolchains.registry.get(lang) is not None]
+
+
+def benchmark_config(lang, wall_time=1.0, grading="ladder"):
+    """
+    Returns the configuration benchmarked for a language: its default configuration with a
+    short wall-clock limit, so timeout samples cost wall_time each.
+    """
+    return dict(configs[lang], sandbox={"wall_time": wall_time}, grading=grading)
+
+
+def summarize(samples):
+    """
+    Summarizes latencies in seconds.
+
+    Returns:
+        dict: count, mean and the p50/p95/p99 latencies.
+    """
+    summary = {"count": len(samples), "mean": float(np.mean(samples))}
+    for percentile, value in zip(percentiles, np.percentile(samples, percentiles)):
+        summary[f"p{percentile}"] = float(value)
+    return summary
+
+
+def measure_latency(env, programs, repeat):
+    """
+    Steps every program repeat times on a warm environment.
+
+    Returns:
+        dict: The latency summary overall, per kind and per program.
+    """
+    env.step(programs[0][2])
+    by_program = {name: [] for name, _, _ in programs}
+    by_kind = {}
+    for _ in range(repeat):
+        for name, kind, source in programs:
+            start = time.perf_counter()
+            env.step(source)
+            elapsed = time.perf_counter() - start
+            by_program[name].append(elapsed)
+            by_kind.setdefault(kind, []).append(elapsed)
+    return {
+        "all": summarize([value for values in by_program.values() for value in values]),
+        "kinds": {kind: summarize(values) for kind, values in by_kind.items()},
+        "programs": {name: summarize(values) for name, values in by_program.items()},
+    }
+
+
+def measure_throughput(env, programs, repeat, concurrency):
+    """
+    Grades the corpus repeat times with astep_many at every concurrency level.
+
+    Returns:
+        dict: Samples per second, keyed by concurrency.
+    """
+    sources = [source for name, kind, source in programs if kind != "timeout"] * repeat
+    throughput = {}
+    for level in concurrency:
+        start = time.perf_counter()
+        asyncio.run(env.astep_many(sources, concurrency=level))
+        throughput[str(level)] = len(sources) / (time.perf_counter() - start)
+    return throughput
+
+
+def measure_start(config, source):
+    """
+    Times the first and second step of a new interpreter.
+
+    Returns:
+        dict: cold_start (import, env construction and first step) and warm_step in seconds.
+    """
+    result = subprocess.run([sys.executable, "-c", COLD_START, json.dumps(config), source],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--languages", nargs="+", default=None,
+                        help="languages to measure (default: every language with an installed toolchain)")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the corpus per measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help="astep_many concurrency levels")
+    parser.add_argument("--wall-time", type=float, default=1.0, help="wall-clock limit of the timeout samples")
+    parser.add_argument("--grading", default="ladder", help="grading mode of the environment")
+    parser.add_argument("--no-start", action="store_true", help="skip the cold/warm start measurement")
+    parser.add_argument("--output", default="-", help="JSON file to write (default: stdout)")
+    args = parser.parse_args()
+
+    results = {}
+    for lang in args.languages or available_languages():
+        config = benchmark_config(lang, args.wall_time, args.grading)
+        programs = corpus[lang]
+        env = CodeCompilerEnv(config)
+        try:
+            results[lang] = {
+                "latency": measure_latency(env, programs, args.repeat),
+                "throughput": measure_throughput(env, programs, args.repeat, args.concurrency),
+            }
+        finally:
+            env.close()
+        if not args.no_start:
+            results[lang]["start"] = measure_start(config, programs[0][2])
+        print(f"{lang}: p50 {results[lang]['latency']['all']['p50'] * 1000:.1f} ms, "
+              f"p99 {results[lang]['latency']['all']['p99'] * 1000:.1f} ms", file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "toolchains": {lang: toolchains.registry.get(lang) and toolchains.registry.get(lang)._asdict()
+                       for lang in results},
+        "arguments": vars(args),
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
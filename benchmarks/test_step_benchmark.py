@@ -0,0 +1,32 @@
+"""
+pytest-benchmark version of step_benchmark.py, one benchmark per corpus program:
+
+    python -m pytest benchmarks --benchmark-json results.json
+"""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from coderl.main import CodeCompilerEnv
+from corpus import corpus
+from step_benchmark import available_languages, benchmark_config
+
+cases = [(lang, name, source) for lang in available_languages() for name, kind, source in corpus[lang]]
+
+
+@pytest.fixture(scope="module")
+def envs():
+    envs = {}
+    yield envs
+    for env in envs.values():
+        env.close()
+
+
+@pytest.mark.parametrize("lang, name, source", cases, ids=[f"{lang}-{name}" for lang, name, source in cases])
+def test_step(benchmark, envs, lang, name, source):
+    if lang not in envs:
+        envs[lang] = CodeCompilerEnv(benchmark_config(lang))
+    env = envs[lang]
+    env.step(source)
+    benchmark(env.step, source)
@@ -0,0 +1,82 @@
+"""
+Measures CodeRewardFunction against the naive per-sample env.step loop, and the time saved by
+overlapping reward computation with a simulated generation step.
+
+Usage:
+    python benchmarks/trl_reward_throughput.py --batch 64 --duplicates 4 --generation-time 2.0 --steps 3
+"""
+
+import argparse
+import os
+import time
+
+from coderl.contrib.trl import CodeRewardFunction, extract_code
+from coderl.main import CodeCompilerEnv, defaultConfig
+
+SOURCE = """
+#include <stdio.h>
+int main(){
+    printf("Hello NUMBER");
+    return 0;
+}"""
+
+
+def completions(batch, duplicates):
+    # Grouped sampling: every prompt gets `duplicates` completions, and some of them agree
+    distinct = max(1, batch // duplicates)
+    return [f"Here you go:\n```c\n{SOURCE.replace('NUMBER', str(index % distinct))}\n```" for index in range(batch)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch", type=int, default=64, help="completions per batch")
+    parser.add_argument("--duplicates", type=int, default=1, help="identical completions per distinct source")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="steps in flight")
+    parser.add_argument("--generation-time", type=float, default=2.0, help="seconds a simulated generation takes")
+    parser.add_argument("--steps", type=int, default=3, help="simulated training steps")
+    args = parser.parse_args()
+    batch = completions(args.batch, args.duplicates)
+    prompts = [""] * len(batch)
+
+    env = CodeCompilerEnv()
+    start = time.perf_counter()
+    for completion in batch:
+        env.step(extract_code(completion, "c"))
+    naive = time.perf_counter() - start
+    env.close()
+    print(f"step loop: {naive:.2f} s per batch")
+
+    for coalesce in (False, "whitespace"):
+        reward_function = CodeRewardFunction(config=dict(defaultConfig, coalesce=coalesce),
+                                             concurrency=args.concurrency)
+        try:
+            start = time.perf_counter()
+            reward_function(prompts, batch)
+            batched = time.perf_counter() - start
+            print(f"reward function (coalesce={coalesce}): {batched:.2f} s per batch ({naive / batched:.2f}x)")
+        finally:
+            reward_function.close()
+
+    reward_function = CodeRewardFunction(concurrency=args.concurrency)
+    try:
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            time.sleep(args.generation_time)
+            reward_function(prompts, batch)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        time.sleep(args.generation_time)
+        for step in range(args.steps):
+            reward_function.submit(prompts, batch)
+            if step + 1 < args.steps:
+                time.sleep(args.generation_time)  # the next batch is generated while this one is graded
+            reward_function(prompts, batch)
+        overlapped = time.perf_counter() - start
+    finally:
+        reward_function.close()
+    print(f"{args.steps} training steps: {sequential:.2f} s sequential, {overlapped:.2f} s overlapped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures grading throughput of CodeCompilerVecEnv against a plain CodeCompilerEnv.step loop.
+
+Usage:
+    python benchmarks/vec_env_throughput.py --batch 64 --workers 1 2 4 8
+"""
+
+import argparse
+import os
+import time
+
+from coderl.main import CodeCompilerEnv
+from coderl.vec_env import CodeCompilerVecEnv
+
+SOURCE = """
+#include<stdio.h>
+int main(){
+    printf("Hello World");
+    return 0;
+}"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch", type=int, default=64, help="number of sources per batch")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1],
+                        help="pool sizes to measure")
+    args = parser.parse_args()
+    sources = [SOURCE] * args.batch
+
+    env = CodeCompilerEnv()
+    start = time.perf_counter()
+    for source in sources:
+        env.step(source)
+    baseline = args.batch / (time.perf_counter() - start)
+    print(f"step loop: {baseline:.1f} samples/s")
+
+    for workers in sorted(set(args.workers)):
+        vec_env = CodeCompilerVecEnv(num_workers=workers)
+        try:
+            # Warm the pool up so worker start-up is not counted
+            vec_env.step_batch(sources[:workers])
+            start = time.perf_counter()
+            vec_env.step_batch(sources)
+            throughput = args.batch / (time.perf_counter() - start)
+        finally:
+            vec_env.close()
+        print(f"{workers} workers: {throughput:.1f} samples/s ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
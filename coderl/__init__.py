@@ -1,5 +1,12 @@
 #from main import *
 #import utils
 __version__="0.0.9"
-from .main import CodeCompilerEnv
-#import contrib
+from .utils import lazy_imports
+
+# gym and the contrib integrations are heavy, so nothing is imported until it is used
+__getattr__ = lazy_imports(__name__, {
+    "CodeCompilerEnv": ".main:CodeCompilerEnv",
+    "CodeCompilerVecEnv": ".vec_env:CodeCompilerVecEnv",
+    "contrib": ".contrib",
+    "db": ".db",
+})
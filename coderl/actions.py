@@ -0,0 +1,117 @@
+"""
+actions.py
+====================================
+Source actions as text or as raw bytes.
+
+A step's action is the source code to grade. It can be a str, or any bytes-like buffer of
+UTF-8 source: bytes, bytearray, memoryview, or a 1-D uint8 numpy array, such as a row of the
+token byte matrix of a vectorized policy. Buffers are written to the source file as they are,
+without being copied into a str first. A batch can also be given as a 2-D uint8 matrix with
+one source per row, plus the length of every source. Buffers must not change until their
+step returns.
+
+Classes:
+
+    SourceSpace: The variable-length action space of CodeCompilerEnv.
+
+Functions:
+
+    as_source(action): Validates an action and returns it as a str or a flat byte buffer.
+    as_text(action): Decodes an action, for the steps that need text.
+    batch_sources(actions, lengths): Splits a batch matrix into one source per row.
+"""
+
+import numpy as np
+from gym import spaces
+
+
+def as_source(action):
+    """
+    Validates an action and returns it as a str or a flat byte buffer, without copying it
+    unless a numpy array is not contiguous.
+
+    Args:
+        action (str or bytes-like or numpy.ndarray): The source code.
+
+    Returns:
+        str or bytes-like: The action, as a str, bytes, bytearray or memoryview of bytes.
+    """
+    if isinstance(action, (str, bytes, bytearray)):
+        return action
+    if isinstance(action, np.ndarray):
+        if action.dtype != np.uint8 or action.ndim != 1:
+            raise TypeError(f"Array actions must be 1-D uint8 arrays, got {action.ndim}-D {action.dtype}")
+        return memoryview(np.ascontiguousarray(action))
+    if isinstance(action, memoryview):
+        return action if action.format == "B" and action.ndim == 1 else action.cast("B")
+    raise TypeError(f"Unsupported action type {type(action).__name__}, expected str or a bytes-like source")
+
+
+def as_text(action):
+    """
+    Decodes an action, for the steps that need text (precompiled header preludes, normalized
+    coalescing keys, JSON requests to the grading daemon).
+
+    Args:
+        action (str or bytes-like or numpy.ndarray): The source code.
+
+    Returns:
+        str: The source code.
+    """
+    action = as_source(action)
+    return action if isinstance(action, str) else str(action, "utf-8", "replace")
+
+
+def batch_sources(actions, lengths=None):
+    """
+    Splits a batch into one action per source.
+
+    Args:
+        actions (list or numpy.ndarray): A list of actions, or a 2-D uint8 matrix with one
+            source per row.
+        lengths (sequence): The length in bytes of every row of the matrix. Defaults to the
+            whole rows.
+
+    Returns:
+        list: The actions. Rows of a matrix are views into it.
+    """
+    if lengths is None:
+        return list(actions)
+    return [actions[index][:length] for index, length in enumerate(lengths)]
+
+
+class SourceSpace(spaces.Space):
+    """
+    The variable-length action space of CodeCompilerEnv: sources of up to max_length bytes,
+    as str, bytes-like buffers or 1-D uint8 arrays. Samples are arrays of printable ASCII.
+
+    Attributes:
+        max_length (int): Maximum length of a source in bytes.
+    """
+
+    def __init__(self, max_length=65536, seed=None):
+        self.max_length = max_length
+        super(SourceSpace, self).__init__(None, np.uint8, seed)
+
+    @property
+    def is_np_flattenable(self):
+        return False
+
+    def sample(self, mask=None):
+        length = int(self.np_random.integers(0, self.max_length + 1))
+        return self.np_random.integers(32, 127, size=length, dtype=np.uint8)
+
+    def contains(self, x):
+        try:
+            source = as_source(x)
+        except TypeError:
+            return False
+        size = len(source.encode()) if isinstance(source, str) else source.nbytes if isinstance(source, memoryview) \
+            else len(source)
+        return size <= self.max_length
+
+    def __repr__(self):
+        return f"SourceSpace({self.max_length})"
+
+    def __eq__(self, other):
+        return isinstance(other, SourceSpace) and self.max_length == other.max_length
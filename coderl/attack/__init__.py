@@ -1,3 +1,7 @@
-import pwn as pwntools
-import sqlmap
-import pymetasploit3
+from ..utils import lazy_imports
+
+__getattr__ = lazy_imports(__name__, {
+    "pwntools": "pwn",
+    "sqlmap": "sqlmap",
+    "pymetasploit3": "pymetasploit3",
+})
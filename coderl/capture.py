@@ -0,0 +1,149 @@
+"""
+capture.py
+====================================
+Bounded, streaming capture of program output.
+
+Programs under grading can print without end. Their output is read in chunks as it is
+produced. Only a bounded head and tail of each stream are kept, and the text is decoded when
+it is first asked for. Expected outputs are compared chunk by chunk, so checking an answer
+never needs the whole stream in memory.
+
+Classes:
+
+    BoundedCapture: Keeps the head and tail of a byte stream.
+    OutputMatcher: Compares a byte stream with an expected output incrementally.
+"""
+
+import locale
+
+_whitespace = b" \t\r\v\f"
+
+
+class BoundedCapture:
+    """
+    Keeps the first and last bytes of a stream, up to a total of limit bytes.
+
+    Attributes:
+        limit (int): Maximum number of bytes kept, or None to keep everything.
+        total (int): Number of bytes fed so far.
+        truncated (bool): Whether bytes were dropped from the middle of the stream.
+
+    Methods:
+        feed(chunk): Adds the next chunk of the stream.
+        text(): Decodes what was kept, marking where bytes were dropped.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    @property
+    def truncated(self):
+        return self.limit is not None and self.total > self.limit
+
+    def feed(self, chunk):
+        """
+        Adds the next chunk of the stream.
+
+        Args:
+            chunk (bytes): The chunk.
+        """
+        self.total += len(chunk)
+        if self.limit is None:
+            self._head += chunk
+            return
+        room = self.limit - self.limit // 2 - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk
+            del self._tail[:-(self.limit // 2) or len(self._tail)]
+
+    def text(self):
+        """
+        Decodes what was kept like subprocess.run(..., text=True) would, with a marker where
+        bytes were dropped.
+
+        Returns:
+            str: The captured text.
+        """
+        text = bytes(self._head)
+        if self.truncated:
+            dropped = self.total - len(self._head) - len(self._tail)
+            text += f"\n[... {dropped} bytes truncated ...]\n".encode() + bytes(self._tail)
+        else:
+            text += bytes(self._tail)
+        text = text.decode(locale.getpreferredencoding(False), errors="replace")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class OutputMatcher:
+    """
+    Compares a byte stream with an expected output as the stream arrives, with the rules of
+    coderl.harness.outputs_match: trailing whitespace on every line and trailing blank lines
+    are ignored. Only the expected output is held in memory.
+
+    Attributes:
+        matched (bool): Whether the stream matches. Final once finish has been called.
+
+    Methods:
+        feed(chunk): Compares the next chunk of the stream.
+        finish(): Ends the stream.
+    """
+
+    def __init__(self, expected):
+        if isinstance(expected, str):
+            expected = expected.encode(locale.getpreferredencoding(False))
+        self._lines = [line.rstrip() for line in expected.replace(b"\r\n", b"\n").rstrip().split(b"\n")]
+        if self._lines == [b""]:
+            self._lines = []
+        self._line = 0
+        self._column = 0
+        self.matched = True
+
+    def _segment(self, segment):
+        # Part of the current line: it must continue the expected line, then be whitespace only
+        expected = self._lines[self._line] if self._line < len(self._lines) else b""
+        start = min(self._column, len(expected))
+        length = min(len(segment), len(expected) - start)
+        if segment[:length] != expected[start:start + length] or segment[length:].strip(_whitespace):
+            self.matched = False
+        self._column += len(segment)
+
+    def _end_line(self):
+        expected = self._lines[self._line] if self._line < len(self._lines) else b""
+        if self._column < len(expected):
+            self.matched = False
+        self._line += 1
+        self._column = 0
+
+    def feed(self, chunk):
+        """
+        Compares the next chunk of the stream.
+
+        Args:
+            chunk (bytes): The chunk.
+        """
+        if not self.matched:
+            return
+        segments = chunk.split(b"\n")
+        for segment in segments[:-1]:
+            self._segment(segment)
+            self._end_line()
+        self._segment(segments[-1])
+
+    def finish(self):
+        """
+        Ends the stream.
+
+        Returns:
+            bool: Whether the whole stream matched.
+        """
+        if self.matched and self._column:
+            self._end_line()
+        if self._line < len(self._lines):
+            self.matched = False
+        return self.matched
@@ -0,0 +1,85 @@
+"""
+cli.py
+====================================
+The coderl command line.
+
+    coderl eval dataset.jsonl results.jsonl --workers 8
+
+Functions:
+
+    main(argv): Parses the command line and runs the subcommand.
+"""
+
+import argparse
+import json
+import logging
+import signal
+import sys
+
+
+def _interrupt(signum, frame):
+    # SIGTERM stops an evaluation like Ctrl-C, after a final checkpoint
+    raise KeyboardInterrupt
+
+
+def _eval(args):
+    from .db import CompileCache
+    from .evaluation import Evaluation, format_summary
+
+    configs = None
+    if args.config is not None:
+        with open(args.config) as file:
+            configs = json.load(file)
+        # A single configuration, or one per language
+        if "lang" in configs:
+            configs = {configs["lang"]: configs}
+    evaluation = Evaluation(args.input, args.output, configs, args.lang, args.workers, args.chunksize,
+                            args.checkpoint_every, args.mp_context, CompileCache() if args.cache else None,
+                            args.restart)
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        summary = evaluation.run()
+    except KeyboardInterrupt:
+        print(f"Interrupted after {evaluation.summary['records']} records, run again to resume", file=sys.stderr)
+        return 130
+    print(format_summary(summary))
+    return 0
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the subcommand.
+
+    Args:
+        argv (list): The arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status.
+    """
+    from .main import default_configs
+
+    parser = argparse.ArgumentParser(prog="coderl", description="coderl command line tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    evaluate = subparsers.add_parser("eval", help="grade a JSONL dataset of {id, lang, code, tests} records",
+                                     description="Grade a JSONL dataset of {id, lang, code, tests} records. "
+                                                 "A killed run resumes from its last checkpoint.")
+    evaluate.add_argument("input", help="JSONL dataset")
+    evaluate.add_argument("output", help="JSONL results, or a Parquet directory when it ends in .parquet")
+    evaluate.add_argument("--lang", default="c", choices=sorted(default_configs),
+                          help="language of records without one")
+    evaluate.add_argument("--config", default=None,
+                          help="JSON file with a configuration, or a configuration per language")
+    evaluate.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    evaluate.add_argument("--chunksize", type=int, default=16, help="records sent to a worker per task")
+    evaluate.add_argument("--checkpoint-every", type=int, default=1000, help="records between checkpoints")
+    evaluate.add_argument("--mp-context", default=None, help="multiprocessing start method of the pool")
+    evaluate.add_argument("--cache", action="store_true", help="use the on-disk result cache")
+    evaluate.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    evaluate.set_defaults(run=_eval)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""
+coalesce.py
+====================================
+Single-flight coalescing of identical grading requests.
+
+Grouped sampling draws several completions per prompt, and many of them are identical, so the
+same source often arrives several times in one batch, or while it is already being graded.
+With config["coalesce"] set, requests are keyed by their normalized source, configuration and
+test cases. A batch grades each distinct key once, and a request whose key is already being
+graded waits for that result instead of starting its own compiler. Coalesced requests get the
+info of the evaluation they joined, so line numbers in diagnostics may belong to another
+spelling of the same program.
+
+Normalization modes:
+
+    "exact": Only identical sources are coalesced.
+    "whitespace": Comments are removed and runs of whitespace collapsed, outside literals.
+    "tokens": Sources are compared token by token. C and C++ sources are run through the
+        preprocessor first, so sources that only differ in macros and comments are coalesced;
+        the raw source is tokenized when preprocessing fails.
+
+Classes:
+
+    SingleFlight: Runs one evaluation per key at a time and shares its result with
+        concurrent callers.
+
+Functions:
+
+    normalize(source, mode, lang, command): Normalizes a source for keying.
+    request_key(source, config, tests, mode, command): The coalescing key of a request.
+    dedupe(keys): Groups the positions of a batch by key.
+    batch_stats(size, unique, shared): The dedup statistics of a batch.
+    copy_result(result): Copies a step result for another request.
+
+Global Variables:
+    normalizations: The normalization modes.
+    flight: The SingleFlight shared by every environment of the process.
+"""
+
+import asyncio
+import re
+import subprocess
+import threading
+from concurrent.futures import Future
+
+from .actions import as_text
+from .db.cache import CompileCache
+
+normalizations = ("exact", "whitespace", "tokens")
+
+_preprocessed_languages = {"c": "c", "cpp": "c++"}
+
+# Literals are kept verbatim; comments become a space, as in the C preprocessor
+_literal = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`'
+_comment = r"//[^\n]*|/\*.*?\*/"
+_whitespace_pattern = re.compile(rf"({_literal})|{_comment}|([ \t\f\v\r]+)", re.S)
+_token_pattern = re.compile(
+    rf"({_literal})|{_comment}|(\n)|\s+"
+    r"|(\.?\d(?:[eEpP][+-]|[\w.])*"  # preprocessing numbers, like 1.5e-3
+    r"|\w+"
+    r"|>>=|<<=|\.\.\.|->\*|<=>|::|->|\+\+|--|<<|>>|&&|\|\||##|[-+*/%&|^!=<>]="
+    r"|\S)", re.S)
+
+
+def _collapse(source):
+    def replace(match):
+        return match.group(1) if match.group(1) is not None else " "
+
+    # The second pass merges the spaces left around a comment
+    source = _whitespace_pattern.sub(replace, _whitespace_pattern.sub(replace, source))
+    lines = (line.strip() for line in source.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def _tokenize(source, keep_lines=True):
+    lines = [[]]
+    for match in _token_pattern.finditer(source):
+        literal, newline, token = match.groups()
+        if newline is not None:
+            lines.append([])
+        elif literal is not None or token is not None:
+            lines[-1].append(literal if literal is not None else token)
+    lines = [" ".join(line) for line in lines if line]
+    if not keep_lines:
+        # Preprocessed C: only the remaining directives (#pragma) still end at a line break
+        merged = []
+        for line in lines:
+            if merged and not line.startswith("#") and not merged[-1].startswith("#"):
+                merged[-1] += " " + line
+            else:
+                merged.append(line)
+        lines = merged
+    # Otherwise line breaks are kept: they end preprocessor directives, and Go inserts semicolons at them
+    return "\n".join(lines)
+
+
+def _preprocess(source, lang, command):
+    try:
+        result = subprocess.run([command, "-E", "-P", "-x", _preprocessed_languages[lang], "-"],
+                                input=source, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def normalize(source, mode="exact", lang=None, command=None):
+    """
+    Normalizes a source for keying.
+
+    Args:
+        source (str or bytes-like): The source code.
+        mode (str): "exact", "whitespace" or "tokens". Defaults to "exact".
+        lang (str): The configuration language, for the preprocessor in "tokens" mode.
+        command (str): The compiler, for the preprocessor in "tokens" mode. Without it, the
+            raw source is tokenized.
+
+    Returns:
+        str or bytes-like: The normalized source; "exact" returns the source unchanged.
+    """
+    if mode in ("whitespace", "tokens"):
+        source = as_text(source)
+    if mode == "whitespace":
+        return _collapse(source)
+    if mode == "tokens":
+        preprocessed = None
+        if command is not None and lang in _preprocessed_languages:
+            preprocessed = _preprocess(source, lang, command)
+        if preprocessed is not None:
+            return _tokenize(preprocessed, keep_lines=False)
+        return _tokenize(source)
+    return source
+
+
+def request_key(source, config, tests=None, mode="exact", command=None):
+    """
+    Computes the coalescing key of a request.
+
+    Args:
+        source (str): The source code.
+        config (dict): The language configuration.
+        tests (list): The test cases of the request, if any.
+        mode (str): The normalization mode. Defaults to "exact".
+        command (str): The compiler, for the preprocessor in "tokens" mode.
+
+    Returns:
+        str: A hex SHA-256 digest, or None when the test cases cannot be keyed (see
+            coderl.db.CompileCache.key).
+    """
+    normalized = normalize(source, mode, config.get("lang"), command)
+    return CompileCache.key(normalized, config, mode, tests)
+
+
+def dedupe(keys):
+    """
+    Groups the positions of a batch by key. Positions whose key is None are never grouped.
+
+    Args:
+        keys (list): The key of every request of the batch.
+
+    Returns:
+        tuple: (first, index): first lists the position of the first request with each key,
+        and index maps every position to the entry of first whose result it shares.
+    """
+    first = []
+    index = []
+    seen = {}
+    for position, key in enumerate(keys):
+        if key is None or key not in seen:
+            if key is not None:
+                seen[key] = len(first)
+            index.append(len(first))
+            first.append(position)
+        else:
+            index.append(seen[key])
+    return first, index
+
+
+def batch_stats(size, unique, shared=None):
+    """
+    Builds the dedup statistics of a batch.
+
+    Args:
+        size (int): Number of requests in the batch.
+        unique (int): Number of distinct keys in the batch.
+        shared (int): Number of distinct keys answered by an evaluation already in flight, or
+            None when the batch does not go through flight.
+
+    Returns:
+        dict: requests, unique, duplicates (requests answered by another request of the
+        batch), in_flight (keys that joined an evaluation already in flight, left out when
+        shared is None) and evaluated.
+    """
+    if shared is None:
+        return {"requests": size, "unique": unique, "duplicates": size - unique, "evaluated": unique}
+    return {"requests": size, "unique": unique, "duplicates": size - unique, "in_flight": shared,
+            "evaluated": unique - shared}
+
+
+def copy_result(result):
+    """
+    Copies a step result for another request, which gets an info dict of its own.
+
+    Args:
+        result (tuple): An (observation, reward, done, info) tuple.
+
+    Returns:
+        tuple: The copy.
+    """
+    observation, reward, done, info = result
+    return observation, reward, done, dict(info)
+
+
+class _Abandoned(Exception):
+    # The evaluation in flight was cancelled or interrupted, not failed
+    pass
+
+
+class SingleFlight:
+    """
+    Runs one evaluation per key at a time. Callers that arrive while their key is in flight
+    wait for its result, from any thread or event loop of the process. An exception of the
+    evaluation is raised in every waiting caller; when the caller evaluating is cancelled or
+    interrupted instead, the waiting callers start over and one of them evaluates.
+
+    Attributes:
+        calls (int): Number of calls.
+        shared (int): Number of calls answered by another call's evaluation.
+
+    Methods:
+        do(key, function): Calls function, or waits for the call already in flight for key.
+        ado(key, function): Asynchronous version of do.
+        stats(): Returns the counters.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key, retry=False):
+        with self._lock:
+            if retry:
+                # Counted as shared when it first joined
+                self.shared -= 1
+            else:
+                self.calls += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            del self._inflight[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _lead(self, key, future, outcome):
+        # Shares the outcome of the leader's evaluation, a result or an Exception. Anything
+        # else (cancellation, KeyboardInterrupt) concerns the leader alone.
+        result, error = outcome
+        if error is None:
+            self._finish(key, future, result)
+        elif isinstance(error, Exception):
+            self._finish(key, future, error=error)
+        else:
+            self._finish(key, future, error=_Abandoned())
+
+    def do(self, key, function):
+        """
+        Calls function, unless a call for key is already in flight, in which case its result
+        is awaited instead.
+
+        Args:
+            key (str): The request key.
+            function (callable): Evaluates the request.
+
+        Returns:
+            tuple: (result, shared), where shared tells whether the result came from another call.
+        """
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                return copy_result(future.result()), True
+            except _Abandoned:
+                future, leader = self._join(key, retry=True)
+        try:
+            result = function()
+        except BaseException as error:
+            self._lead(key, future, (None, error))
+            raise
+        self._lead(key, future, (result, None))
+        return result, False
+
+    async def ado(self, key, function):
+        """
+        Asynchronous version of do: function returns an awaitable.
+        """
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                # Shielded: a waiting caller that is cancelled must not cancel the shared future
+                return copy_result(await asyncio.shield(asyncio.wrap_future(future))), True
+            except _Abandoned:
+                future, leader = self._join(key, retry=True)
+        try:
+            result = await function()
+        except BaseException as error:
+            self._lead(key, future, (None, error))
+            raise
+        self._lead(key, future, (result, None))
+        return result, False
+
+    def stats(self):
+        """
+        Returns the counters.
+
+        Returns:
+            dict: calls and shared.
+        """
+        return {"calls": self.calls, "shared": self.shared}
+
+
+flight = SingleFlight()
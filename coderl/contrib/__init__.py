@@ -1,5 +1,10 @@
-from .intercode import *
-from .pwntools import *
-from .trl import *
-import transformers
-import llama_index
+from ..utils import lazy_imports
+
+# Each integration, and the third-party package behind it, is imported on first access
+__getattr__ = lazy_imports(__name__, {
+    "intercode": ".intercode",
+    "pwntools": ".pwntools",
+    "trl": ".trl",
+    "transformers": "transformers",
+    "llama_index": "llama_index",
+})
@@ -1,2 +1,3 @@
-import intercode
+from ...utils import lazy_imports
 
+__getattr__ = lazy_imports(__name__, {"intercode": "intercode"})
@@ -1 +1,3 @@
-import pwn as pwntools
+from ...utils import lazy_imports
+
+__getattr__ = lazy_imports(__name__, {"pwntools": "pwn"})
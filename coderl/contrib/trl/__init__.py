@@ -1 +1,7 @@
-import trl
+from ...utils import lazy_imports
+
+__getattr__ = lazy_imports(__name__, {
+    "trl": "trl",
+    "CodeRewardFunction": ".rewards:CodeRewardFunction",
+    "extract_code": ".rewards:extract_code",
+})
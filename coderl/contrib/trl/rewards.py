@@ -0,0 +1,213 @@
+"""
+rewards.py
+====================================
+A batched reward function for TRL trainers.
+
+TRL's GRPO-style trainers call every reward function with the prompts and completions of a
+batch, plus the batch's dataset columns as keyword arguments, and expect one reward per
+completion. CodeRewardFunction extracts the code block of every completion and grades the
+whole batch at once: concurrently on the event loop with a CodeCompilerEnv, or in one
+request with a CodeCompilerVecEnv or a DaemonCompilerEnv. Neither trl nor torch is imported
+unless tensors are asked for.
+
+Classes:
+
+    CodeRewardFunction: Grades batches of completions into rewards.
+
+Functions:
+
+    extract_code(completion, lang): Extracts the code block of a completion.
+"""
+
+import asyncio
+import re
+import threading
+
+from ...main import CodeCompilerEnv, defaultConfig
+
+_fence = re.compile(r"^[ \t]*(```+|~~~+)[ \t]*([\w+#.-]*)[^\n]*\n(.*?)^[ \t]*\1[ \t]*$", re.M | re.S)
+
+_aliases = {
+    "c": {"c", "h"},
+    "cpp": {"cpp", "c++", "cc", "cxx", "hpp"},
+    "java": {"java"},
+    "go": {"go", "golang"},
+    "php": {"php"},
+    "cs": {"cs", "csharp", "c#"},
+    "cuda": {"cuda", "cu"},
+    "systemverilog": {"systemverilog", "sv", "verilog"},
+}
+
+
+def _text(completion):
+    # Conversational completions are lists of messages; the reply is the last one's content
+    if isinstance(completion, (list, tuple)):
+        return completion[-1]["content"] if completion else ""
+    if isinstance(completion, dict):
+        return completion["content"]
+    return completion
+
+
+def extract_code(completion, lang=None):
+    """
+    Extracts the code block of a completion: the last fenced block tagged with the language
+    (or untagged), else the last fenced block, else the whole completion.
+
+    Args:
+        completion (str or list): The completion, as text or as a list of chat messages.
+        lang (str): The configuration language, matched against the blocks' tags. Defaults to None.
+
+    Returns:
+        str: The source code.
+    """
+    text = _text(completion)
+    blocks = [(tag.lower(), code) for _, tag, code in _fence.findall(text)]
+    if not blocks:
+        return text
+    names = _aliases.get(lang, {lang})
+    tagged = [code for tag, code in blocks if not tag or tag in names]
+    return tagged[-1] if tagged else blocks[-1][1]
+
+
+class CodeRewardFunction:
+    """
+    A TRL reward function that grades batches of completions.
+
+    Called as reward_function(prompts, completions, **columns), it returns one reward per
+    completion, in order. A "tests" column holds the test cases of every sample. The batch is
+    graded concurrently, on an event loop in a background thread. submit grades a batch
+    without waiting, so grading can overlap with the next generation in loops that allow it;
+    a later call with the same completions and tests picks up the submitted result. At most
+    max_pending submitted batches wait to be picked up; older ones are cancelled.
+
+    Attributes:
+        env: The grader: a CodeCompilerEnv, or anything with step_batch (CodeCompilerVecEnv,
+            coderl.daemon.DaemonCompilerEnv).
+        concurrency (int): Steps in flight at a time with a CodeCompilerEnv.
+        return_tensors (str): "pt" to return a torch tensor, or None for a list of floats.
+        transform (callable): Maps every (reward, info) to the reward returned, or None.
+        __name__ (str): Name TRL logs the rewards under.
+        max_pending (int): Submitted batches kept until a call picks them up.
+
+    Methods:
+        submit(prompts, completions, **columns): Starts grading a batch and returns a future.
+        close(): Stops the background event loop.
+    """
+
+    max_pending = 4
+
+    def __init__(self, env=None, config=defaultConfig, concurrency=None, return_tensors=None, transform=None,
+                 name="coderl_reward"):
+        """
+        Initializes the reward function.
+
+        Args:
+            env: The grader. Defaults to a new CodeCompilerEnv(config).
+            config (dict): Configuration of the default grader. Defaults to defaultConfig.
+            concurrency (int): Steps in flight at a time with a CodeCompilerEnv. Defaults to
+                the number of CPUs.
+            return_tensors (str): "pt" to return a torch tensor. Defaults to a list of floats.
+            transform (callable): Maps every (reward, info) to the reward returned. Defaults to
+                the environment's reward.
+            name (str): Name TRL logs the rewards under. Defaults to "coderl_reward".
+        """
+        self.env = CodeCompilerEnv(config) if env is None else env
+        self.concurrency = concurrency
+        self.return_tensors = return_tensors
+        self.transform = transform
+        self.__name__ = name
+        self._lang = getattr(self.env, "config", config).get("lang")
+        self._loop = None
+        self._thread = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self._loop
+
+    async def _grade(self, sources, tests):
+        if hasattr(self.env, "astep_many"):
+            return await self.env.astep_many(sources, self.concurrency, tests)
+        results = await asyncio.to_thread(self.env.step_batch, sources, tests)
+        if isinstance(results, tuple):
+            # CodeCompilerVecEnv returns (observations, rewards, dones, infos)
+            _, rewards, _, infos = results
+            return [(None, float(reward), True, info) for reward, info in zip(rewards, infos)]
+        return results
+
+    @staticmethod
+    def _key(completions, tests):
+        return tuple(map(repr, completions)), repr(tests)
+
+    def submit(self, prompts, completions, **columns):
+        """
+        Starts grading a batch and returns without waiting.
+
+        Args:
+            prompts (list): The prompts. Unused, accepted for TRL's signature.
+            completions (list): The completions, as text or as lists of chat messages.
+            **columns: Dataset columns of the batch; "tests" holds every sample's test cases.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the list of step results.
+        """
+        sources = [extract_code(completion, self._lang) for completion in completions]
+        tests = columns.get("tests")
+        future = asyncio.run_coroutine_threadsafe(self._grade(sources, tests), self._event_loop())
+        with self._lock:
+            self._pending[self._key(completions, tests)] = future
+            # Batches nobody called for are abandoned; a live batch coalesced onto
+            # one of them is re-run by the single-flight group, not cancelled
+            while len(self._pending) > self.max_pending:
+                self._pending.pop(next(iter(self._pending))).cancel()
+        return future
+
+    def __call__(self, prompts, completions, **columns):
+        """
+        Grades a batch, or waits for the grading started by submit with the same completions
+        and tests.
+
+        Returns:
+            list or torch.Tensor: One reward per completion, in order.
+        """
+        key = self._key(completions, columns.get("tests"))
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is None:
+            future = self.submit(prompts, completions, **columns)
+            with self._lock:
+                self._pending.pop(key, None)
+        results = future.result()
+        if self.transform is not None:
+            rewards = [float(self.transform(result[1], result[3])) for result in results]
+        else:
+            rewards = [float(result[1]) for result in results]
+        if self.return_tensors == "pt":
+            import torch
+            return torch.tensor(rewards, dtype=torch.float32)
+        return rewards
+
+    @staticmethod
+    async def _cancel():
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """
+        Stops the background event loop. Batches still being graded are cancelled.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+            self._pending.clear()
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cancel(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            loop.close()
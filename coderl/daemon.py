@@ -0,0 +1,496 @@
+"""
+daemon.py
+====================================
+A standalone grading daemon, and a client environment that steps through it.
+
+The daemon keeps a warm pool of worker processes, each owning one CodeCompilerEnv, and
+serves batched step requests over a Unix domain socket. Trainers and evaluators connect as
+clients instead of forking workers of their own, so several of them can share one pool, and
+the pool is started once instead of once per run.
+
+Every message is a frame: a 4-byte big-endian payload length followed by the payload, a
+compact UTF-8 JSON object. A request holds an id, an op ("step", "stats" or "ping") and, for
+"step", the sources and optional test cases of a batch. The response holds the same id and
+either results, one [observation, reward, done, info] list per source in input order, or
+error. A request that is not a JSON object is answered with an error and a null id. A connection may send several requests before reading the responses; they are graded
+concurrently and answered as they finish. Test cases cross the socket as JSON, so checkers
+are not supported. When the daemon's configuration sets "coalesce", identical requests of a
+batch, and of batches from other connections, are graded once, and the response also holds
+the batch's dedup stats.
+
+Classes:
+
+    GradingDaemon: Serves step requests from a worker pool over a Unix domain socket.
+    DaemonClient: A connection to a GradingDaemon.
+    DaemonCompilerEnv: A gym environment with the step interface of CodeCompilerEnv that
+        grades through a GradingDaemon.
+
+Functions:
+
+    default_socket_path(): The socket path used when none is given.
+    send_frame(sock, message): Writes one message to a socket.
+    recv_frame(sock): Reads one message from a socket.
+    main(): The command line entry point, python -m coderl.daemon.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import gym
+from gym import spaces
+
+from . import coalesce, vec_env
+from .actions import SourceSpace, as_text, batch_sources
+from .main import CodeCompilerEnv, default_configs, defaultConfig
+from .utils import cache_dir
+
+logger = logging.getLogger(__name__)
+
+_header = struct.Struct(">I")
+
+
+def default_socket_path():
+    """
+    Returns the socket path used when none is given: $CODERL_SOCKET, or daemon.sock in the
+    coderl cache directory.
+    """
+    return os.environ.get("CODERL_SOCKET") or os.path.join(cache_dir(), "daemon.sock")
+
+
+def _encode(message):
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    return _header.pack(len(payload)) + payload
+
+
+def send_frame(sock, message):
+    """
+    Writes one message to a socket.
+
+    Args:
+        sock (socket.socket): A connected socket.
+        message (dict): The message, serializable to JSON.
+    """
+    sock.sendall(_encode(message))
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("The grading daemon closed the connection")
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    """
+    Reads one message from a socket.
+
+    Args:
+        sock (socket.socket): A connected socket.
+
+    Returns:
+        dict: The message.
+    """
+    size, = _header.unpack(_recv_exactly(sock, _header.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _warm_worker():
+    # Runs the environment's one-time setup (e.g. warming the Go build cache) before any request
+    vec_env._worker_env._prepare()
+    return os.getpid()
+
+
+class GradingDaemon:
+    """
+    Serves step requests from a warm pool of worker processes over a Unix domain socket.
+
+    Attributes:
+        path (str): The socket path.
+        config (dict): Configuration dictionary of every worker's environment.
+        num_workers (int): Number of worker processes in the pool.
+        steps (int): Number of sources graded so far.
+        requests (int): Number of requests answered so far.
+
+    Methods:
+        serve(): Serves requests on the running event loop until stop is called.
+        start(): Serves requests from a background thread.
+        stop(): Stops serving and shuts the pool down.
+    """
+
+    def __init__(self, path=None, config=defaultConfig, num_workers=None, mp_context=None, cache=None,
+                 metrics=None):
+        """
+        Initializes the daemon. The pool is started and the socket bound by serve.
+
+        Args:
+            path (str): The socket path. Defaults to default_socket_path().
+            config (dict): Configuration of the workers' environments. Defaults to defaultConfig.
+            num_workers (int): Number of worker processes. Defaults to the number of CPUs.
+            mp_context (str): Multiprocessing start method of the pool. Defaults to the platform default.
+            cache (coderl.db.CompileCache): Optional result cache shared by the workers.
+            metrics (coderl.metrics.Metrics): Optional metrics, copied into every worker.
+        """
+        self.path = path or default_socket_path()
+        self.config = config
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.steps = 0
+        self.requests = 0
+        self._context = multiprocessing.get_context(mp_context) if mp_context else None
+        self._cache = cache
+        self._metrics = metrics
+        self._pool = None
+        self._loop = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._writers = set()
+        # Computes the coalescing keys of requests; never steps
+        self._env = CodeCompilerEnv(config)
+
+    async def serve(self):
+        """
+        Starts the worker pool, binds the socket and serves requests until stop is called.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=self._context,
+                                         initializer=vec_env._init_worker,
+                                         initargs=(self.config, self._cache, self._metrics))
+        try:
+            # One task per worker at once, so that every worker is started and warm
+            await asyncio.gather(*(self._loop.run_in_executor(self._pool, _warm_worker)
+                                   for _ in range(self.num_workers)))
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            server = await asyncio.start_unix_server(self._handle, path=self.path)
+            os.chmod(self.path, 0o600)
+            logger.info("Grading daemon listening on %s with %d workers", self.path, self.num_workers)
+            self._ready.set()
+            async with server:
+                await self._stopped.wait()
+                for writer in list(self._writers):
+                    writer.close()
+        finally:
+            self._ready.set()
+            self._pool.shutdown()
+            self._env.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def start(self):
+        """
+        Serves requests from a background thread, and returns once the socket accepts connections.
+
+        Returns:
+            GradingDaemon: The daemon.
+        """
+        self._thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and shuts the worker pool down.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    size, = _header.unpack(await reader.readexactly(_header.size))
+                    payload = await reader.readexactly(size)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    request = json.loads(payload)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as error:
+                    # The frame was read whole, so the connection can go on
+                    await self._send({"id": None, "error": f"Malformed request: {error}"}, writer, lock)
+                    continue
+                task = asyncio.create_task(self._respond(request, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, request, writer, lock):
+        response = {"id": request.get("id")}
+        try:
+            response["results"], stats = await self._request(request)
+            if stats is not None:
+                response["stats"] = stats
+        except Exception as error:
+            logger.exception("Grading daemon request failed")
+            response["error"] = f"{type(error).__name__}: {error}"
+        self.requests += 1
+        await self._send(response, writer, lock)
+
+    @staticmethod
+    async def _send(response, writer, lock):
+        async with lock:
+            try:
+                writer.write(_encode(response))
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def _request(self, request):
+        op = request.get("op", "step")
+        if op == "ping":
+            return None, None
+        if op == "stats":
+            return {"workers": self.num_workers, "steps": self.steps, "requests": self.requests,
+                    "coalesced": coalesce.flight.stats()}, None
+        if op != "step":
+            raise ValueError(f"Unknown op '{op}'")
+        sources = request["sources"]
+        tests = request.get("tests") or [None] * len(sources)
+        keys = await asyncio.to_thread(lambda: [self._env.coalesce_key(source, cases)
+                                                for source, cases in zip(sources, tests)])
+        first, index = coalesce.dedupe(keys)
+
+        async def grade(position):
+            def evaluate():
+                return self._loop.run_in_executor(self._pool, vec_env._step_worker, sources[position], tests[position])
+
+            if keys[position] is None:
+                return await evaluate(), False
+            # Requests from other connections with the same key share one evaluation
+            return await coalesce.flight.ado(keys[position], evaluate)
+
+        unique = await asyncio.gather(*(grade(position) for position in first))
+        self.steps += len(sources)
+        stats = None
+        if self._env.coalesce:
+            stats = coalesce.batch_stats(len(sources), len(first), sum(shared for _, shared in unique))
+        return [unique[entry][0] for entry in index], stats
+
+
+class DaemonClient:
+    """
+    A connection to a GradingDaemon. Requests are serialized, so one client waits for one
+    request at a time; open several clients to keep more batches in flight. A request that
+    times out or fails mid-frame closes the connection, and the next request opens a new one,
+    so a late response is never taken for the answer to another request.
+
+    Attributes:
+        timeout (float): Seconds to wait for any one response, or None for no limit.
+        batch_stats (dict): Dedup statistics of the last step request when the daemon's
+            configuration sets "coalesce", see coderl.coalesce.batch_stats.
+
+    Methods:
+        call(op, **fields): Sends one request and waits for its response.
+        step_batch(sources, tests): Grades a batch of sources.
+        close(): Closes the connection.
+    """
+
+    def __init__(self, path=None, timeout=None):
+        """
+        Connects to a daemon.
+
+        Args:
+            path (str): The daemon's socket path. Defaults to default_socket_path().
+            timeout (float): Seconds to wait for any one response. Defaults to no limit.
+        """
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+        self._socket = None
+        self._connect()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.batch_stats = None
+
+    def _connect(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(self.timeout)
+        try:
+            self._socket.connect(self.path)
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            raise
+
+    def call(self, op, **fields):
+        """
+        Sends one request and waits for its response.
+
+        Args:
+            op (str): "step", "stats" or "ping".
+            **fields: The remaining request fields.
+
+        Returns:
+            The results of the response.
+        """
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            request_id = next(self._ids)
+            try:
+                send_frame(self._socket, dict(fields, id=request_id, op=op))
+                response = recv_frame(self._socket)
+                # Ids are never reused, so anything else answers an abandoned request
+                while response.get("id") not in (request_id, None):
+                    response = recv_frame(self._socket)
+            except (OSError, EOFError):
+                # The rest of the response may still arrive: start over on a new connection
+                self._socket.close()
+                self._socket = None
+                raise
+            if op == "step":
+                self.batch_stats = response.get("stats")
+        if "error" in response:
+            raise RuntimeError(f"The grading daemon failed the request: {response['error']}")
+        return response["results"]
+
+    def step_batch(self, sources, tests=None, lengths=None):
+        """
+        Grades a batch of sources.
+
+        Args:
+            sources (list or numpy.ndarray): The source codes to be compiled and executed, as
+                for CodeCompilerEnv.step, or a 2-D uint8 matrix with one source per row. They
+                are sent as JSON text.
+            tests (list): Optional test cases of every source, in the same order as sources,
+                as (input, output) pairs or dicts.
+            lengths (sequence): The length in bytes of every row of a sources matrix.
+
+        Returns:
+            list: One (observation, reward, done, info) tuple per source, in input order.
+        """
+        sources = [as_text(source) for source in batch_sources(sources, lengths)]
+        results = self.call("step", sources=sources, tests=None if tests is None else list(tests))
+        return [tuple(result) for result in results]
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+
+class DaemonCompilerEnv(gym.Env):
+    """
+    A gym environment with the step interface of CodeCompilerEnv whose steps are graded by a
+    GradingDaemon. The language and grading configuration are the daemon's.
+
+    Methods:
+        step(action, tests): Grades one source.
+        step_batch(sources, tests): Grades a batch of sources in one request.
+        reset(): Resets the environment to an initial state.
+        close(): Closes the connection.
+    """
+
+    def __init__(self, path=None, timeout=None):
+        """
+        Connects to a daemon.
+
+        Args:
+            path (str): The daemon's socket path. Defaults to default_socket_path().
+            timeout (float): Seconds to wait for any one response. Defaults to no limit.
+        """
+        super(DaemonCompilerEnv, self).__init__()
+        self.client = DaemonClient(path, timeout)
+        self.action_space = SourceSpace()
+        self.observation_space = spaces.Discrete(2)  # Success or failure
+
+    def step(self, action, tests=None):
+        """
+        Grades one source, as CodeCompilerEnv.step does.
+
+        Args:
+            action (str): The source code to be compiled and executed.
+            tests (list): Optional test cases, as (input, output) pairs or dicts.
+
+        Returns:
+            tuple: A tuple containing the observation, reward, done status, and additional info.
+        """
+        return self.client.step_batch([action], None if tests is None else [tests])[0]
+
+    @property
+    def batch_stats(self):
+        return self.client.batch_stats
+
+    def step_batch(self, sources, tests=None, lengths=None):
+        """
+        Grades a batch of sources in one request. When the daemon coalesces, batch_stats holds
+        the dedup statistics of the batch.
+
+        Returns:
+            list: One (observation, reward, done, info) tuple per source, in input order.
+        """
+        return self.client.step_batch(sources, tests, lengths)
+
+    def reset(self):
+        """
+        Resets the environment to an initial state.
+
+        Returns:
+            numpy.ndarray: A sample observation from the observation space.
+        """
+        return self.observation_space.sample()
+
+    def close(self):
+        """
+        Closes the connection. The daemon keeps running.
+        """
+        self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve coderl step requests over a Unix domain socket.")
+    parser.add_argument("--socket", default=None, help="socket path (default: $CODERL_SOCKET or the cache directory)")
+    parser.add_argument("--lang", default="c", choices=sorted(default_configs),
+                        help="language of the default configuration to grade with")
+    parser.add_argument("--config", default=None, help="JSON file with a configuration, overriding --lang")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--mp-context", default=None, help="multiprocessing start method of the pool")
+    args = parser.parse_args()
+
+    config = default_configs[args.lang]
+    if args.config is not None:
+        with open(args.config) as file:
+            config = json.load(file)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    daemon = GradingDaemon(args.socket, config, args.workers, args.mp_context)
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, daemon.stop)
+        await daemon.serve()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
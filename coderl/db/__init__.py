@@ -1 +1,6 @@
-import faiss
+from .cache import CompileCache
+from .trajectories import TrajectoryStore
+from ..utils import lazy_imports
+
+# faiss is only needed by the vector store, so it is imported on first use
+__getattr__ = lazy_imports(__name__, {"faiss": "faiss"})
@@ -0,0 +1,244 @@
+"""
+cache.py
+====================================
+A content-addressed cache of CodeCompilerEnv.step results.
+
+Results are keyed by a hash of the source text, the language configuration and the
+detected compiler, so the same completion is only compiled and run once. Test case checkers
+are identified by their qualified name; steps whose checkers have none that is stable
+(lambdas, closures, bound methods) are not cached. Results are stored without the timings of
+the run that produced them, which a hit did not spend. The cache has
+two tiers: an in-memory LRU dictionary private to each process, and a persistent SQLite
+file shared by every process on the host and trimmed to a maximum size.
+
+Classes:
+
+    CompileCache: Two-tier (memory LRU + on-disk SQLite) cache of step results.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ..utils import cache_dir
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _encode(value):
+    # Functions are identified by their qualified name, which must not depend on an instance
+    # or an enclosing call
+    if not callable(value):
+        return str(value)
+    qualname = getattr(value, "__qualname__", None)
+    bound = getattr(value, "__self__", None)
+    if qualname is None or "<" in qualname or bound is not None and not inspect.ismodule(bound):
+        raise _Uncacheable
+    return f"{getattr(value, '__module__', None)}.{qualname}"
+
+
+class CompileCache:
+    """
+    A two-tier cache of step results with hit/miss counters.
+
+    Programs whose output is not deterministic (timestamps, random numbers, uninitialized
+    memory) are cached like any other, so only enable the cache when a source is expected to
+    grade the same way every time.
+
+    Attributes:
+        max_entries (int): Maximum number of results held in the memory tier.
+        path (str): Location of the SQLite file backing the disk tier, or None for memory only.
+        max_bytes (int): Size the disk tier is trimmed to, in bytes of stored results.
+        hits (int): Lookups answered from either tier.
+        memory_hits (int): Lookups answered from the memory tier.
+        disk_hits (int): Lookups answered from the disk tier.
+        misses (int): Lookups that had to be graded.
+
+    Methods:
+        key(source, config, toolchain, tests): Computes the cache key of a step.
+        get(key): Looks a result up, returns None on a miss.
+        put(key, result): Stores a result in both tiers.
+        stats(): Returns the hit/miss counters.
+        clear(): Empties both tiers.
+    """
+
+    evict_interval = 64
+
+    def __init__(self, max_entries=4096, path="", max_bytes=256 * 1024 * 1024):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Maximum number of results held in memory. Defaults to 4096.
+            path (str): SQLite file for the disk tier. Defaults to compile_cache.sqlite in the
+                coderl cache directory; None disables the disk tier.
+            max_bytes (int): Size limit of the disk tier. Defaults to 256 MiB.
+        """
+        self.max_entries = max_entries
+        self.path = os.path.join(cache_dir(), "compile_cache.sqlite") if path == "" else path
+        self.max_bytes = max_bytes
+        self.hits = self.memory_hits = self.disk_hits = self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._puts = 0
+
+    def __getstate__(self):
+        # Connections and the memory tier stay with the process that created them
+        state = self.__dict__.copy()
+        state.update(_memory=OrderedDict(), _lock=None, _connection=None, _pid=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(source, config, toolchain, tests=None):
+        """
+        Computes the cache key of a step.
+
+        Args:
+            source (str or bytes-like): The source code of the step. A str hashes like its
+                UTF-8 bytes.
+            config (dict): The language configuration (flags, reward_levels, run_command, ...).
+            toolchain (str): Identifies the compiler in use, including its version.
+            tests (list): The test cases the step is graded against, if any.
+
+        Returns:
+            str: A hex SHA-256 digest, or None when a checker of the test cases has no stable
+                name, as a lambda, closure or bound method.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+        digest.update(str(toolchain).encode())
+        digest.update(b"\0")
+        digest.update(source.encode() if isinstance(source, str) else source)
+        if tests is not None:
+            digest.update(b"\0")
+            try:
+                digest.update(json.dumps(tests, default=_encode).encode())
+            except _Uncacheable:
+                return None
+        return digest.hexdigest()
+
+    def _db(self):
+        if self.path is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Looks a result up, first in memory and then on disk.
+
+        Args:
+            key (str): A key returned by CompileCache.key.
+
+        Returns:
+            tuple: The cached (observation, reward, done, info) tuple, or None on a miss.
+        """
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return result[:3] + (dict(result[3]),)
+            db = self._db()
+            row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone() if db else None
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            result = tuple(json.loads(row[0]))
+            self._remember(key, result)
+            self.hits += 1
+            self.disk_hits += 1
+            return result[:3] + (dict(result[3]),)
+
+    def put(self, key, result):
+        """
+        Stores a result in both tiers, trimming the disk tier when it grows past max_bytes.
+        Timings (the *_time values and trace) are left out of the stored info.
+
+        Args:
+            key (str): A key returned by CompileCache.key.
+            result (tuple): The (observation, reward, done, info) tuple returned by step.
+        """
+        info = {name: value for name, value in result[3].items() if not name.endswith("_time") and name != "trace"}
+        result = result[:3] + (info,)
+        with self._lock:
+            self._remember(key, result)
+            db = self._db()
+            if db is None:
+                return
+            value = json.dumps(result)
+            db.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                       (key, value, len(value), time.time()))
+            self._puts += 1
+            if self._puts % self.evict_interval == 0:
+                self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so eviction does not run on every following put
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters.
+
+        Returns:
+            dict: hits, memory_hits, disk_hits, misses and the memory tier size.
+        """
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+    def clear(self):
+        """
+        Empties both tiers. The counters are left untouched.
+        """
+        with self._lock:
+            self._memory.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM results")
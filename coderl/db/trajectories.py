@@ -0,0 +1,380 @@
+"""
+trajectories.py
+====================================
+A persistent log of every episode graded by CodeCompilerEnv.
+
+Each step is recorded as one row of the episodes table: when it ran, the SHA-256 of its
+source, the language, the configuration it was graded with, the hash of its test cases, where
+the result came from, the stage reached, observation and reward, the time of every stage,
+and its outputs cut to a fixed length. Configurations are stored once in a configs table and
+referenced by hash, and sources are only kept (in a sources table) when asked for, so rows stay
+small at tens of millions of episodes.
+
+Recording never waits for the database. Rows are queued and a background thread inserts them
+in batches, one transaction per batch, into an SQLite file in WAL mode. If the queue is full
+the row is dropped and counted. Indexes on source hash, (lang, reward) and reward serve
+analytics and dedup queries.
+
+Classes:
+
+    TrajectoryStore: SQLite store of episodes with a background batched writer.
+
+Functions:
+
+    source_hash(source): The SHA-256 of a source, as stored in the episodes table.
+
+Global Variables:
+    origins: Where an episode's result can come from.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from ..utils import cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Graded by the environment, answered by the result cache, or shared with an identical
+# request graded at the same time (config["coalesce"])
+origins = ("graded", "cache", "shared")
+
+_schema = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    source_hash TEXT NOT NULL,
+    lang TEXT,
+    config_hash TEXT NOT NULL,
+    tests_hash TEXT,
+    origin TEXT NOT NULL,
+    stage TEXT,
+    observation INTEGER,
+    reward REAL,
+    time REAL,
+    timings TEXT,
+    stdout TEXT,
+    stderr TEXT,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS episodes_source_hash ON episodes (source_hash);
+CREATE INDEX IF NOT EXISTS episodes_lang_reward ON episodes (lang, reward);
+CREATE INDEX IF NOT EXISTS episodes_reward ON episodes (reward);
+CREATE TABLE IF NOT EXISTS configs (config_hash TEXT PRIMARY KEY, config TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (source_hash TEXT PRIMARY KEY, source BLOB NOT NULL);
+"""
+
+_columns = ("created", "source_hash", "lang", "config_hash", "tests_hash", "origin", "stage", "observation",
+            "reward", "time", "timings", "stdout", "stderr", "info")
+
+
+def source_hash(source):
+    """
+    Returns the SHA-256 of a source.
+
+    Args:
+        source (str or bytes-like): The source code. A str hashes like its UTF-8 bytes.
+
+    Returns:
+        str: A hex digest.
+    """
+    return hashlib.sha256(source.encode() if isinstance(source, str) else source).hexdigest()
+
+
+def _json_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class TrajectoryStore:
+    """
+    SQLite store of episodes with a background batched writer.
+
+    Every process writes through its own connection and thread; a store passed to
+    CodeCompilerVecEnv workers is copied into each of them, and all of them append to the
+    same file.
+
+    Attributes:
+        path (str): Location of the SQLite file.
+        output_limit (int): Characters kept of stdout, stderr and every string in the rest of info.
+        keep_sources (bool): Whether the source of every new hash is stored in the sources table.
+        batch_size (int): Maximum rows inserted per transaction.
+        flush_interval (float): Seconds the writer waits to fill a batch.
+        recorded (int): Rows queued by this process.
+        written (int): Rows inserted by this process.
+        dropped (int): Rows dropped because the queue was full.
+
+    Methods:
+        record(source, config, result, origin, stage, trace, tests): Queues one episode.
+        flush(): Waits until every queued row is written.
+        episodes(lang, source_hash, min_reward, max_reward, limit): Reads episodes back.
+        reward_counts(lang): Number of episodes per reward.
+        duplicates(limit): The sources recorded most often.
+        stats(): Returns the counters.
+        close(): Writes the queued rows and stops the writer.
+    """
+
+    def __init__(self, path="", output_limit=1024, keep_sources=False, batch_size=512, flush_interval=0.5,
+                 max_queue=100000):
+        """
+        Initializes the store. The file, its tables and the writer thread are created on the
+        first record.
+
+        Args:
+            path (str): SQLite file. Defaults to trajectories.sqlite in the coderl cache directory.
+            output_limit (int): Characters kept of stdout, stderr and every string in the rest
+                of info. Defaults to 1024.
+            keep_sources (bool): Store the source of every new hash. Defaults to False.
+            batch_size (int): Maximum rows inserted per transaction. Defaults to 512.
+            flush_interval (float): Seconds the writer waits to fill a batch. Defaults to 0.5.
+            max_queue (int): Rows waiting to be written before new ones are dropped.
+                Defaults to 100000.
+        """
+        self.path = os.path.join(cache_dir(), "trajectories.sqlite") if path == "" else path
+        self.output_limit = output_limit
+        self.keep_sources = keep_sources
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.recorded = self.written = self.dropped = 0
+        self._configs = set()
+        self._reset()
+        # Rows still queued at exit are written first
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._queue = queue.Queue(self.max_queue)
+        self._thread = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The queue, the writer thread and the connection stay with the process that created them
+        state = self.__dict__.copy()
+        for name in ("_queue", "_thread", "_pid", "_lock"):
+            state.pop(name)
+        state.update(recorded=0, written=0, dropped=0, _configs=set())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+        atexit.register(self.close)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked after the writer started: the thread did not survive the fork
+                self._reset()
+            if self._thread is None:
+                connection = self._connect()
+                connection.executescript(_schema)
+                self._thread = threading.Thread(target=self._write_loop, args=(connection,),
+                                                name="coderl-trajectories", daemon=True)
+                self._thread.start()
+
+    def _truncate(self, value):
+        # Cuts every string of a value, so info stays valid JSON
+        if isinstance(value, dict):
+            return {key: self._truncate(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._truncate(item) for item in value]
+        if not isinstance(value, str) or self.output_limit is None or len(value) <= self.output_limit:
+            return value
+        return value[:self.output_limit] + "..."
+
+    def record(self, source, config, result, origin="graded", stage=None, trace=None, tests=None):
+        """
+        Queues one episode. Only hashing and serialization happen in the caller's thread.
+
+        Args:
+            source (str or bytes-like): The source code of the step.
+            config (dict): The configuration it was graded with.
+            result (tuple): The (observation, reward, done, info) tuple of the step.
+            origin (str): One of origins. Defaults to "graded".
+            stage (str): The stage reached. Defaults to info["stage"], if any.
+            trace (coderl.metrics.StepTrace): The step's trace, for the stage timings.
+            tests (list): The test cases of the step, if any.
+        """
+        if self._thread is None or self._pid != os.getpid():
+            self._start()
+        observation, reward, done, info = result
+        info = dict(info)
+        stdout, stderr = info.pop("stdout", None), info.pop("stderr", None)
+        timings = trace.timings() if trace is not None else None
+        digest = source_hash(source)
+        config_hash = _json_hash(config)
+        if config_hash not in self._configs:
+            self._configs.add(config_hash)
+            self._put(("config", (config_hash, json.dumps(config, sort_keys=True, default=str))))
+        if self.keep_sources:
+            self._put(("source", (digest, source.encode() if isinstance(source, str) else bytes(source))))
+        self._put(("episode", (
+            time.time(), digest, config.get("lang"), config_hash,
+            _json_hash(tests) if tests is not None else None, origin, stage or info.get("stage"), observation,
+            reward, sum(timings.values()) if timings else None, json.dumps(timings) if timings else None,
+            self._truncate(stdout), self._truncate(stderr),
+            json.dumps(self._truncate(info), default=str) if info else None)))
+        self.recorded += 1
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if item[0] == "config":
+                # Episodes reference it, so make sure it is queued again
+                self._configs.discard(item[1][0])
+            self.dropped += 1
+            if self.dropped == 1:
+                logger.warning("Trajectory queue full, dropping episodes")
+
+    def _write_loop(self, connection):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size and items[-1] is not None:
+                try:
+                    items.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            batch = [item for item in items if item is not None and item != "flush"]
+            try:
+                self._write(connection, batch)
+            except Exception as error:
+                # A bad batch must not stop the writer, or flush would wait forever
+                logger.warning("Could not write %d trajectory rows: %s", len(batch), error)
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    def _write(self, connection, batch):
+        if not batch:
+            return
+        episodes = [row for kind, row in batch if kind == "episode"]
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("INSERT OR IGNORE INTO configs VALUES (?, ?)",
+                                   [row for kind, row in batch if kind == "config"])
+            connection.executemany("INSERT OR IGNORE INTO sources VALUES (?, ?)",
+                                   [row for kind, row in batch if kind == "source"])
+            connection.executemany(f"INSERT INTO episodes ({', '.join(_columns)}) "
+                                   f"VALUES ({', '.join('?' * len(_columns))})", episodes)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self.written += len(episodes)
+
+    def flush(self):
+        """
+        Waits until every row queued so far is written.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.put("flush")
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes the queued rows and stops the writer. A later record starts a new one.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join()
+
+    def _read(self, sql, params=()):
+        self.flush()
+        connection = self._connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+        except sqlite3.OperationalError:
+            # Nothing was recorded yet, so there are no tables
+            return []
+        finally:
+            connection.close()
+
+    def episodes(self, lang=None, source_hash=None, min_reward=None, max_reward=None, limit=None):
+        """
+        Reads episodes back, oldest first, after writing the queued rows.
+
+        Args:
+            lang (str): Only episodes of this language.
+            source_hash (str): Only episodes of this source, see source_hash.
+            min_reward (float): Only episodes with at least this reward.
+            max_reward (float): Only episodes with at most this reward.
+            limit (int): Maximum number of episodes.
+
+        Returns:
+            list: One dict per episode, with the columns of the episodes table. timings and
+                info are decoded.
+        """
+        conditions, params = [], []
+        for column, operator, value in (("lang", "=", lang), ("source_hash", "=", source_hash),
+                                        ("reward", ">=", min_reward), ("reward", "<=", max_reward)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        sql = "SELECT * FROM episodes" + (" WHERE " + " AND ".join(conditions) if conditions else "") + " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._read(sql, params)
+        for row in rows:
+            row["timings"] = json.loads(row["timings"]) if row["timings"] else None
+            row["info"] = json.loads(row["info"]) if row["info"] else {}
+        return rows
+
+    def reward_counts(self, lang=None):
+        """
+        Counts the episodes per reward, from the reward indexes.
+
+        Args:
+            lang (str): Only episodes of this language.
+
+        Returns:
+            dict: The number of episodes of every reward.
+        """
+        where, params = (" WHERE lang = ?", (lang,)) if lang is not None else ("", ())
+        rows = self._read(f"SELECT reward, COUNT(*) AS count FROM episodes{where} GROUP BY reward", params)
+        return {row["reward"]: row["count"] for row in rows}
+
+    def duplicates(self, limit=10):
+        """
+        Returns the sources recorded most often, from the source hash index.
+
+        Args:
+            limit (int): Maximum number of sources. Defaults to 10.
+
+        Returns:
+            list: (source_hash, episodes) pairs of the sources recorded more than once, most
+                frequent first.
+        """
+        rows = self._read("SELECT source_hash, COUNT(*) AS count FROM episodes GROUP BY source_hash "
+                          "HAVING count > 1 ORDER BY count DESC LIMIT ?", (limit,))
+        return [(row["source_hash"], row["count"]) for row in rows]
+
+    def stats(self):
+        """
+        Returns the counters of this process.
+
+        Returns:
+            dict: recorded, written, dropped and the number of rows waiting in the queue.
+        """
+        return {"recorded": self.recorded, "written": self.written, "dropped": self.dropped,
+                "queued": self._queue.qsize()}
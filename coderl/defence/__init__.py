@@ -1 +1,3 @@
-import sonarqube
+from ..utils import lazy_imports
+
+__getattr__ = lazy_imports(__name__, {"sonarqube": "sonarqube"})
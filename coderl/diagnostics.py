@@ -0,0 +1,187 @@
+"""
+diagnostics.py
+====================================
+Structured compiler diagnostics.
+
+With config["diagnostics"] set, a step that fails to build returns its diagnostics in
+info["diagnostics"] instead of the raw compiler stderr. gcc and g++ are asked for
+-fdiagnostics-format=json. The text output of other compilers and of the linker is parsed
+from the usual ``file:line:column: severity: message [option]`` layout. The diagnostics are
+deduplicated and capped, and stored column-wise, one list per field, so they stay small and
+survive JSON (the result cache, the grading daemon) unchanged:
+
+    {"file": [...], "line": [...], "column": [...], "severity": [...], "option": [...],
+     "message": [...], "dropped": 0}
+
+Line and column are 0 when unknown, option is None when the diagnostic has none.
+
+Classes:
+
+    Diagnostic: One diagnostic, as returned by rows.
+
+Functions:
+
+    parse(stderr, limit, message_limit): Parses compiler output into the column-wise structure.
+    rows(diagnostics): Iterates over the diagnostics as Diagnostic tuples.
+    format_diagnostics(diagnostics, limit): Renders diagnostics as compact feedback text.
+
+Global Variables:
+    json_languages: The configuration languages whose GNU compilers emit JSON diagnostics.
+    fields: The fields of a diagnostic.
+"""
+
+import json
+import re
+from collections import namedtuple
+
+json_languages = ("c", "cpp")
+
+fields = ("file", "line", "column", "severity", "option", "message")
+
+Diagnostic = namedtuple("Diagnostic", fields)
+Diagnostic.__doc__ = """
+One diagnostic.
+
+Attributes:
+    file (str): The file it points at, or None.
+    line (int): 1-based line, or 0 when unknown.
+    column (int): 1-based column, or 0 when unknown.
+    severity (str): "error", "warning" or "note".
+    option (str): The warning option that controls it, e.g. "-Wunused-variable", or None.
+    message (str): The message.
+"""
+
+# "In file included from a.c:1:" and its "                 from b.h:2," continuation lines
+_include_context = re.compile(r"^(?:In file included from|\s+from)\s+\S+:\d+(?::\d+)?[:,]\s*$")
+# file:line[:column]: [severity:] message [-Woption]
+_located = re.compile(r"^(?P<file>[^\s:]+):(?P<line>\d+):(?:(?P<column>\d+):)?\s*"
+                      r"(?:(?P<severity>fatal error|error|warning|note):\s*)?(?P<message>.*?)"
+                      r"(?:\s+\[(?P<option>-W[^\]]+)\])?\s*$")
+# file:(.text+0xa): message, from the linker
+_linker = re.compile(r"^(?P<file>[^\s:]+):\([^)]*\):\s*(?P<message>.+)$")
+# tool: error: message
+_tool = re.compile(r"^(?P<file>[^\s:]+):\s*(?P<severity>fatal error|error|warning):\s*(?P<message>.+)$")
+
+
+def _option(option):
+    # -Werror=foo is how gcc tags a -Wfoo warning promoted to an error
+    if option and option.startswith("-Werror="):
+        return "-W" + option[len("-Werror="):]
+    return option or None
+
+
+def _severity(severity):
+    if not severity:
+        return "error"
+    return "error" if severity == "fatal error" else severity
+
+
+def _json_entries(line):
+    # gcc prints one JSON array per compile, even an empty one
+    if not line.startswith("["):
+        return None
+    try:
+        entries = json.loads(line)
+    except ValueError:
+        return None
+    return entries if isinstance(entries, list) else None
+
+
+def _parse_lines(stderr):
+    for line in stderr.splitlines():
+        entries = _json_entries(line)
+        if entries is not None:
+            for entry in entries:
+                caret = (entry.get("locations") or [{}])[0].get("caret", {})
+                yield Diagnostic(caret.get("file"), caret.get("line", 0), caret.get("column", 0),
+                                 _severity(entry.get("kind")), _option(entry.get("option")), entry.get("message", ""))
+            continue
+        if _include_context.match(line):
+            continue
+        match = _located.match(line)
+        if match:
+            yield Diagnostic(match["file"], int(match["line"]), int(match["column"] or 0), _severity(match["severity"]),
+                             _option(match["option"]), match["message"])
+            continue
+        match = _linker.match(line)
+        if match:
+            yield Diagnostic(match["file"], 0, 0, "error", None, match["message"])
+            continue
+        match = _tool.match(line)
+        if match:
+            yield Diagnostic(match["file"], 0, 0, _severity(match["severity"]), None, match["message"])
+
+
+def parse(stderr, limit=20, message_limit=512):
+    """
+    Parses compiler output into the column-wise structure. Lines that are not diagnostics
+    (source excerpts, carets, "In function" headers, "In file included from" context) are
+    skipped.
+
+    Args:
+        stderr (str): The compiler's standard error.
+        limit (int): Maximum number of diagnostics kept; later ones are counted in "dropped".
+            Defaults to 20. None keeps all of them.
+        message_limit (int): Messages are cut to this many characters. Defaults to 512.
+
+    Returns:
+        dict: One list per field of Diagnostic, and "dropped".
+    """
+    diagnostics = {field: [] for field in fields}
+    diagnostics["dropped"] = 0
+    seen = set()
+    for diagnostic in _parse_lines(stderr or ""):
+        if message_limit is not None and len(diagnostic.message) > message_limit:
+            diagnostic = diagnostic._replace(message=diagnostic.message[:message_limit] + "...")
+        if diagnostic in seen:
+            continue
+        seen.add(diagnostic)
+        if limit is not None and len(seen) > limit:
+            diagnostics["dropped"] += 1
+            continue
+        for field, value in zip(fields, diagnostic):
+            diagnostics[field].append(value)
+    return diagnostics
+
+
+def rows(diagnostics):
+    """
+    Iterates over the diagnostics.
+
+    Args:
+        diagnostics (dict): The column-wise structure returned by parse.
+
+    Returns:
+        iterator: One Diagnostic per diagnostic, in order.
+    """
+    return map(Diagnostic._make, zip(*(diagnostics[field] for field in fields)))
+
+
+def format_diagnostics(diagnostics, limit=None):
+    """
+    Renders diagnostics as compact feedback text, one line per diagnostic, in the same layout
+    for every language.
+
+    Args:
+        diagnostics (dict): The column-wise structure returned by parse.
+        limit (int): Maximum number of lines. Defaults to all of them.
+
+    Returns:
+        str: The feedback.
+    """
+    lines = []
+    for diagnostic in rows(diagnostics):
+        location = ":".join(str(part) for part in (diagnostic.file, diagnostic.line, diagnostic.column)
+                            if part not in (None, 0))
+        line = f"{location}: {diagnostic.severity}: {diagnostic.message}" if location else \
+            f"{diagnostic.severity}: {diagnostic.message}"
+        if diagnostic.option:
+            line += f" [{diagnostic.option}]"
+        lines.append(line)
+    dropped = diagnostics.get("dropped", 0)
+    if limit is not None and len(lines) > limit:
+        dropped += len(lines) - limit
+        lines = lines[:limit]
+    if dropped:
+        lines.append(f"[... {dropped} more diagnostics]")
+    return "\n".join(lines)
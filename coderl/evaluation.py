@@ -0,0 +1,394 @@
+"""
+evaluation.py
+====================================
+Streaming, resumable offline evaluation of JSONL datasets.
+
+The input holds one JSON object per line: {"id": ..., "lang": ..., "code": ..., "tests": ...}.
+Only code is required. lang defaults to the evaluation's default language, id to the
+record's position in the input (from 1, blank lines skipped), and tests (a list of
+[input, output] pairs or {"input", "output"} objects) to none. Records are read lazily and
+graded in chunks on a pool of worker processes. Each worker keeps one CodeCompilerEnv per
+language. At most a few chunks per worker are in flight, so memory stays bounded whatever the
+size of the dataset.
+
+Results are written in input order, one row per record:
+{"id", "lang", "observation", "reward", "info", "error"}. error is None unless the record
+could not be graded (invalid JSON, unknown language, a grading exception). Output ending in
+.parquet is a directory of Parquet part files, one per checkpoint (this needs pyarrow). Any
+other output is JSONL.
+
+Every checkpoint_every records, the output is flushed to disk and a checkpoint is written
+next to it (<output>.checkpoint). It holds the input offset reached, the output size and the
+running summary. A run that is killed resumes from its last checkpoint: output written after
+the checkpoint is dropped and those records are graded again. SIGINT and SIGTERM are held
+back while a chunk's rows are written, so an interrupted run checkpoints whole chunks only.
+
+    coderl eval dataset.jsonl results.jsonl --workers 8
+
+Classes:
+
+    Evaluation: One evaluation of an input file into an output file.
+
+Functions:
+
+    format_summary(summary): Renders a summary as text.
+
+Global Variables:
+    parquet_schema: Column names and types of the Parquet output.
+"""
+
+import contextlib
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .main import CodeCompilerEnv, default_configs
+
+logger = logging.getLogger(__name__)
+
+parquet_schema = (("id", "string"), ("lang", "string"), ("observation", "int64"), ("reward", "float64"),
+                  ("info", "string"), ("error", "string"))
+
+_worker_configs = None
+_worker_cache = None
+_worker_envs = {}
+
+
+def _init_worker(configs, cache):
+    """
+    Initializes a pool worker with the configurations of every language.
+
+    Args:
+        configs (dict): Configuration per language.
+        cache (coderl.db.CompileCache): Result cache of the worker's environments, or None.
+    """
+    global _worker_configs, _worker_cache
+    _worker_configs, _worker_cache = configs, cache
+    # Pool workers skip atexit handlers, so register the cleanup with multiprocessing instead
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    for env in _worker_envs.values():
+        env.close()
+    _worker_envs.clear()
+
+
+def _grade_worker(records):
+    """
+    Grades a chunk of records in a pool worker.
+
+    Args:
+        records (list): (lang, code, tests) tuples.
+
+    Returns:
+        list: One (observation, reward, info, error) tuple per record.
+    """
+    results = []
+    for lang, code, tests in records:
+        try:
+            env = _worker_envs.get(lang)
+            if env is None:
+                if lang not in _worker_configs:
+                    raise ValueError(f"Unknown language '{lang}'")
+                env = _worker_envs[lang] = CodeCompilerEnv(_worker_configs[lang], cache=_worker_cache)
+            observation, reward, done, info = env.step(code, tests)
+            results.append((observation, reward, info, None))
+        except Exception as error:
+            results.append((None, None, None, f"{type(error).__name__}: {error}"))
+    return results
+
+
+@contextlib.contextmanager
+def _signals_deferred():
+    # SIGINT and SIGTERM received inside the block are delivered when it ends. Handlers can
+    # only be replaced from the main thread; elsewhere the block is not protected.
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    received = []
+    # Handlers installed outside of Python cannot be restored, so those signals are left alone
+    previous = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    previous = {signum: handler for signum, handler in previous.items() if handler is not None}
+    for signum in previous:
+        signal.signal(signum, lambda signum, frame: received.append(signum))
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        for signum in received:
+            signal.raise_signal(signum)
+
+
+def _empty_summary():
+    return {"records": 0, "errors": 0, "seconds": 0.0, "rewards": {}, "languages": {}}
+
+
+class _JsonlWriter:
+    """
+    Appends rows to a JSONL file.
+    """
+
+    def __init__(self, path, size):
+        # Anything after the checkpointed size was written after the last checkpoint
+        with open(path, "ab") as file:
+            file.truncate(size)
+        self._file = open(path, "ab")
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False).encode() + b"\n")
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """
+    Writes rows to a directory of Parquet part files, one per flush.
+    """
+
+    def __init__(self, path, size):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from error
+        self._pyarrow, self._parquet = pyarrow, pyarrow.parquet
+        self._schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in parquet_schema])
+        self._path, self._parts, self._rows = path, size, []
+        os.makedirs(path, exist_ok=True)
+        # Parts numbered from the checkpointed count on were written after the last checkpoint
+        for name in os.listdir(path):
+            if name.startswith("part-") and int(name[5:10]) >= size:
+                os.remove(os.path.join(path, name))
+
+    def write(self, row):
+        self._rows.append(dict(row, id=str(row["id"]), info=json.dumps(row["info"], ensure_ascii=False)))
+
+    def flush(self):
+        if self._rows:
+            table = self._pyarrow.Table.from_pylist(self._rows, schema=self._schema)
+            temp_path = os.path.join(self._path, f".part-{self._parts:05d}.parquet.tmp")
+            self._parquet.write_table(table, temp_path)
+            os.replace(temp_path, os.path.join(self._path, f"part-{self._parts:05d}.parquet"))
+            self._parts += 1
+            self._rows = []
+        return self._parts
+
+    def close(self):
+        pass
+
+
+class Evaluation:
+    """
+    One evaluation of a JSONL input file into an output file, resumable from its checkpoint.
+
+    Attributes:
+        input_path (str): The JSONL dataset.
+        output_path (str): The JSONL file, or Parquet directory, results are written to.
+        checkpoint_path (str): The checkpoint file, output_path + ".checkpoint".
+        configs (dict): The configuration of every language.
+        summary (dict): Running totals: "records", "errors", grading "seconds", the count of
+            every reward value in "rewards", and per language "records", "reward_sum" and
+            "passed" (observation 1) in "languages".
+
+    Methods:
+        run(): Grades the records after the checkpoint and returns the summary.
+    """
+
+    def __init__(self, input_path, output_path, configs=None, lang="c", num_workers=None, chunksize=16,
+                 checkpoint_every=1000, mp_context=None, cache=None, restart=False):
+        """
+        Initializes the evaluation.
+
+        Args:
+            input_path (str): The JSONL dataset.
+            output_path (str): Where results are written. Parquet when it ends in .parquet,
+                else JSONL.
+            configs (dict): Configurations per language, merged over default_configs.
+            lang (str): Language of the records that have no "lang". Defaults to "c".
+            num_workers (int): Worker processes. Defaults to the number of CPUs.
+            chunksize (int): Records sent to a worker per task. Defaults to 16.
+            checkpoint_every (int): Records between checkpoints. Defaults to 1000.
+            mp_context (str): Multiprocessing start method of the pool. Defaults to the platform
+                default.
+            cache (coderl.db.CompileCache): Optional result cache shared by the workers.
+            restart (bool): Ignore the checkpoint and start over. Defaults to False.
+        """
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = output_path.rstrip(os.sep) + ".checkpoint"
+        self.configs = dict(default_configs, **(configs or {}))
+        self.lang = lang
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.checkpoint_every = checkpoint_every
+        self.mp_context = mp_context
+        self.cache = cache
+        checkpoint = None if restart else self._load_checkpoint()
+        self._offset = checkpoint["offset"] if checkpoint else 0
+        self._size = checkpoint["output_size"] if checkpoint else 0
+        self._complete = bool(checkpoint and checkpoint["complete"])
+        self.summary = checkpoint["summary"] if checkpoint else _empty_summary()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as file:
+                checkpoint = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get("input") != os.path.abspath(self.input_path):
+            raise ValueError(f"{self.checkpoint_path} belongs to the evaluation of {checkpoint.get('input')}, "
+                             f"not {self.input_path}; restart to overwrite it")
+        logger.info("Resuming after %d records", checkpoint["summary"]["records"])
+        return checkpoint
+
+    def _save_checkpoint(self, complete=False):
+        checkpoint = {"input": os.path.abspath(self.input_path), "offset": self._offset,
+                      "output_size": self._size, "complete": complete, "summary": self.summary}
+        # Write through a temporary file so a kill never leaves a partial checkpoint
+        temp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _chunks(self, file):
+        # Yields (end offset, rows, graded records) per chunk of input lines
+        offset, number, rows, records = self._offset, self.summary["records"], [], []
+        for line in file:
+            offset += len(line)
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+                row = {"id": record.get("id", number), "lang": record.get("lang") or self.lang}
+                records.append((row["lang"], record["code"], record.get("tests")))
+                rows.append(row)
+            except (ValueError, KeyError, AttributeError) as error:
+                rows.append({"id": number, "lang": None, "observation": None, "reward": None, "info": None,
+                             "error": f"Invalid record: {error!r}"})
+            if len(rows) >= self.chunksize:
+                yield offset, rows, records
+                rows, records = [], []
+        if rows:
+            yield offset, rows, records
+
+    def _record(self, row):
+        summary = self.summary
+        summary["records"] += 1
+        if row["error"] is not None:
+            summary["errors"] += 1
+            return
+        reward = str(row["reward"])
+        summary["rewards"][reward] = summary["rewards"].get(reward, 0) + 1
+        language = summary["languages"].setdefault(row["lang"], {"records": 0, "reward_sum": 0.0, "passed": 0})
+        language["records"] += 1
+        language["reward_sum"] += row["reward"]
+        language["passed"] += row["observation"] == 1
+
+    def run(self):
+        """
+        Grades the records after the checkpoint, writing results and checkpoints as it goes.
+        On KeyboardInterrupt the results written so far are checkpointed before it is re-raised.
+
+        Returns:
+            dict: The summary of the whole evaluation, including resumed runs.
+        """
+        if self._complete:
+            return self.summary
+        if self.output_path.endswith(".parquet"):
+            writer = _ParquetWriter(self.output_path, self._size)
+        else:
+            writer = _JsonlWriter(self.output_path, self._size)
+        context = multiprocessing.get_context(self.mp_context) if self.mp_context else None
+        pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(self.configs, self.cache))
+        pending = deque()
+        since_checkpoint = 0
+        start = time.perf_counter()
+
+        def checkpoint(complete=False):
+            self._size = writer.flush()
+            self.summary["seconds"] += time.perf_counter() - start
+            self._save_checkpoint(complete)
+            return time.perf_counter()
+
+        def write(offset, rows, future):
+            results = iter(future.result())
+            for row in rows:
+                if "error" not in row:
+                    observation, reward, info, error = next(results)
+                    row.update(observation=observation, reward=reward, info=info, error=error)
+            # The rows, the summary and the offset move together, or a checkpoint taken on
+            # interrupt would count part of a chunk that is graded again on resume
+            with _signals_deferred():
+                for row in rows:
+                    writer.write(row)
+                    self._record(row)
+                self._offset = offset
+
+        try:
+            with open(self.input_path, "rb") as file:
+                file.seek(self._offset)
+                for offset, rows, records in self._chunks(file):
+                    pending.append((offset, rows, pool.submit(_grade_worker, records)))
+                    # Results are written in input order, with a bounded number of chunks in flight
+                    while len(pending) > 2 * self.num_workers or (pending and pending[0][2].done()):
+                        offset, rows, future = pending.popleft()
+                        write(offset, rows, future)
+                        since_checkpoint += len(rows)
+                    if since_checkpoint >= self.checkpoint_every:
+                        start = checkpoint()
+                        since_checkpoint = 0
+                        logger.info("%d records graded, %.1f records/s", self.summary["records"],
+                                    self.summary["records"] / max(self.summary["seconds"], 1e-9))
+                while pending:
+                    write(*pending.popleft())
+            checkpoint(complete=True)
+        except KeyboardInterrupt:
+            checkpoint()
+            raise
+        finally:
+            pool.shutdown(cancel_futures=True)
+            writer.close()
+        return self.summary
+
+
+def format_summary(summary):
+    """
+    Renders a summary as text: throughput, then the reward distribution overall and per
+    language.
+
+    Args:
+        summary (dict): The summary returned by Evaluation.run.
+
+    Returns:
+        str: The report.
+    """
+    records, seconds = summary["records"], summary["seconds"]
+    lines = [f"{records} records in {seconds:.1f}s ({records / max(seconds, 1e-9):.1f} records/s), "
+             f"{summary['errors']} errors"]
+    graded = sum(summary["rewards"].values())
+    if graded:
+        lines.append("reward distribution:")
+        for reward, count in sorted(summary["rewards"].items(), key=lambda item: float(item[0])):
+            lines.append(f"  {reward:>8}  {count:>8}  {100 * count / graded:5.1f}%")
+    for lang, language in sorted(summary["languages"].items()):
+        lines.append(f"{lang}: {language['records']} records, mean reward "
+                     f"{language['reward_sum'] / language['records']:.3f}, "
+                     f"{100 * language['passed'] / language['records']:.1f}% passed")
+    return "\n".join(lines)
@@ -0,0 +1,69 @@
+"""
+executor.py
+====================================
+Runs the shell commands issued while grading a step, either blocking or on asyncio.
+
+CodeCompilerEnv describes a step as a generator that yields shell commands and receives
+their results. The functions here execute those commands; run and arun produce identical
+subprocess.CompletedProcess objects, so the sync and async step APIs grade identically.
+Besides shell command strings, a generator may yield command objects with their own run
+and arun methods (for example requests to a warm compiler server).
+
+Functions:
+
+    run(command, cwd, env): Runs a shell command and waits for it.
+    arun(command, cwd, env): Runs a shell command on the running asyncio event loop.
+"""
+
+import asyncio
+import locale
+import subprocess
+
+
+def _decode(data):
+    # Same decoding as subprocess.run(..., text=True): locale encoding and universal newlines
+    text = data.decode(locale.getpreferredencoding(False))
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def run(command, cwd=None, env=None):
+    """
+    Runs a shell command and waits for it, capturing its output as text.
+
+    Args:
+        command (str): The shell command, or a command object with a run method.
+        cwd (str): Directory to run the command in. Defaults to the current directory.
+        env (dict): Environment of the command. Defaults to the current environment.
+
+    Returns:
+        subprocess.CompletedProcess: The result of the command.
+    """
+    if not isinstance(command, str):
+        return command.run(cwd, env)
+    return subprocess.run(command, shell=True, capture_output=True, text=True, cwd=cwd, env=env)
+
+
+async def arun(command, cwd=None, env=None):
+    """
+    Runs a shell command as an asyncio subprocess, capturing its output as text.
+
+    Args:
+        command (str): The shell command, or a command object with an arun method.
+        cwd (str): Directory to run the command in. Defaults to the current directory.
+        env (dict): Environment of the command. Defaults to the current environment.
+
+    Returns:
+        subprocess.CompletedProcess: The result of the command, as run would return it.
+    """
+    if not isinstance(command, str):
+        return await command.arun(cwd, env)
+    process = await asyncio.create_subprocess_shell(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                    cwd=cwd, env=env)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # A cancelled step does not leave its compiler running
+        process.kill()
+        await process.wait()
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, _decode(stdout), _decode(stderr))
@@ -0,0 +1,76 @@
+"""
+golang.py
+====================================
+Build cache management for the Go configuration.
+
+Go steps are built with ``go build`` into the step's scratch directory and the binary is
+run directly. Every worker shares one GOCACHE, which Go keeps safe for concurrent use, and
+the cache is warmed once with the commonly imported standard library packages so the first
+steps do not pay for compiling them.
+
+Functions:
+
+    go_environment(go_cache): Builds the environment variables for go commands.
+    warm_go_cache(command, env, packages): Compiles the given packages into the cache once.
+
+Global Variables:
+    default_warm_packages: Standard library packages compiled into a new cache.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import subprocess
+
+from .utils import cache_dir
+
+logger = logging.getLogger(__name__)
+
+default_warm_packages = [
+    "fmt", "bufio", "os", "io", "strings", "strconv", "sort", "math", "math/big", "math/rand",
+    "container/heap", "container/list", "bytes", "unicode", "errors", "time", "sync",
+]
+
+
+def go_environment(go_cache=True):
+    """
+    Builds the environment variables for go commands.
+
+    Args:
+        go_cache (bool or str): True for the shared cache in the coderl cache directory, or the
+            path of the GOCACHE to use.
+
+    Returns:
+        dict: The process environment with GOCACHE set and toolchain downloads disabled.
+    """
+    path = os.path.join(cache_dir(), "go-build") if go_cache is True else go_cache
+    os.makedirs(path, exist_ok=True)
+    return dict(os.environ, GOCACHE=path, GOTOOLCHAIN="local")
+
+
+def warm_go_cache(command, env, packages=None):
+    """
+    Compiles packages into the GOCACHE once. A marker file records which package lists have
+    been built, and a file lock keeps concurrent workers from warming the same cache twice.
+
+    Args:
+        command (str): The go command.
+        env (dict): Environment returned by go_environment.
+        packages (list): Packages to build. Defaults to default_warm_packages; ["std"] builds
+            the whole standard library.
+    """
+    packages = default_warm_packages if packages is None else packages
+    digest = hashlib.sha256(" ".join([command] + list(packages)).encode()).hexdigest()[:16]
+    marker = os.path.join(env["GOCACHE"], f"coderl-warm-{digest}")
+    if os.path.exists(marker):
+        return
+    with open(marker + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(marker):
+            return
+        result = subprocess.run([command, "build"] + list(packages), env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.warning("Could not warm the Go build cache: %s", result.stderr)
+            return
+        open(marker, "w").close()
@@ -0,0 +1,195 @@
+"""
+grading.py
+====================================
+Helpers for grading a source file against a ladder of reward levels without
+compiling it once per level.
+
+The ladder in CodeCompilerEnv.step compiles the source with every entry of
+``reward_levels`` in turn and stops at the first one that fails. For gcc-style
+toolchains the same answer can be read off a single compile: build once with the
+union of all warning flags (but without ``-Werror``), collect the option tag of
+every warning (``[-Wunused-variable]``), and look up the first level that both
+enables that warning and turns it into an error. Toolchains whose diagnostics
+cannot be classified this way fall back to a binary search over the levels.
+
+Functions:
+
+    split_werror(flags): Splits a flag string into warning flags and -Werror settings.
+    single_compile_flags(reward_levels): Builds the flag string for the single classifying compile.
+    enabled_warnings(command, lang_flag, flags): Asks gcc which warnings a flag set enables.
+    warning_tags(stderr): Extracts the option tags of the warnings in compiler output.
+    classify(tags, level_info): Finds the first level that the given warnings fail.
+"""
+
+import functools
+import re
+import shlex
+import subprocess
+
+from . import diagnostics
+
+# Languages whose warnings can be classified through ``-Q --help=warnings``,
+# mapped to the value passed to ``-x`` so the probe sees language-specific defaults.
+classifiable_languages = {
+    "c": "c",
+    "cpp": "c++",
+}
+
+_WARNING_FLAG = re.compile(r"^-(W|w$|pedantic$)")
+_WARNING_LINE = re.compile(r"\bwarning: ")
+_OPTION_TAG = re.compile(r"\[(-W[^\]]+)\]\s*$")
+
+
+def split_werror(flags):
+    """
+    Splits a flag string into its warning flags and the -Werror settings it carries.
+
+    Args:
+        flags (str): Flags of a single reward level, e.g. "-Werror -Wall".
+
+    Returns:
+        tuple: (warning_flags, werror_all, werror_options) where warning_flags is the list
+        of flags with -Werror removed (``-Werror=foo`` becomes ``-Wfoo``), werror_all tells
+        whether a plain -Werror was present and werror_options is the set of option tags
+        promoted to errors individually. Returns None if the flags contain anything other
+        than warning options, in which case the level cannot be classified.
+    """
+    warning_flags = []
+    werror_all = False
+    werror_options = set()
+    for flag in shlex.split(flags):
+        if flag == "-Werror":
+            werror_all = True
+        elif flag.startswith("-Werror="):
+            option = "-W" + flag[len("-Werror="):]
+            werror_options.add(option)
+            warning_flags.append(option)
+        elif flag.startswith("-Wno-error"):
+            return None
+        elif _WARNING_FLAG.match(flag):
+            warning_flags.append(flag)
+        else:
+            return None
+    return warning_flags, werror_all, werror_options
+
+
+def single_compile_flags(reward_levels):
+    """
+    Builds the flags for the single compile that replaces the ladder: the union of the
+    warning flags of every level, in ladder order, with -Werror stripped.
+
+    Args:
+        reward_levels (list): A list of (flags, reward) tuples.
+
+    Returns:
+        str: The flag string, or None if some level cannot be classified.
+    """
+    merged = []
+    for flags, _ in reward_levels:
+        split = split_werror(flags)
+        if split is None:
+            return None
+        for flag in split[0]:
+            if flag not in merged:
+                merged.append(flag)
+    return " ".join(merged)
+
+
+@functools.lru_cache(maxsize=None)
+def enabled_warnings(command, lang_flag, flags):
+    """
+    Asks the compiler which warnings a given flag set enables, using gcc's
+    ``-Q --help=warnings``. Results are memoized per process.
+
+    Args:
+        command (str): The compiler driver, e.g. "gcc".
+        lang_flag (str): The language passed to ``-x``, e.g. "c".
+        flags (str): The full flag string of one reward level.
+
+    Returns:
+        dict: Maps option tags (e.g. "-Wunused-variable", "-Wformat=") to True or False.
+        Options the compiler reports without a usable state are left out. Returns None
+        if the compiler does not support the query (e.g. clang).
+    """
+    result = subprocess.run(
+        f"{command} -Q --help=warnings {flags} -x {lang_flag} -fsyntax-only /dev/null",
+        shell=True, capture_output=True, text=True)
+    if result.returncode != 0 or "[enabled]" not in result.stdout:
+        return None
+    states = {}
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or not parts[0].startswith("-W"):
+            continue
+        option = re.sub(r"<[^>]*>$", "", parts[0])
+        state = parts[1]
+        if state == "[enabled]":
+            states[option] = True
+        elif state == "[disabled]":
+            states[option] = False
+        elif state.isdigit():
+            states[option] = int(state) != 0
+    return states
+
+
+def warning_tags(stderr):
+    """
+    Extracts the option tag of every warning in compiler output.
+
+    Args:
+        stderr (str): Compiler stderr.
+
+    Returns:
+        set: The option tags found, e.g. {"-Wunused-variable"}. Warnings without a tag
+        (for example linker warnings) are reported as None.
+    """
+    tags = set()
+    for line in stderr.splitlines():
+        if line.startswith("["):
+            # -fdiagnostics-format=json, see coderl.diagnostics
+            parsed = diagnostics.parse(line, limit=None)
+            tags.update(option for severity, option in zip(parsed["severity"], parsed["option"])
+                        if severity == "warning")
+            continue
+        if not _WARNING_LINE.search(line):
+            continue
+        match = _OPTION_TAG.search(line)
+        tags.add(match.group(1) if match else None)
+    return tags
+
+
+def classify(tags, level_info):
+    """
+    Finds the first reward level that a set of warnings would fail.
+
+    A level fails on a warning if the warning is enabled at that level and the level
+    promotes it to an error, either through a plain -Werror or through -Werror=<option>.
+
+    Args:
+        tags (set): Warning option tags, as returned by warning_tags.
+        level_info (list): One (werror_all, werror_options, enabled) tuple per level, where
+            enabled is the mapping returned by enabled_warnings.
+
+    Returns:
+        tuple: (first_fail, first_unknown). first_fail is the index of the first level known
+        to fail, or len(level_info) if none does. first_unknown is the index of the first
+        level whose outcome depends on a warning the compiler could not classify, or None.
+    """
+    for index, (werror_all, werror_options, enabled) in enumerate(level_info):
+        unknown = False
+        for tag in tags:
+            if not (werror_all or tag in werror_options):
+                continue
+            state = enabled.get(tag) if tag is not None else None
+            if state is None:
+                unknown = True
+            elif state:
+                return index, None
+        if unknown:
+            for later, (werror_all, werror_options, enabled) in enumerate(level_info[index + 1:], index + 1):
+                if any((werror_all or tag in werror_options) and tag is not None and enabled.get(tag)
+                       for tag in tags):
+                    return later, index
+            return len(level_info), index
+    return len(level_info), None
+
@@ -0,0 +1,179 @@
+"""
+harness.py
+====================================
+Runs a compiled program against a set of test cases.
+
+A task is a list of test cases, each with the text fed to the program's standard input,
+the expected standard output and an optional checker. The program is compiled once by
+CodeCompilerEnv and every case runs in its own sandbox, several at a time. The harness is
+a command object, so the grading generator yields it like any other command, blocking or
+async.
+
+Classes:
+
+    TestCase: One test case of a task.
+    TestRunner: Runs a program against every test case of a task.
+
+Functions:
+
+    to_test_case(case): Builds a TestCase from a tuple, dict or TestCase.
+    outputs_match(stdout, expected): Default comparison of an output with the expected one.
+
+Global Variables:
+    case_outcomes: Outcomes a case can have besides the sandbox outcomes.
+"""
+
+import asyncio
+import locale
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .capture import OutputMatcher
+from .sandbox import SandboxCommand
+
+TestCase = namedtuple("TestCase", ["input", "output", "checker"], defaults=(None,))
+TestCase.__doc__ = """
+One test case of a task.
+
+Attributes:
+    input (str): Text written to the program's standard input.
+    output (str): The expected standard output.
+    checker (callable): Optional checker(stdout, expected, input) returning whether the output
+        is accepted, for tasks with more than one correct answer. Must be picklable to be used
+        with CodeCompilerVecEnv.
+"""
+TestCase.__test__ = False  # Not a pytest test class
+
+# A program that exits normally with the wrong output, and a case not run after an early exit
+case_outcomes = ("wrong_answer", "skipped")
+
+
+def to_test_case(case):
+    """
+    Builds a TestCase.
+
+    Args:
+        case (tuple or dict or TestCase): (input, output[, checker]), or a dict with those keys.
+
+    Returns:
+        TestCase: The test case.
+    """
+    if isinstance(case, dict):
+        return TestCase(**case)
+    return TestCase(*case)
+
+
+def outputs_match(stdout, expected):
+    """
+    Compares an output with the expected one, ignoring trailing whitespace on every line and
+    trailing blank lines.
+
+    Args:
+        stdout (str): The output of the program.
+        expected (str): The expected output.
+
+    Returns:
+        bool: Whether the output is accepted.
+    """
+    matcher = OutputMatcher(expected)
+    matcher.feed(stdout.encode(locale.getpreferredencoding(False)))
+    return matcher.finish()
+
+
+class TestRunner:
+    """
+    Runs a program against every test case of a task, in parallel.
+
+    Attributes:
+        args (str): The shell command running the program.
+        cases (list): The TestCases.
+        limits (dict): Resource limits of every run, see coderl.sandbox.SandboxCommand.
+        workers (int): Number of cases run at a time.
+        early_exit (bool): Whether to stop starting cases after the first failure.
+
+    Methods:
+        run(cwd, env): Runs the cases and waits for them.
+        arun(cwd, env): Runs the cases on the running asyncio event loop.
+    """
+
+    __test__ = False  # Not a pytest test class
+
+    def __init__(self, args, cases, limits=None, workers=None, early_exit=False):
+        self.args = args
+        self.cases = [to_test_case(case) for case in cases]
+        self.limits = {} if limits is None else limits
+        self.workers = workers or os.cpu_count() or 1
+        self.early_exit = early_exit
+
+    def _command(self, case):
+        expected = case.output if case.checker is None else None
+        return SandboxCommand(self.args, self.limits, case.input, expected)
+
+    def _result(self, case, result, seconds):
+        if result is None:
+            outcome = "skipped"
+        elif result.outcome != "ok":
+            outcome = result.outcome
+        else:
+            if case.checker is not None:
+                accepted = case.checker(result.stdout, case.output, case.input)
+            else:
+                # Compared while the output streamed in
+                accepted = result.matched
+            outcome = "ok" if accepted else "wrong_answer"
+        return {
+            "passed": outcome == "ok",
+            "outcome": outcome,
+            "returncode": None if result is None else result.returncode,
+            "time": seconds,
+        }
+
+    def run(self, cwd=None, env=None):
+        """
+        Runs the cases and waits for them.
+
+        Args:
+            cwd (str): Directory to run the program in. Defaults to the current directory.
+            env (dict): Environment of the program. Defaults to the current environment.
+
+        Returns:
+            list: One dict per case, in order, with passed, outcome, returncode and time.
+        """
+        stop = threading.Event()
+
+        def run_case(case):
+            if stop.is_set():
+                return self._result(case, None, 0.0)
+            start = time.perf_counter()
+            result = self._command(case).run(cwd, env)
+            case_result = self._result(case, result, time.perf_counter() - start)
+            if self.early_exit and not case_result["passed"]:
+                stop.set()
+            return case_result
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(run_case, self.cases))
+
+    async def arun(self, cwd=None, env=None):
+        """
+        Asynchronous version of run.
+        """
+        semaphore = asyncio.Semaphore(self.workers)
+        stop = False
+
+        async def run_case(case):
+            nonlocal stop
+            async with semaphore:
+                if stop:
+                    return self._result(case, None, 0.0)
+                start = time.perf_counter()
+                result = await self._command(case).arun(cwd, env)
+                case_result = self._result(case, result, time.perf_counter() - start)
+                if self.early_exit and not case_result["passed"]:
+                    stop = True
+                return case_result
+
+        return list(await asyncio.gather(*(run_case(case) for case in self.cases)))
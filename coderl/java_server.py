@@ -0,0 +1,248 @@
+"""
+java_server.py
+====================================
+A warm JVM that compiles and runs Java steps without starting a new JVM each time.
+
+The server (resources/JavaGradingServer.java) compiles sources in memory through the
+javax.tools compiler API, with the same options javac would get, and runs Main in a fresh
+classloader with stdout and stderr captured, keeping the head and tail of each stream like
+the sandbox does. Requests go to the server's stdin and responses come back on a pipe of their
+own, so a program writing to the JVM's stdout cannot corrupt them. The server is restarted when it crashes, when the program calls System.exit, or when a request
+times out.
+
+Classes:
+
+    JavaServer: Client and lifecycle manager for one JavaGradingServer process.
+    JavaCommand: A request to the server, executed in place of a shell command while grading.
+"""
+
+import asyncio
+import hashlib
+import os
+import select
+import signal
+import struct
+import subprocess
+import threading
+import time
+
+from .capture import BoundedCapture
+from .sandbox import SandboxResult
+from .utils import cache_dir
+
+COMPILE = 1
+RUN = 2
+PING = 3
+EXITED = -2 ** 31
+
+server_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "JavaGradingServer.java")
+
+# Start-up oriented JVM settings: the server is long-lived but handles small programs
+default_jvm_args = ["-XX:+UseSerialGC", "-XX:TieredStopAtLevel=1", "-Xshare:auto"]
+
+
+class JavaServer:
+    """
+    Client and lifecycle manager for one JavaGradingServer process. Requests are serialized,
+    so one server grades one step at a time.
+
+    Attributes:
+        java (str): The java launcher.
+        javac (str): The javac used to build the server itself.
+        jvm_args (list): Extra arguments for the JVM.
+        restarts (int): Number of times the server died (crash, System.exit or timeout) and had to be restarted.
+
+    Methods:
+        command(op, *fields): Builds a JavaCommand for the grading generator.
+        call(op, cwd, *fields, timeout): Sends one request and waits for the response.
+        close(): Stops the server.
+    """
+
+    def __init__(self, java="java", javac="javac", jvm_args=None):
+        """
+        Initializes the client. The server is built and started on the first request.
+
+        Args:
+            java (str): The java launcher. Defaults to "java".
+            javac (str): The javac used to build the server. Defaults to "javac".
+            jvm_args (list): Extra arguments for the JVM. Defaults to default_jvm_args.
+        """
+        self.java = java
+        self.javac = javac
+        self.jvm_args = default_jvm_args if jvm_args is None else jvm_args
+        self.restarts = 0
+        self._process = None
+        self._responses = None
+        self._lock = threading.Lock()
+
+    def _classpath(self):
+        with open(server_source, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()[:16]
+        classpath = os.path.join(cache_dir(), "java-server", digest)
+        if not os.path.exists(os.path.join(classpath, "JavaGradingServer.class")):
+            os.makedirs(classpath, exist_ok=True)
+            result = subprocess.run([self.javac, "-d", classpath, server_source], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"Could not build the Java grading server:\n{result.stderr}")
+        return classpath
+
+    def _start(self):
+        classpath = self._classpath()
+        responses, write = os.pipe()
+        try:
+            self._process = subprocess.Popen([self.java] + self.jvm_args + ["-cp", classpath, "JavaGradingServer",
+                                                                            f"/proc/self/fd/{write}"],
+                                             stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL, pass_fds=(write,))
+        except BaseException:
+            os.close(responses)
+            raise
+        finally:
+            os.close(write)
+        self._responses = responses
+
+    def _stop(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+            self._process.stdin.close()
+            os.close(self._responses)
+            self._process = None
+            self._responses = None
+
+    def _read(self, size, deadline):
+        fd = self._responses
+        chunks = []
+        while size:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise TimeoutError
+            chunk = os.read(fd, size)
+            if not chunk:
+                raise EOFError
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _read_capture(self, deadline):
+        # The bytes the server kept (the head and tail of the stream), then how many were written
+        size, = struct.unpack(">i", self._read(4, deadline))
+        kept = self._read(size, deadline)
+        total, = struct.unpack(">q", self._read(8, deadline))
+        capture = BoundedCapture(None if total == len(kept) else len(kept))
+        capture.feed(kept)
+        capture.total = total
+        return capture
+
+    def command(self, op, *fields):
+        """
+        Builds a JavaCommand that sends a request when the grading generator's driver runs it.
+
+        Args:
+            op (int): COMPILE or RUN.
+            *fields (str): Request fields after the working directory: the source path and the
+                options for COMPILE, the output limit in bytes (empty for none) for RUN.
+
+        Returns:
+            JavaCommand: The command.
+        """
+        return JavaCommand(self, op, fields)
+
+    def call(self, op, cwd, *fields, timeout=None):
+        """
+        Sends one request and waits for the response, restarting the server if needed.
+
+        Args:
+            op (int): COMPILE, RUN or PING.
+            cwd (str): The step's working directory. Relative paths in fields resolve against it.
+            *fields (str): The remaining request fields.
+            timeout (float): Seconds to wait for the response. Defaults to no limit.
+
+        Returns:
+            tuple: (returncode, stdout, stderr), the outputs as coderl.capture.BoundedCapture or,
+            when the server died without answering, empty strings. A timed out request reports
+            -SIGKILL.
+        """
+        message = struct.pack(">i", op)
+        for field in (os.path.abspath(cwd or "."),) + tuple(fields):
+            data = field.encode("utf-8")
+            message += struct.pack(">i", len(data)) + data
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if self._process is not None and self._process.poll() is not None:
+                self._stop()
+                self.restarts += 1
+            if self._process is None:
+                self._start()
+            try:
+                self._process.stdin.write(message)
+                self._process.stdin.flush()
+                returncode, = struct.unpack(">i", self._read(4, deadline))
+                stdout = self._read_capture(deadline)
+                stderr = self._read_capture(deadline)
+            except TimeoutError:
+                self._stop()
+                self.restarts += 1
+                return -signal.SIGKILL, "", ""
+            except (EOFError, BrokenPipeError):
+                # The JVM died without answering: report its exit status as the program's
+                returncode = self._process.wait()
+                self._stop()
+                self.restarts += 1
+                return returncode, "", ""
+            if returncode == EXITED:
+                # The program called System.exit; the shutdown hook sent its output
+                returncode = self._process.wait()
+                self._stop()
+                self.restarts += 1
+            return returncode, stdout, stderr
+
+    def close(self):
+        """
+        Stops the server.
+        """
+        with self._lock:
+            self._stop()
+
+
+class JavaCommand:
+    """
+    A request to a JavaServer. The grading generator yields it in place of a shell command,
+    and the executor runs it through run or arun.
+
+    Attributes:
+        args (str): A shell-like description of the request, used when the result is printed.
+        timeout (float): Seconds to wait for the response, after which the server is killed.
+    """
+
+    def __init__(self, server, op, fields, timeout=None):
+        self.server = server
+        self.op = op
+        self.fields = fields
+        self.timeout = timeout
+        self.args = f"javac {fields[1]} {fields[0]}" if op == COMPILE else "java Main"
+
+    def run(self, cwd=None, env=None):
+        """
+        Sends the request and waits for the response.
+
+        Args:
+            cwd (str): The step's working directory.
+            env (dict): Unused, the server keeps its own environment.
+
+        Returns:
+            coderl.sandbox.SandboxResult: The response, shaped like the result of the shell command.
+        """
+        returncode, stdout, stderr = self.server.call(self.op, cwd, *self.fields, timeout=self.timeout)
+        timed_out = self.timeout is not None and returncode == -signal.SIGKILL
+        return SandboxResult(self.args, returncode, stdout, stderr, timed_out)
+
+    async def arun(self, cwd=None, env=None):
+        """
+        Asynchronous version of run. The pipe is served from a thread, so the event loop keeps running.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, cwd, env)
@@ -21,14 +21,30 @@ Global Variables:
     defaultConfigCPP: Dictionary containing the default configuration for C++.
     defaultConfigCUDA: Dictionary containing the default configuration for CUDA.
     defaultConfigSystemVerilog: Dictionary containing the default configuration for SystemVerilog.
+    default_configs: The default configurations above, keyed by their "lang".
 """
 
+import asyncio
+import logging
+import os
+import time
+
 import gym
 import subprocess
 from gym import spaces
+from . import coalesce, diagnostics, executor, golang, grading, java_server, memfd
+from .actions import SourceSpace, as_source, as_text, batch_sources
+from .harness import TestRunner
+from .metrics import StepTrace
+from .pch import PchCache, header_languages
+from .sandbox import SandboxCommand, default_limits
+from .scratch import ScratchPool
+from . import toolchains, tuning
 from .utils import check_c_compiler, check_java_compiler, language_check_functions
 # from .utils import check_c_compiler
 
+logger = logging.getLogger(__name__)
+
 defaultConfig = {
     "lang": "c",
     "reward_levels": [("", -4), ("-Werror", -3), ("-Werror -Wall", -2), ("-Werror -Wall -Wextra", -1)],
@@ -53,6 +69,7 @@ defaultConfigJava = {
     "compiler_path": "javac", # Currently not supported
     "execute": True,
     "run_command":"java Main",
+    "sandbox": {"memory": None},  # The JVM reserves more address space than the default limit
     "pre_flag":"",
     "post_flag":"",
     "input_filename": "Main.java",
@@ -67,14 +84,16 @@ defaultConfigGo = {
     "reward_levels": [("build", -1)],  # Simplified, as Go does not use the same flags as gcc or javac
     "compiler_path": "go",  # For compilation
     "execute": True,
-    "run_command": "go run {input_file}",  # For execution
+    "run_command": "./{run_file}",  # The binary built by 'go build' is run directly
     "pre_flag": "",
-    "post_flag": "",
+    "post_flag": "-o main_executable",  # go build takes its flags before the file
     "input_filename": "main.go",  # Go files typically use the .go extension
     "io_args": "",
-    "output_filename": "",  # 'go run' does not need an output file specified
+    "output_filename": "",
     "post_output_args": "",
-    "run_file": "main.go"
+    "run_file": "main_executable",
+    "go_cache": True,  # Shared, pre-warmed GOCACHE (True for the coderl cache directory, or a path)
+    "timings": True  # Report compile_time and run_time in info
 }
 
 defaultConfigPHP = {
@@ -93,6 +112,18 @@ echo "Hello, World!";
 }
 
 
+grading_modes = ("ladder", "single", "bisect")
+
+# Front-end only checks run first by the staged pipeline, per language
+syntax_commands = {
+    "c": "{command} {pre_flag} -fsyntax-only {flags} {post_flag} {input_filename}",
+    "cpp": "{command} {pre_flag} -fsyntax-only {flags} {post_flag} {input_filename}",
+    "go": "gofmt -e -l {input_filename}",
+}
+
+# Languages whose warning levels are compiled to an object file and linked once, by the staged pipeline
+object_languages = ("c", "cpp")
+
 
 class CodeCompilerEnv(gym.Env):
     """
@@ -108,25 +139,85 @@ class CodeCompilerEnv(gym.Env):
         io_args (str): Additional arguments for input/output processing.
         output_filename (str): Name of the output file generated after compilation.
         post_output_args (str): Additional arguments after output file is generated.
-        pre_flag (str): Additional flags before the main compiler command.
+        pre_flag (str): Additional flags before the main compiler command, followed by the flags
+            of the tuned setup, if any.
         post_flag (str): Additional flags after the main compiler command.
         run_file (str): Name of the file to run after compilation.
-        action_space (gym.spaces): Gym space representing the action space.
+        tuning (coderl.tuning.Setup): The compiler and flags calibrated for this host and
+            configuration by coderl.tuning, or forced by config["tuning"]; None (the default
+            compiler and flags) when there is no calibration or config["tuning"] is False.
+        toolchain (coderl.toolchains.Toolchain): The detected compiler, probed on first use.
+        command (str): The command used to invoke the compiler, or None if none is installed.
+        cache (coderl.db.CompileCache): Cache of step results, or None.
+        scratch (coderl.scratch.ScratchPool): Private scratch directories the steps run in. They are
+            created under config["scratch_dir"], by default on /dev/shm when it allows execution.
+        java_server (coderl.java_server.JavaServer): Warm JVM that compiles and runs Java steps when
+            config["java_server"] is set, or None.
+        pch (coderl.pch.PchCache): Precompiled headers for the leading includes of C and C++ samples
+            when config["pch"] is set (True, or the directory to keep them in), or None. The
+            headers are trimmed to config["pch_max_bytes"] (4 GiB by default).
+        staged (bool): config["staged"]; when set, a step first runs a front-end only check
+            (config["syntax_command"], or the language's entry in syntax_commands), then the
+            reward levels, compiled without linking where the language allows it, then a single
+            link once the first level passes, whether or not the program is executed. info holds the last stage reached and every stage's
+            time.
+        stage_rewards (dict): Rewards for failing the "syntax" and "link" stages, from
+            config["stage_rewards"]. Both default to the reward of the first level.
+        limits (dict): Resource limits of the run phase, config["sandbox"] merged over
+            coderl.sandbox.default_limits, or None when config["sandbox"] is False. Programs run
+            in their own process group, which is killed when the wall-clock limit expires. At most
+            limits["output"] bytes of each output stream are kept, and info["stdout_truncated"] or
+            info["stderr_truncated"] is set when the middle of a stream was dropped.
+        run_rewards (dict): Rewards for runs ending in the "timeout", "oom", "signal" or "error"
+            outcome, from config["run_rewards"]. An outcome without a reward keeps the reward of
+            the compile stages. info["outcome"] holds the outcome of every failed run.
+        timings (bool): config["timings"]; when set, info also holds the wall time of every stage
+            (write_time, compile_time, run_time, ...) in seconds, and info["trace"] lists every
+            stage run with its time, exit code and output sizes.
+        metrics (coderl.metrics.Metrics): Aggregates the traces of every step, or None.
+        store (coderl.db.TrajectoryStore): Records every step, or None. Steps answered by the
+            cache, or shared with an identical request graded at the same time, are recorded
+            with that origin and without stage timings.
+        grading (str): How the reward levels are evaluated. "ladder" (default) compiles once per
+            level, "single" compiles once and classifies the diagnostics, "bisect" binary
+            searches the levels. All modes assign the same rewards.
+        coalesce (str): config["coalesce"], the normalization under which identical requests are
+            coalesced ("exact" for True, "whitespace" or "tokens"), or None. See coderl.coalesce.
+        batch_stats (dict): Dedup statistics of the last astep_many batch when coalescing.
+        memfd (bool): config["memfd"] on Linux; when set, the program is built into an anonymous
+            memory file (coderl.memfd) and run from there, instead of being written to the
+            scratch directory. The source is still written there, so diagnostics are unchanged.
+        diagnostics (dict): Parsing options from config["diagnostics"] (True, or a dict with
+            limit and message_limit), or None. When set, a step that fails to build returns
+            info["diagnostics"], the deduplicated and capped diagnostics in the column-wise
+            layout of coderl.diagnostics, instead of info["stderr"]. gcc and g++ report them
+            as JSON.
+        action_space (coderl.actions.SourceSpace): Sources of up to config["max_source_bytes"]
+            (default 64 KiB) bytes, as str, bytes-like buffers or 1-D uint8 arrays.
         observation_space (gym.spaces): Gym space representing the observation space.
 
     Methods:
         step(action): Executes one step of the environment's dynamics.
+        astep(action): Asynchronous version of step.
+        astep_many(actions, concurrency): Grades several actions concurrently on the event loop.
+        coalesce_key(action, tests): The coalescing key of a request.
         reset(): Resets the environment to an initial state.
         render(mode='human'): Renders one frame of the environment. (Not implemented)
-        close(): Performs any necessary cleanup. (Not implemented)
+        close(): Removes the environment's scratch directories and stops the Java server.
     """
 
-    def __init__(self, config= defaultConfig):
+    def __init__(self, config= defaultConfig, cache=None, metrics=None, store=None):
         """
         Initializes the CodeCompilerEnv environment with a given configuration.
 
         Args:
             config (dict): A dictionary containing configuration parameters. Defaults to defaultConfig.
+            cache (coderl.db.CompileCache): Optional cache of step results, shared by every env it is
+                passed to. Defaults to None (no caching).
+            metrics (coderl.metrics.Metrics): Optional metrics that every graded step is added to.
+                Defaults to None.
+            store (coderl.db.TrajectoryStore): Optional store that every step is recorded in.
+                Defaults to None.
         """
         super(CodeCompilerEnv, self).__init__()
         self.reward_levels = config["reward_levels"]
@@ -139,54 +230,412 @@ class CodeCompilerEnv(gym.Env):
         self.pre_flag = config ["pre_flag"]
         self.post_flag = config ["post_flag"]
         self.run_file = config ["run_file"]
+        self.tuning = tuning.setup(config)
+        if self.tuning is not None and self.tuning.flags:
+            self.pre_flag = f"{self.pre_flag} {self.tuning.flags}".strip()
+        self.grading = config.get("grading", "ladder")
+        if self.grading not in grading_modes:
+            raise ValueError(f"Unknown grading mode '{self.grading}', expected one of {grading_modes}")
+        self._single_flags = grading.single_compile_flags(self.reward_levels)
+        self._levels = False
         # Define the action and observation spaces
-        repr_out, self.command = language_check_functions[config['lang']]()
-        print(repr_out)
-        self.action_space = spaces.Box(low=0, high=255, shape=(1000,), dtype='uint8')  # Placeholder
+        self._toolchain = False
+        self.cache = cache
+        self.metrics = metrics
+        self.store = store
+        self.scratch = ScratchPool(config.get("scratch_dir"))
+        self.java_server = java_server.JavaServer() if config.get("java_server") else None
+        self.pch = None
+        if config.get("pch"):
+            if config["lang"] not in header_languages:
+                raise ValueError(f"Precompiled headers are not supported for '{config['lang']}'")
+            self.pch = PchCache(None if config["pch"] is True else config["pch"], config.get("pch_max_bytes"))
+        self.staged = bool(config.get("staged"))
+        self._syntax_command = config.get("syntax_command", syntax_commands.get(config["lang"]))
+        if self.staged and self._syntax_command is None:
+            raise ValueError(f"No front-end only check is known for '{config['lang']}', set syntax_command")
+        self._objects = self.staged and config["lang"] in object_languages and self.java_server is None
+        self._object_filename = os.path.splitext(self.input_filename)[0] + ".o"
+        self.stage_rewards = dict({"syntax": self.reward_levels[0][1], "link": self.reward_levels[0][1]},
+                                  **config.get("stage_rewards", {}))
+        limits = config.get("sandbox", {})
+        self.limits = None if limits is False else dict(default_limits, **(limits if isinstance(limits, dict) else {}))
+        self.run_rewards = config.get("run_rewards", {})
+        self.coalesce = "exact" if config.get("coalesce") is True else config.get("coalesce")
+        if self.coalesce and self.coalesce not in coalesce.normalizations:
+            raise ValueError(f"Unknown normalization '{self.coalesce}', expected one of {coalesce.normalizations}")
+        self.batch_stats = None
+        self.memfd = bool(config.get("memfd")) and memfd.supported
+        if self.memfd and not (self.output_filename and self.output_filename == self.run_file and self.java_server is None):
+            raise ValueError(f"In-memory executables need a configuration that runs the file it builds, "
+                             f"which '{config['lang']}' does not")
+        options = config.get("diagnostics")
+        self.diagnostics = dict({"limit": 20, "message_limit": 512}, **(options if isinstance(options, dict) else {})) \
+            if options else None
+        self._env = None
+        self._prepared = False
+        self.action_space = SourceSpace(config.get("max_source_bytes", 65536))
         self.observation_space = spaces.Discrete(2)  # Success or failure
 
-    def step(self, action):
+    @property
+    def toolchain(self):
+        # Probed lazily so that building an env never spawns the compiler
+        if self._toolchain is False:
+            self._toolchain = toolchains.registry.get(self.config["lang"], self.tuning and self.tuning.command)
+        return self._toolchain
+
+    @property
+    def command(self):
+        return self.toolchain.command if self.toolchain else None
+
+    def step(self, action, tests=None):
         """
         Executes one step of the environment's dynamics. It involves writing the action (code) 
         to a file, compiling it with increasing levels of warnings, and optionally executing it.
+        All files live in a private scratch directory, so environments never share them.
+
+        With test cases, the program is compiled once and run against every case, up to
+        config["test_workers"] (default: the number of CPUs) at a time. The reward is the
+        fraction of cases passed, info["tests"] holds one result per case, and with
+        config["early_exit"] no case is started after the first failure.
+
+        With config["coalesce"], a step whose request is already being graded by another
+        thread waits for that result, see coderl.coalesce.
+
+        Args:
+            action (str or bytes-like): The source code to be compiled and executed: a str, or
+                UTF-8 bytes, bytearray, memoryview or 1-D uint8 array, written to the source
+                file without being copied. See coderl.actions.
+            tests (list): Optional test cases, as coderl.harness.TestCase, (input, output[, checker])
+                tuples or dicts.
+
+        Returns:
+            tuple: A tuple containing the observation, reward, done status, and additional info.
+        """
+        action = as_source(action)
+        key = self.coalesce_key(action, tests)
+        if key is None:
+            return self._cached_step(action, tests)
+        result, shared = coalesce.flight.do(key, lambda: self._cached_step(action, tests))
+        if shared and self.store is not None:
+            self.store.record(action, self.config, result, "shared", tests=tests)
+        return result
+
+    async def astep(self, action, tests=None):
+        """
+        Asynchronous version of step. Commands run as asyncio subprocesses, so grading does
+        not block the event loop. Each call works in its own scratch directory, which makes
+        concurrent calls on one environment safe. The result is the same as step's.
+
+        Args:
+            action (str): The source code to be compiled and executed.
+            tests (list): Optional test cases, as for step.
+
+        Returns:
+            tuple: A tuple containing the observation, reward, done status, and additional info.
+        """
+        action = as_source(action)
+        key = (await self._acoalesce_keys([action], [tests]))[0]
+        if key is None:
+            return await self._acached_step(action, tests)
+        result, shared = await coalesce.flight.ado(key, lambda: self._acached_step(action, tests))
+        if shared and self.store is not None:
+            self.store.record(action, self.config, result, "shared", tests=tests)
+        return result
+
+    async def astep_many(self, actions, concurrency=None, tests=None, lengths=None):
+        """
+        Grades several actions concurrently with astep.
+
+        With config["coalesce"], every distinct request of the batch is graded once, and
+        self.batch_stats holds the dedup statistics of the batch (see coderl.coalesce.batch_stats).
+
+        Args:
+            actions (list or numpy.ndarray): The source codes to be compiled and executed, as for
+                step, or a 2-D uint8 matrix with one source per row.
+            concurrency (int): Maximum number of steps in flight. Defaults to the number of CPUs.
+            tests (list): Optional test cases of every action, in the same order as actions.
+            lengths (sequence): The length in bytes of every row of an actions matrix.
+
+        Returns:
+            list: The (observation, reward, done, info) tuples, in the same order as actions.
+        """
+        semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+        actions = [as_source(action) for action in batch_sources(actions, lengths)]
+        tests = [None] * len(actions) if tests is None else tests
+        keys = await self._acoalesce_keys(actions, tests)
+        first, index = coalesce.dedupe(keys)
+
+        async def bounded_step(position):
+            action, action_tests = actions[position], tests[position]
+            async with semaphore:
+                if keys[position] is None:
+                    return await self._acached_step(action, action_tests), False
+                return await coalesce.flight.ado(keys[position], lambda: self._acached_step(action, action_tests))
+
+        results = await asyncio.gather(*(bounded_step(position) for position in first))
+        if self.coalesce:
+            self.batch_stats = coalesce.batch_stats(len(actions), len(first), sum(shared for _, shared in results))
+            logger.debug("Coalesced batch: %s", self.batch_stats)
+        if self.store is not None:
+            for position, entry in enumerate(index):
+                if results[entry][1] or position != first[entry]:
+                    self.store.record(actions[position], self.config, results[entry][0], "shared", tests=tests[position])
+        return [results[entry][0] if position == first[entry] else coalesce.copy_result(results[entry][0])
+                for position, entry in enumerate(index)]
+
+    def coalesce_key(self, action, tests=None):
+        """
+        Computes the coalescing key of a request.
+
+        Args:
+            action (str): The source code.
+            tests (list): Optional test cases.
+
+        Returns:
+            str: The key, or None when config["coalesce"] is not set or a checker of the test
+                cases has no stable name.
+        """
+        if not self.coalesce:
+            return None
+        command = self.command if self.coalesce == "tokens" else None
+        return coalesce.request_key(action, self.config, tests, self.coalesce, command)
+
+    async def _acoalesce_keys(self, actions, tests):
+        if self.coalesce == "tokens":
+            # Preprocessing runs a compiler; keep it off the event loop
+            return await asyncio.to_thread(lambda: [self.coalesce_key(*request) for request in zip(actions, tests)])
+        return [self.coalesce_key(action, action_tests) for action, action_tests in zip(actions, tests)]
+
+    def _cached_step(self, action, tests=None):
+        """
+        Grades the action in a scratch directory, through the result cache.
+        """
+        key = self.cache.key(action, self.config, self.toolchain, tests) if self.cache is not None else None
+        result = self.cache.get(key) if key is not None else None
+        if result is not None and self.store is not None:
+            self.store.record(action, self.config, result, "cache", tests=tests)
+        if result is None:
+            self._prepare()
+            workdir = self.scratch.acquire()
+            try:
+                result = self._step(action, workdir, tests)
+            finally:
+                self.scratch.release(workdir)
+            if key is not None:
+                self.cache.put(key, result)
+        return result
+
+    async def _acached_step(self, action, tests=None):
+        """
+        Asynchronous version of _cached_step.
+        """
+        key = self.cache.key(action, self.config, self.toolchain, tests) if self.cache is not None else None
+        result = self.cache.get(key) if key is not None else None
+        if result is not None and self.store is not None:
+            self.store.record(action, self.config, result, "cache", tests=tests)
+        if result is None:
+            self._prepare()
+            workdir = self.scratch.acquire()
+            try:
+                result = await self._adrive(self._grade(action, workdir, tests), workdir, self._env)
+            finally:
+                self.scratch.release(workdir)
+            if key is not None:
+                self.cache.put(key, result)
+        return result
+
+    def _step(self, action, workdir=None, tests=None):
+        """
+        Grades the action without consulting the cache.
+
+        Args:
+            action (str): The source code to be compiled and executed.
+            workdir (str): Scratch directory to write and compile the code in. Defaults to the current directory.
+            tests (list): Optional test cases, as for step.
+
+        Returns:
+            tuple: A tuple containing the observation, reward, done status, and additional info.
+        """
+        return self._drive(self._grade(action, workdir, tests), workdir, self._env)
+
+    def _prepare(self):
+        """
+        One-time setup done on the first step rather than at construction: builds the command
+        environment and warms the Go build cache when config["go_cache"] is set.
+        """
+        if self._prepared:
+            return
+        if self.config.get("go_cache"):
+            self._env = golang.go_environment(self.config["go_cache"])
+            golang.warm_go_cache(self.command, self._env, self.config.get("go_warm_packages"))
+        self._prepared = True
+
+    @staticmethod
+    def _drive(grader, workdir, env=None):
+        """
+        Runs a grading generator to completion, executing the commands it yields.
+
+        Args:
+            grader (generator): A generator returned by _grade.
+            workdir (str): Directory the commands run in.
+            env (dict): Environment of the commands. Defaults to the current environment.
+
+        Returns:
+            tuple: The value returned by the generator.
+        """
+        result = None
+        try:
+            while True:
+                result = executor.run(grader.send(result), cwd=workdir, env=env)
+        except StopIteration as stop:
+            return stop.value
+
+    @staticmethod
+    async def _adrive(grader, workdir, env=None):
+        """
+        Asynchronous version of _drive.
+        """
+        result = None
+        try:
+            while True:
+                result = await executor.arun(grader.send(result), cwd=workdir, env=env)
+        except StopIteration as stop:
+            return stop.value
+
+    def _grade(self, action, workdir=None, tests=None):
+        """
+        Describes one step as a generator: it yields every shell command to run, receives
+        the corresponding subprocess.CompletedProcess, and returns the step result.
+
+        Args:
+            action (str): The source code to be compiled and executed.
+            workdir (str): Directory to write the code to. Defaults to the current directory.
+            tests (list): Optional test cases, as for step.
+
+        Returns:
+            tuple: A tuple containing the observation, reward, done status, and additional info.
+        """
+        binary = memfd.MemoryFile(self.output_filename) if self.memfd else None
+        try:
+            return (yield from self._grade_step(action, workdir, tests, binary))
+        finally:
+            if binary is not None:
+                binary.close()
+
+    def _grade_step(self, action, workdir, tests, binary):
+        """
+        The body of _grade.
 
         Args:
             action (str): The source code to be compiled and executed.
+            workdir (str): Directory to write the code to.
+            tests (list): Optional test cases, as for step.
+            binary (coderl.memfd.MemoryFile): The memory file the program is built into, or
+                None to build it in workdir.
 
         Returns:
             tuple: A tuple containing the observation, reward, done status, and additional info.
         """
 
-        # Convert action (code) into a file
-        with open(self.input_filename, 'w') as file:
+        if tests is not None and self.java_server is not None:
+            raise ValueError("Test cases need standard input, which the Java server does not provide")
+        cases = None
+
+        trace = StepTrace()
+        # Convert action (code) into a file; byte buffers are written as they are
+        start = time.perf_counter()
+        action = as_source(action)
+        with open(os.path.join(workdir or "", self.input_filename), 'w' if isinstance(action, str) else 'wb') as file:
             file.write(action)
+        trace.record("write", time.perf_counter() - start)
 
         # Define the reward levels
         reward_levels = self.reward_levels
         reward = reward_levels[0][1]  # Default reward if compilation fails without flags
         errored = False;
-        # Compiling with increasing levels of warnings
-        for flags, reward_value in reward_levels:
-            result = subprocess.run(f"{self.command} {self.pre_flag} {flags} {self.post_flag} {self.input_filename} {self.io_args} {self.output_filename} {self.post_output_args}", shell=True, capture_output=True, text=True)
-            print("compile result", result)
-
+        output = binary.path if binary is not None else self.output_filename
+        prelude = self.pch.prelude(as_text(action)) if self.pch is not None else None
+        stage = "syntax"
+        if self.staged:
+            # Rejecting samples that do not parse costs a fraction of a build
+            result = yield from self._syntax_check(trace, prelude)
             if result.returncode != 0:
-                reward = reward_value
-                errored = True;
-                break
+                reward = self.stage_rewards["syntax"]
+                errored = True
+        if self._objects:
+            # Failed compiles leave the object alone, so it must not be one of a previous step
+            try:
+                os.remove(os.path.join(workdir or "", self._object_filename))
+            except FileNotFoundError:
+                pass
+        level = 0  # The first failing reward level
+        if (not errored) and self.grading == "ladder":
+            stage = "compile"
+            # Compiling with increasing levels of warnings
+            for level, (flags, reward_value) in enumerate(reward_levels):
+                result = yield from self._compile(flags, trace, prelude, output)
+
+                if result.returncode != 0:
+                    reward = reward_value
+                    errored = True;
+                    break
+            else:
+                level = len(reward_levels)
+        elif not errored:
+            stage = "compile"
+            level, result = yield from self._grade_levels(trace, prelude, output)
+            if level < len(reward_levels):
+                reward = reward_levels[level][1]
+                errored = True
+        if self._objects and level > 0:
+            # Unlinked builds pass the first level without linking; a program that does not
+            # link fails that level, whatever warning level it reached and whether or not it runs
+            link = yield from self._link(trace, output)
+            if link.returncode != 0:
+                stage, result = "link", link
+                reward = self.stage_rewards["link"]
+                errored = True
         # Check runtime success
         if (not errored) and (self.execute == True):
-            run_command = self.config["run_command"].format(
-                run_file=f"{self.run_file}"
-            )
-
-            result = subprocess.run(run_command, shell=True, capture_output=True, text=True)
-            print("run result", result)
-            if result.returncode == 0:
+            if binary is not None:
+                # The memory file has an absolute path, so "./{run_file}" loses its "./"
+                run_command = self.config["run_command"].replace("./{run_file}", "{run_file}").format(
+                    run_file=binary.seal()
+                )
+            else:
+                run_command = self.config["run_command"].format(
+                    run_file=f"{self.run_file}"
+                )
+
+            if tests is not None:
+                # Compiled once, run against every test case
+                run_command = TestRunner(run_command, tests, self.limits, self.config.get("test_workers"),
+                                         self.config.get("early_exit", False))
+            elif self.java_server is not None:
+                output = None if self.limits is None else self.limits.get("output")
+                run_command = self.java_server.command(java_server.RUN, "" if output is None else str(output))
+                if self.limits is not None:
+                    run_command.timeout = self.limits.get("wall_time")
+            elif self.limits is not None:
+                run_command = SandboxCommand(run_command, self.limits)
+            stage = "run"
+            start = time.perf_counter()
+            result = yield run_command
+            if tests is not None:
+                trace.record("run", time.perf_counter() - start, cases=len(result))
+            else:
+                trace.record("run", time.perf_counter() - start, result)
+            logger.debug("run result %s", result)
+            if tests is not None:
+                cases = result
+                passed = sum(case["passed"] for case in cases)
+                reward = 1 if passed == len(cases) else passed / len(cases)
+            elif result.returncode == 0:
                 reward = 1
-                # TODO: Further checks for test cases can be implemented here
-                # If all test cases pass:
-                # reward = 10
+            else:
+                outcome = getattr(result, "outcome", "error")
+                reward = self.run_rewards.get(outcome, reward)
         if reward == 1:
             observation = 1 # success
         else:
@@ -197,13 +646,199 @@ class CodeCompilerEnv(gym.Env):
 
         info = {}
 
-        if result.returncode == 0:
+        if cases is not None:
+            info["tests"] = cases
+        elif self.diagnostics is not None and errored:
+            # Also covers "single" grading, whose classifying compile succeeds with warnings
+            info["diagnostics"] = diagnostics.parse(result.stderr, **self.diagnostics)
+        elif result.returncode == 0 and not errored:
             info["stdout"] = result.stdout
         else:
             info["stderr"] = result.stderr
+            if stage == "run":
+                info["outcome"] = getattr(result, "outcome", "error")
+        for stream in ("stdout", "stderr"):
+            if getattr(result, f"{stream}_truncated", False):
+                info[f"{stream}_truncated"] = True
+        if self.staged:
+            info["stage"] = stage
+        if self.config.get("timings") or self.staged:
+            info.update(trace.timings())
+        if self.config.get("timings"):
+            info["trace"] = trace.events
+        if self.metrics is not None:
+            self.metrics.observe(trace, reward, stage)
+        if self.store is not None:
+            self.store.record(action, self.config, (observation, reward, True, info), "graded", stage, trace, tests)
 
         return observation, reward, True, info  # Sample observation, reward, done, info
 
+    def _compile(self, flags, trace, prelude=None, output=None):
+        """
+        Compiles the input file once with the given reward level flags.
+
+        Args:
+            flags (str): The flags of one reward level.
+            trace (coderl.metrics.StepTrace): The step's trace, which gets a "compile" event.
+            prelude (str): The sample's leading includes, precompiled when the PCH cache is enabled.
+            output (str): Path of the program. Defaults to config["output_filename"].
+
+        Returns:
+            subprocess.CompletedProcess: The result of the compiler run.
+        """
+        start = time.perf_counter()
+        level_flags = flags
+        if self.java_server is not None:
+            result = yield self.java_server.command(java_server.COMPILE, self.input_filename,
+                                                    f"{self.pre_flag} {flags} {self.post_flag}")
+        elif self._objects:
+            flags = (yield from self._pch_flags(flags, prelude)) + self._diagnostics_flag()
+            result = yield f"{self.command} {self.pre_flag} {flags} {self.post_flag} -c {self.input_filename} {self.io_args} {self._object_filename}"
+        else:
+            flags = (yield from self._pch_flags(flags, prelude)) + self._diagnostics_flag()
+            result = yield f"{self.command} {self.pre_flag} {flags} {self.post_flag} {self.input_filename} {self.io_args} {output or self.output_filename} {self.post_output_args}"
+        trace.record("compile", time.perf_counter() - start, result, flags=level_flags)
+        logger.debug("compile result %s", result)
+        return result
+
+    def _pch_flags(self, flags, prelude):
+        """
+        Adds the precompiled prelude of the sample to a compile's flags when the PCH cache is
+        enabled, building the header first if needed.
+
+        Args:
+            flags (str): The flags of one reward level.
+            prelude (str): The sample's leading includes.
+
+        Returns:
+            str: The flags to compile with.
+        """
+        if self.pch is not None:
+            header = yield from self.pch.header(self.command, self.config["lang"],
+                                                f"{self.pre_flag} {flags} {self.post_flag}", prelude, self.toolchain)
+            if header is not None:
+                flags = f"{flags} -include {header}"
+        return flags
+
+    def _diagnostics_flag(self):
+        """
+        Returns the flag asking the compiler for JSON diagnostics when config["diagnostics"] is
+        set and the compiler is gcc or g++, else an empty string.
+        """
+        if (self.diagnostics is not None and self.config["lang"] in diagnostics.json_languages
+                and self.toolchain is not None and self.toolchain.vendor == "GNU"):
+            return " -fdiagnostics-format=json"
+        return ""
+
+    def _syntax_check(self, trace, prelude=None):
+        """
+        Runs the front-end only check of the staged pipeline.
+
+        Args:
+            trace (coderl.metrics.StepTrace): The step's trace, which gets a "syntax" event.
+            prelude (str): The sample's leading includes, precompiled when the PCH cache is enabled.
+
+        Returns:
+            subprocess.CompletedProcess: The result of the check.
+        """
+        start = time.perf_counter()
+        flags = (yield from self._pch_flags("", prelude)) + self._diagnostics_flag()
+        result = yield self._syntax_command.format(command=self.command, pre_flag=self.pre_flag, flags=flags,
+                                                   post_flag=self.post_flag, input_filename=self.input_filename)
+        trace.record("syntax", time.perf_counter() - start, result)
+        logger.debug("syntax result %s", result)
+        return result
+
+    def _link(self, trace, output=None):
+        """
+        Links the object file compiled by the staged pipeline into the executable.
+
+        Args:
+            trace (coderl.metrics.StepTrace): The step's trace, which gets a "link" event.
+            output (str): Path of the executable. Defaults to config["output_filename"].
+
+        Returns:
+            subprocess.CompletedProcess: The result of the link.
+        """
+        start = time.perf_counter()
+        result = yield f"{self.command} {self.pre_flag} {self.post_flag} {self._object_filename} {self.io_args} {output or self.output_filename} {self.post_output_args}"
+        trace.record("link", time.perf_counter() - start, result)
+        logger.debug("link result %s", result)
+        return result
+
+    def _level_info(self):
+        """
+        Collects, for every reward level, the -Werror settings and the warnings the level
+        enables. Computed once per environment.
+
+        Returns:
+            list: One (werror_all, werror_options, enabled) tuple per level, or None if the
+            toolchain or the reward levels cannot be classified from diagnostics.
+        """
+        if self._levels is not False:
+            return self._levels
+        self._levels = None
+        lang_flag = grading.classifiable_languages.get(self.config["lang"])
+        if lang_flag is None or self._single_flags is None:
+            return None
+        levels = []
+        for flags, _ in self.reward_levels:
+            _, werror_all, werror_options = grading.split_werror(flags)
+            enabled = grading.enabled_warnings(self.command, lang_flag, f"{self.pre_flag} {flags} {self.post_flag}")
+            if enabled is None:
+                return None
+            levels.append((werror_all, werror_options, enabled))
+        self._levels = levels
+        return levels
+
+    def _grade_levels(self, trace, prelude=None, output=None):
+        """
+        Finds the first failing reward level without walking the whole ladder.
+
+        In "single" mode the source is compiled once with every warning enabled and the
+        diagnostics are mapped back to the levels that would reject them. Warnings that
+        cannot be classified, and toolchains that cannot be classified at all, fall back
+        to compiling the strictest level first and binary searching the rest.
+
+        Args:
+            trace (coderl.metrics.StepTrace): The step's trace, passed on to _compile.
+            prelude (str): The sample's leading includes, passed on to _compile.
+            output (str): Path of the program, passed on to _compile.
+
+        Returns:
+            tuple: The index of the first failing level (len(reward_levels) if all pass) and
+            the compiler result to report in info. A level rejected by the "single" compile
+            reports that compile, whose stderr holds the warnings as warnings.
+        """
+        reward_levels = self.reward_levels
+        lo, hi = 0, len(reward_levels)
+        level_info = self._level_info() if self.grading == "single" else None
+        if level_info is not None:
+            result = yield from self._compile(self._single_flags, trace, prelude, output)
+            if result.returncode != 0:
+                return 0, result
+            first_fail, first_unknown = grading.classify(grading.warning_tags(result.stderr), level_info)
+            if first_unknown is None:
+                return first_fail, result
+            lo, hi = first_unknown, first_fail
+        else:
+            # Most samples are either clean or broken outright, so try the strictest level first
+            result = yield from self._compile(reward_levels[-1][0], trace, prelude, output)
+            if result.returncode == 0:
+                return len(reward_levels), result
+            hi = len(reward_levels) - 1
+
+        # Binary search, assuming that once a level fails every stricter level fails too
+        results = {}
+        while lo < hi:
+            mid = (lo + hi) // 2
+            results[mid] = yield from self._compile(reward_levels[mid][0], trace, prelude, output)
+            if results[mid].returncode != 0:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo, results.get(lo, result)
+
     def reset(self):
         """
         Resets the environment to an initial state. Generates a new sample observation. MUST be redefined for custom environments.
@@ -226,9 +861,11 @@ class CodeCompilerEnv(gym.Env):
 
     def close(self):
         """
-        Performs any necessary cleanup. (Currently not implemented)
+        Removes the environment's scratch directories and stops the Java server.
         """
-        pass
+        self.scratch.close()
+        if self.java_server is not None:
+            self.java_server.close()
 
 defaultConfigCSharp = {
     "lang": "cs",
@@ -289,6 +926,10 @@ defaultConfigSystemVerilog = {
     "run_file": "temp_output"
 }
 
+default_configs = {config["lang"]: config for config in (
+    defaultConfig, defaultConfigJava, defaultConfigGo, defaultConfigPHP, defaultConfigCSharp,
+    defaultConfigCPP, defaultConfigCUDA, defaultConfigSystemVerilog)}
+
 
 if __name__ == "__main__":
     env = CodeCompilerEnv(defaultConfigCUDA)
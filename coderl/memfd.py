@@ -0,0 +1,79 @@
+"""
+memfd.py
+====================================
+Anonymous in-memory files for the programs built by a step.
+
+On Linux, a step can keep the binary it builds in a memfd instead of a file in its scratch
+directory. The compiler (or linker) writes to the memfd through its /proc path. The binary
+is then reopened read-only, so it can be executed, and the run command execs it through the
+same path, which is what fexecve does. Nothing is written to or removed from a filesystem,
+every step has its own memfd so names never collide, and binaries run even where the scratch
+directory is mounted noexec.
+
+Classes:
+
+    MemoryFile: An anonymous memory file addressed by path.
+
+Global Variables:
+    supported: Whether this platform has memfd_create and /proc fd paths.
+"""
+
+import os
+
+supported = hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd")
+
+
+class MemoryFile:
+    """
+    An anonymous memory file that the commands of a step address by path. Child processes of
+    this process (compilers, shells, the program) can open it through path.
+
+    Attributes:
+        path (str): The /proc path of the file.
+
+    Methods:
+        seal(): Drops write access, so the file can be executed.
+        size(): The size of the file.
+        close(): Releases the file.
+    """
+
+    def __init__(self, name="coderl"):
+        """
+        Creates the file.
+
+        Args:
+            name (str): Name shown for the file in /proc. Defaults to "coderl".
+        """
+        self._fd = os.memfd_create(name or "coderl", os.MFD_CLOEXEC)
+
+    @property
+    def path(self):
+        return f"/proc/{os.getpid()}/fd/{self._fd}"
+
+    def seal(self):
+        """
+        Reopens the file read-only. Linux refuses to execute a file while a writable descriptor
+        to it is open (ETXTBSY).
+
+        Returns:
+            str: The path of the read-only file.
+        """
+        read_only = os.open(f"/proc/self/fd/{self._fd}", os.O_RDONLY | os.O_CLOEXEC)
+        os.close(self._fd)
+        self._fd = read_only
+        return self.path
+
+    def size(self):
+        """
+        Returns:
+            int: The size of the file in bytes.
+        """
+        return os.fstat(self._fd).st_size
+
+    def close(self):
+        """
+        Releases the file.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,224 @@
+"""
+metrics.py
+====================================
+Per-step instrumentation and aggregated metrics of CodeCompilerEnv.
+
+Every step records a StepTrace: one event per stage (writing the source, each compile, the
+link and the run) with its wall time, exit code and output sizes. With config["timings"]
+the trace is attached to info. A Metrics object passed to the environment aggregates the
+traces of every step into counters and histograms. They can be exported in the Prometheus
+text format or streamed to a callback.
+
+Classes:
+
+    StepTrace: The stage events of one step.
+    Histogram: A cumulative histogram.
+    Metrics: Counters and histograms aggregated over steps.
+
+Global Variables:
+    time_buckets: Upper bounds, in seconds, of the duration histograms.
+    byte_buckets: Upper bounds, in bytes, of the output size histograms.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+
+time_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+byte_buckets = (0, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _output_bytes(result, stream):
+    size = getattr(result, f"{stream}_bytes", None)
+    if size is None:
+        text = getattr(result, stream, None)
+        size = len(text.encode()) if isinstance(text, str) else len(text or b"")
+    return size
+
+
+class StepTrace:
+    """
+    The stage events of one step.
+
+    Attributes:
+        events (list): One dict per stage run, in order, with stage, time and, for commands,
+            returncode, stdout_bytes and stderr_bytes. Compile events also hold their flags.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, stage, seconds, result=None, **fields):
+        """
+        Records one stage.
+
+        Args:
+            stage (str): "write", "syntax", "compile", "link" or "run".
+            seconds (float): Wall time of the stage.
+            result (subprocess.CompletedProcess): The result of the stage's command, if any.
+            **fields: Extra fields of the event.
+        """
+        event = dict(stage=stage, time=seconds, **fields)
+        if result is not None and hasattr(result, "returncode"):
+            event["returncode"] = result.returncode
+            event["stdout_bytes"] = _output_bytes(result, "stdout")
+            event["stderr_bytes"] = _output_bytes(result, "stderr")
+        self.events.append(event)
+
+    def timings(self):
+        """
+        Sums the wall time of every stage.
+
+        Returns:
+            dict: compile_time (always present), and write_time, syntax_time, link_time and
+            run_time for the stages that ran.
+        """
+        timings = {"compile_time": 0.0}
+        for event in self.events:
+            key = f"{event['stage']}_time"
+            timings[key] = timings.get(key, 0.0) + event["time"]
+        return timings
+
+
+class Histogram:
+    """
+    A cumulative histogram in the Prometheus layout.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Counters and histograms aggregated over the steps of every environment it is passed to.
+
+    Each process keeps its own Metrics; CodeCompilerVecEnv workers get copies of the object.
+    Give every worker its own file with "{pid}" in path, or aggregate through the callback.
+
+    Attributes:
+        path (str): Prometheus text file written by write(), or None.
+        write_interval (float): Seconds between the automatic writes of path after a step.
+        callback (callable): Called with a dict (reward, stage, time, events) after every step,
+            or None.
+
+    Methods:
+        observe(trace, reward, stage): Adds one step.
+        prometheus(): Renders the metrics in the Prometheus text format.
+        write(path): Writes the Prometheus text file.
+    """
+
+    def __init__(self, path=None, callback=None, write_interval=10.0):
+        """
+        Initializes empty metrics.
+
+        Args:
+            path (str): Prometheus text file written by write(), for the node exporter's
+                textfile collector. "{pid}" is replaced by the process id. Defaults to None.
+            callback (callable): Called with every step's record. Defaults to None.
+            write_interval (float): When path is set, observe() rewrites it at most this often,
+                so pool workers export without being asked. Defaults to 10 seconds.
+        """
+        self.path = path
+        self.callback = callback
+        self.write_interval = write_interval
+        self._written = time.monotonic()
+        self._lock = threading.Lock()
+        self.steps = defaultdict(int)
+        self.commands = defaultdict(int)
+        self.stage_seconds = defaultdict(lambda: Histogram(time_buckets))
+        self.step_seconds = Histogram(time_buckets)
+        self.output_bytes = defaultdict(lambda: Histogram(byte_buckets))
+
+    def __getstate__(self):
+        # Sent to pool workers: every worker starts from empty metrics
+        return {"path": self.path, "callback": self.callback, "write_interval": self.write_interval}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def observe(self, trace, reward, stage):
+        """
+        Adds one step.
+
+        Args:
+            trace (StepTrace): The step's trace.
+            reward (float): The step's reward.
+            stage (str): The last stage the step reached.
+        """
+        total = sum(event["time"] for event in trace.events)
+        with self._lock:
+            self.steps[stage] += 1
+            self.step_seconds.observe(total)
+            for event in trace.events:
+                self.stage_seconds[event["stage"]].observe(event["time"])
+                if "returncode" in event:
+                    self.commands[event["stage"], event["returncode"]] += 1
+                    self.output_bytes[event["stage"], "stdout"].observe(event["stdout_bytes"])
+                    self.output_bytes[event["stage"], "stderr"].observe(event["stderr_bytes"])
+        if self.callback is not None:
+            self.callback({"reward": reward, "stage": stage, "time": total, "events": trace.events})
+        if self.path is not None and time.monotonic() - self._written >= self.write_interval:
+            self._written = time.monotonic()
+            self.write()
+
+    @staticmethod
+    def _histogram_lines(name, labels, histogram):
+        lines = []
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+        labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {histogram.sum}")
+        lines.append(f"{name}_count{labels} {histogram.count}")
+        return lines
+
+    def prometheus(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            lines = ["# HELP coderl_steps_total Graded steps, by the last stage reached.",
+                     "# TYPE coderl_steps_total counter"]
+            lines += [f'coderl_steps_total{{stage="{stage}"}} {count}' for stage, count in sorted(self.steps.items())]
+            lines += ["# HELP coderl_commands_total Commands run, by stage and exit code.",
+                      "# TYPE coderl_commands_total counter"]
+            lines += [f'coderl_commands_total{{stage="{stage}",returncode="{code}"}} {count}'
+                      for (stage, code), count in sorted(self.commands.items(), key=str)]
+            lines += ["# HELP coderl_step_seconds Wall time of a step.", "# TYPE coderl_step_seconds histogram"]
+            lines += self._histogram_lines("coderl_step_seconds", "", self.step_seconds)
+            lines += ["# HELP coderl_stage_seconds Wall time of a stage.", "# TYPE coderl_stage_seconds histogram"]
+            for stage, histogram in sorted(self.stage_seconds.items()):
+                lines += self._histogram_lines("coderl_stage_seconds", f'stage="{stage}",', histogram)
+            lines += ["# HELP coderl_output_bytes Bytes written by a command, by stage and stream.",
+                      "# TYPE coderl_output_bytes histogram"]
+            for (stage, stream), histogram in sorted(self.output_bytes.items()):
+                lines += self._histogram_lines("coderl_output_bytes", f'stage="{stage}",stream="{stream}",', histogram)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """
+        Writes the Prometheus text file atomically.
+
+        Args:
+            path (str): The file. Defaults to the path given at construction.
+        """
+        path = (path or self.path).format(pid=os.getpid())
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.prometheus())
+        os.replace(temporary, path)
@@ -0,0 +1,204 @@
+"""
+pch.py
+====================================
+Precompiled header cache for the C and C++ configurations.
+
+Most samples start with the same block of system includes (often ``<bits/stdc++.h>``), and
+parsing those headers is most of every compile. The leading ``#include <...>`` block of a
+sample is its prelude; the cache builds a ``.gch`` for each prelude once per compiler and
+flag set, and later compiles load it with ``-include``. The sample is compiled unchanged:
+the prelude ends before the first header meant to be included more than once, and the others
+have include guards, so its own include lines are skipped once the precompiled header is
+loaded. Samples without a prelude, or whose prelude does not build, are compiled normally. A
+prelude that failed to build is retried once the compiler changes, and the least recently
+used headers are deleted when the cache grows past its size limit.
+
+Classes:
+
+    PchCache: Builds and looks up precompiled headers.
+
+Global Variables:
+    header_languages: The -x language used to precompile headers, per configuration language.
+    unguarded_headers: Standard headers without include guards, which end a prelude.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+from .utils import cache_dir
+
+header_languages = {"c": "c-header", "cpp": "c++-header"}
+
+# Their contents depend on NDEBUG at every inclusion
+unguarded_headers = {"assert.h", "cassert"}
+
+_include = re.compile(r"#\s*include\s*<([^<>]+)>")
+_comment = re.compile(r"//.*|/\*.*?\*/")
+
+
+class PchCache:
+    """
+    Builds precompiled headers on demand and looks them up. Headers are built by the grading
+    generator, so a build runs like any other command of the step, blocking or async. Several
+    processes can share a cache directory: every header is written under a temporary name and
+    renamed into place.
+
+    Attributes:
+        root (str): Directory the precompiled headers are stored in.
+        max_bytes (int): Total size of the precompiled headers the cache is trimmed to.
+        hits (int): Compiles that used an existing precompiled header.
+        builds (int): Precompiled headers built.
+        fallbacks (int): Compiles done without a precompiled header.
+
+    Methods:
+        prelude(source): Extracts the leading block of system includes of a source.
+        header(compiler, lang, flags, prelude): Generator returning the header to -include.
+        stats(): Returns the counters.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        """
+        Initializes the cache. Nothing is built until a header is requested.
+
+        Args:
+            root (str): Directory the precompiled headers are stored in. Defaults to pch in the
+                coderl cache directory.
+            max_bytes (int): Size limit of the precompiled headers. Defaults to 4 GiB.
+        """
+        self.root = root or os.path.join(cache_dir(), "pch")
+        self.max_bytes = 4 * 1024 ** 3 if max_bytes is None else max_bytes
+        self.hits = 0
+        self.builds = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prelude(source):
+        """
+        Extracts the leading block of system includes of a source. Blank lines and comments
+        are skipped; the block ends at the first other line or unguarded header.
+
+        Args:
+            source (str): The source code.
+
+        Returns:
+            str: The include lines, normalized and joined by newlines, or None if the source
+                does not start with a system include.
+        """
+        includes = []
+        for line in source.splitlines():
+            line = _comment.sub("", line).strip()
+            if not line:
+                continue
+            match = _include.fullmatch(line)
+            if match is None or match.group(1).strip() in unguarded_headers:
+                break
+            includes.append(re.sub(r"#\s*include\s*", "#include ", line))
+        return "\n".join(includes) or None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def header(self, compiler, lang, flags, prelude, toolchain=None):
+        """
+        Generator returning the header to pass to -include for one compile, building its
+        precompiled form first if needed. Yields the build command, if any, and receives its
+        subprocess.CompletedProcess.
+
+        Args:
+            compiler (str): The compiler command.
+            lang (str): The configuration language, a key of header_languages.
+            flags (str): Every flag of the compile; the header is only valid for the same flags.
+            prelude (str): The prelude returned by prelude(), or None.
+            toolchain (coderl.toolchains.Toolchain): The compiler's toolchain, so that a
+                compiler upgrade builds new headers.
+
+        Returns:
+            str: Absolute path of the header, or None to compile without a precompiled header.
+        """
+        if prelude is None:
+            self._count("fallbacks")
+            return None
+        key = json.dumps([compiler, lang, " ".join(flags.split()), prelude, toolchain and list(toolchain)])
+        directory = os.path.join(self.root, hashlib.sha256(key.encode()).hexdigest()[:32])
+        header = os.path.join(directory, "prelude.h")
+        try:
+            # The modification time orders the headers for eviction
+            os.utime(header + ".gch")
+            self._count("hits")
+            return header
+        except FileNotFoundError:
+            pass
+        compiler_id = self._compiler_id(compiler)
+        try:
+            with open(header + ".failed") as file:
+                failed = file.read() == compiler_id
+        except FileNotFoundError:
+            failed = False
+        if failed:
+            self._count("fallbacks")
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{header}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "w") as file:
+            file.write(prelude + "\n")
+        os.replace(temporary, header)
+        result = yield (f"{compiler} {flags} -x {header_languages[lang]} {header} -o {temporary}.gch"
+                        f" && mv -f {temporary}.gch {header}.gch")
+        if result.returncode != 0:
+            # The prelude does not compile on its own (or with these flags): not again with
+            # this compiler
+            with open(temporary, "w") as file:
+                file.write(compiler_id)
+            os.replace(temporary, header + ".failed")
+            self._count("fallbacks")
+            return None
+        self._count("builds")
+        self._evict(header + ".gch")
+        return header
+
+    @staticmethod
+    def _compiler_id(compiler):
+        # The path and modification time of the compiler's executable
+        path = shutil.which(compiler.split()[0]) if compiler.split() else None
+        try:
+            return json.dumps([path, os.stat(path).st_mtime_ns])
+        except (OSError, TypeError):
+            return json.dumps([path, None])
+
+    def _evict(self, keep):
+        # Deletes the least recently used precompiled headers until the rest fit in max_bytes.
+        # Only the .gch files go: a compile using one that disappears reads the prelude instead.
+        headers = []
+        for entry in os.scandir(self.root):
+            try:
+                stat = os.stat(os.path.join(entry.path, "prelude.h.gch"))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            headers.append((stat.st_mtime, stat.st_size, os.path.join(entry.path, "prelude.h.gch")))
+        total = sum(size for _, size, _ in headers)
+        for _, size, path in sorted(headers):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        """
+        Returns the counters.
+
+        Returns:
+            dict: hits, builds and fallbacks.
+        """
+        return {"hits": self.hits, "builds": self.builds, "fallbacks": self.fallbacks}
@@ -0,0 +1,336 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.StringWriter;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileManager;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived compile-and-run worker for coderl's Java configuration.
+ *
+ * Requests arrive on stdin and responses leave on the file named by the first argument (a pipe
+ * the client passed down), so nothing a program writes to the JVM's own stdout can corrupt them.
+ * Both are framed with DataInput/DataOutput: every request is an int opcode followed by UTF-8
+ * strings (int length + bytes), and every response is an int return code followed by the
+ * captured stdout and stderr, each as the bytes kept (int length + bytes) and a long count of
+ * the bytes written.
+ *
+ * COMPILE(workdir, path, options) compiles one source file in memory with javax.tools and keeps
+ * the resulting classes. RUN(workdir, output) runs Main.main from those classes in a fresh
+ * classloader with System.out/err captured. Of each stream only the first and last bytes are
+ * kept, up to output bytes in total, or everything when output is empty. If the program calls System.exit, a shutdown hook sends the
+ * output captured so far with EXITED as return code and the client reads the real exit status
+ * from the process.
+ */
+public class JavaGradingServer {
+    static final int COMPILE = 1;
+    static final int RUN = 2;
+    static final int PING = 3;
+    static final int EXITED = Integer.MIN_VALUE;
+
+    static DataOutputStream protocol;
+    static Map<String, byte[]> classes = new HashMap<>();
+    static volatile BoundedOutput runOut;
+    static volatile BoundedOutput runErr;
+
+    /** Keeps the first and last bytes written, up to limit bytes in total, and counts them all. */
+    static class BoundedOutput extends OutputStream {
+        final long limit;
+        final ByteArrayOutputStream head = new ByteArrayOutputStream();
+        final byte[] tail;
+        int tailStart;
+        int tailSize;
+        long total;
+
+        BoundedOutput(long limit) {
+            this.limit = limit;
+            this.tail = new byte[limit < 0 ? 0 : (int) (limit / 2)];
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] data, int offset, int length) {
+            total += length;
+            if (limit < 0) {
+                head.write(data, offset, length);
+                return;
+            }
+            int room = (int) Math.min(length, limit - limit / 2 - head.size());
+            head.write(data, offset, room);
+            offset += room;
+            length -= room;
+            if (length >= tail.length) {
+                System.arraycopy(data, offset + length - tail.length, tail, 0, tail.length);
+                tailStart = 0;
+                tailSize = tail.length;
+                return;
+            }
+            for (int i = 0; i < length; i++) {
+                tail[(tailStart + tailSize) % tail.length] = data[offset + i];
+                if (tailSize < tail.length) {
+                    tailSize++;
+                } else {
+                    tailStart = (tailStart + 1) % tail.length;
+                }
+            }
+        }
+
+        synchronized void writeTo(DataOutputStream out) throws IOException {
+            out.writeInt(head.size() + tailSize);
+            head.writeTo(out);
+            for (int i = 0; i < tailSize; i++) {
+                out.write(tail[(tailStart + i) % tail.length]);
+            }
+            out.writeLong(total);
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        DataInputStream in = new DataInputStream(new BufferedInputStream(new FileInputStream(FileDescriptor.in)));
+        protocol = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(args[0])));
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        Runtime.getRuntime().addShutdownHook(new Thread(JavaGradingServer::reportExit));
+
+        while (true) {
+            int op;
+            try {
+                op = in.readInt();
+            } catch (EOFException e) {
+                return;
+            }
+            if (op == COMPILE) {
+                String workdir = readString(in);
+                String path = readString(in);
+                String options = readString(in);
+                compile(compiler, Paths.get(workdir).resolve(path), options);
+            } else if (op == RUN) {
+                readString(in);
+                String output = readString(in);
+                run(output.isEmpty() ? -1 : Long.parseLong(output));
+            } else if (op == PING) {
+                respond(0, "", "");
+            } else {
+                respond(2, "", "unknown request " + op);
+            }
+        }
+    }
+
+    static String readString(DataInputStream in) throws IOException {
+        byte[] data = new byte[in.readInt()];
+        in.readFully(data);
+        return new String(data, StandardCharsets.UTF_8);
+    }
+
+    static synchronized void respond(int code, BoundedOutput stdout, BoundedOutput stderr) throws IOException {
+        protocol.writeInt(code);
+        stdout.writeTo(protocol);
+        stderr.writeTo(protocol);
+        protocol.flush();
+    }
+
+    static void respond(int code, String stdout, String stderr) throws IOException {
+        BoundedOutput out = new BoundedOutput(-1);
+        BoundedOutput err = new BoundedOutput(-1);
+        out.write(stdout.getBytes(StandardCharsets.UTF_8));
+        err.write(stderr.getBytes(StandardCharsets.UTF_8));
+        respond(code, out, err);
+    }
+
+    static void compile(JavaCompiler compiler, Path source, String options) throws IOException {
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+        StandardJavaFileManager standard = compiler.getStandardFileManager(diagnostics, Locale.getDefault(), null);
+        Map<String, byte[]> compiled = new HashMap<>();
+        JavaFileManager manager = new ForwardingJavaFileManager<JavaFileManager>(standard) {
+            @Override
+            public JavaFileObject getJavaFileForOutput(Location location, String className, JavaFileObject.Kind kind,
+                                                       FileObject sibling) {
+                return new SimpleJavaFileObject(URI.create("mem:///" + className.replace('.', '/') + kind.extension), kind) {
+                    @Override
+                    public OutputStream openOutputStream() {
+                        return new ByteArrayOutputStream() {
+                            @Override
+                            public void close() {
+                                compiled.put(className, toByteArray());
+                            }
+                        };
+                    }
+                };
+            }
+        };
+        List<String> optionList = new ArrayList<>();
+        for (String option : options.trim().split("\\s+")) {
+            if (!option.isEmpty()) {
+                optionList.add(option);
+            }
+        }
+        StringWriter other = new StringWriter();
+        boolean ok;
+        try {
+            ok = compiler.getTask(other, manager, diagnostics, optionList, null,
+                    standard.getJavaFileObjects(source.toFile())).call();
+        } catch (RuntimeException e) {
+            respond(2, "", e.toString() + "\n");
+            return;
+        } finally {
+            manager.close();
+        }
+        StringBuilder err = new StringBuilder(other.toString());
+        int errors = 0;
+        int warnings = 0;
+        for (Diagnostic<? extends JavaFileObject> diagnostic : diagnostics.getDiagnostics()) {
+            err.append(format(diagnostic));
+            if (diagnostic.getKind() == Diagnostic.Kind.ERROR) {
+                errors++;
+            } else if (diagnostic.getKind() == Diagnostic.Kind.WARNING || diagnostic.getKind() == Diagnostic.Kind.MANDATORY_WARNING) {
+                warnings++;
+            }
+        }
+        if (errors > 0) {
+            err.append(errors).append(errors == 1 ? " error\n" : " errors\n");
+        }
+        if (warnings > 0) {
+            err.append(warnings).append(warnings == 1 ? " warning\n" : " warnings\n");
+        }
+        if (ok) {
+            classes = compiled;
+        }
+        respond(ok ? 0 : 1, "", err.toString());
+    }
+
+    // Mirrors the layout of the javac command line: "File.java:3: error: message", the source line and a caret
+    static String format(Diagnostic<? extends JavaFileObject> diagnostic) {
+        String kind = diagnostic.getKind() == Diagnostic.Kind.ERROR ? "error" : "warning";
+        String message = diagnostic.getMessage(Locale.getDefault());
+        if (diagnostic.getSource() == null || diagnostic.getLineNumber() == Diagnostic.NOPOS) {
+            return kind + ": " + message + "\n";
+        }
+        String name = Paths.get(diagnostic.getSource().toUri()).getFileName().toString();
+        StringBuilder text = new StringBuilder();
+        String[] lines = message.split("\n", 2);
+        text.append(name).append(':').append(diagnostic.getLineNumber()).append(": ").append(kind).append(": ")
+                .append(lines[0]).append('\n');
+        try {
+            String[] source = diagnostic.getSource().getCharContent(true).toString().split("\n", -1);
+            int line = (int) diagnostic.getLineNumber() - 1;
+            if (line >= 0 && line < source.length) {
+                text.append(source[line]).append('\n');
+                char[] padding = new char[(int) Math.max(0, diagnostic.getColumnNumber() - 1)];
+                Arrays.fill(padding, ' ');
+                text.append(padding).append("^\n");
+            }
+        } catch (IOException e) {
+            // The source line is decoration only
+        }
+        if (lines.length > 1) {
+            text.append(lines[1]).append('\n');
+        }
+        return text.toString();
+    }
+
+    static void run(long output) throws IOException {
+        Map<String, byte[]> program = classes;
+        ClassLoader loader = new ClassLoader(ClassLoader.getPlatformClassLoader()) {
+            @Override
+            protected Class<?> findClass(String name) throws ClassNotFoundException {
+                byte[] data = program.get(name);
+                if (data == null) {
+                    throw new ClassNotFoundException(name);
+                }
+                return defineClass(name, data, 0, data.length);
+            }
+        };
+        BoundedOutput out = new BoundedOutput(output);
+        BoundedOutput err = new BoundedOutput(output);
+        PrintStream savedOut = System.out;
+        PrintStream savedErr = System.err;
+        InputStream savedIn = System.in;
+        runOut = out;
+        runErr = err;
+        System.setOut(new PrintStream(out, true));
+        System.setErr(new PrintStream(err, true));
+        System.setIn(new ByteArrayInputStream(new byte[0]));
+        int[] code = {0};
+        Thread thread = new Thread(() -> {
+            try {
+                Method main = loader.loadClass("Main").getMethod("main", String[].class);
+                main.invoke(null, (Object) new String[0]);
+            } catch (InvocationTargetException e) {
+                System.err.print("Exception in thread \"main\" ");
+                e.getCause().printStackTrace();
+                code[0] = 1;
+            } catch (ClassNotFoundException | NoSuchMethodException e) {
+                System.err.println("Error: Could not find or load main class Main");
+                System.err.println("Caused by: " + e);
+                code[0] = 1;
+            } catch (Throwable e) {
+                e.printStackTrace();
+                code[0] = 1;
+            }
+        }, "main");
+        thread.setContextClassLoader(loader);
+        thread.start();
+        try {
+            thread.join();
+        } catch (InterruptedException e) {
+            Thread.currentThread().interrupt();
+        }
+        System.out.flush();
+        System.err.flush();
+        System.setOut(savedOut);
+        System.setErr(savedErr);
+        System.setIn(savedIn);
+        runOut = null;
+        runErr = null;
+        respond(code[0], out, err);
+    }
+
+    static void reportExit() {
+        BoundedOutput out = runOut;
+        BoundedOutput err = runErr;
+        if (out == null) {
+            return;
+        }
+        try {
+            System.out.flush();
+            System.err.flush();
+            respond(EXITED, out, err);
+        } catch (IOException e) {
+            // The client falls back to an empty output
+        }
+    }
+}
@@ -0,0 +1,396 @@
+"""
+sandbox.py
+====================================
+Resource-limited execution of the programs graded by CodeCompilerEnv.
+
+A program runs in a process group of its own with resource limits applied before it
+starts, by the prlimit utility of util-linux, or by a Python wrapper that sets them on itself
+and execs the shell when prlimit is not installed. When the wall-clock limit expires the whole group is killed, so runaway loops,
+fork bombs and background children cannot stall a worker. Every run is classified into an
+outcome that the environment turns into a reward.
+
+Classes:
+
+    SandboxCommand: A shell command run under resource limits.
+    SandboxResult: subprocess.CompletedProcess with the outcome of the run.
+
+Functions:
+
+    classify(returncode, stderr, timed_out, limits, oom_killed): Classifies the end of a run.
+
+Global Variables:
+    default_limits: Limits applied when the configuration does not set its own.
+    outcomes: The possible outcomes of a run.
+"""
+
+import asyncio
+import json
+import locale
+import os
+import re
+import resource
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from .capture import BoundedCapture, OutputMatcher
+
+# Generous enough for ordinary programs. The process limit counts every process and thread of
+# the user running the environment, not only those of the program, and is not enforced for root.
+default_limits = {"wall_time": 10.0, "output": 1024 * 1024, "memory": 4 * 1024 ** 3,
+                  "file_size": 64 * 1024 ** 2, "processes": 4096}
+
+outcomes = ("ok", "error", "timeout", "oom", "signal")
+
+# Messages printed by common runtimes when an allocation fails
+_oom_messages = re.compile(r"std::bad_alloc|Cannot allocate memory|[Oo]ut of memory|OutOfMemoryError|MemoryError")
+
+# rlimit resource and prlimit option for every limit that maps to one; the limits are bytes,
+# seconds or counts
+_rlimits = {
+    "cpu_time": (resource.RLIMIT_CPU, "--cpu"),
+    "memory": (resource.RLIMIT_AS, "--as"),
+    "file_size": (resource.RLIMIT_FSIZE, "--fsize"),
+    "processes": (resource.RLIMIT_NPROC, "--nproc"),
+}
+
+_prlimit = shutil.which("prlimit")
+
+# Sets the rlimits given as JSON in its first argument, then execs the rest of its arguments
+_set_limits = ("import json, os, resource, sys\n"
+               "for limit, soft, hard in json.loads(sys.argv[1]): resource.setrlimit(limit, (soft, hard))\n"
+               "os.execv(sys.argv[2], sys.argv[2:])")
+
+
+def _oom_kill_file():
+    """
+    Finds the file counting the OOM kills of the cgroup this process runs in, memory.events
+    under cgroup v2 or memory.oom_control under v1, or returns None if it cannot be read.
+    """
+    candidates = []
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip("\n").split(":", 2)
+                if hierarchy == "0" and not controllers:
+                    candidates.append(os.path.normpath(f"/sys/fs/cgroup/{path}/memory.events"))
+                elif "memory" in controllers.split(","):
+                    candidates.append(os.path.normpath(f"/sys/fs/cgroup/memory/{path}/memory.oom_control"))
+    except (OSError, ValueError):
+        pass
+    # Inside a cgroup namespace the cgroup of the process is the root of the mount
+    candidates += ["/sys/fs/cgroup/memory.events", "/sys/fs/cgroup/memory/memory.oom_control"]
+    return next((path for path in candidates if os.access(path, os.R_OK)), None)
+
+
+_oom_kill_path = _oom_kill_file()
+
+
+def _oom_kills():
+    """
+    Returns the number of processes the kernel OOM killer killed in the cgroup of this process,
+    or None if unknown.
+    """
+    if _oom_kill_path is None:
+        return None
+    try:
+        with open(_oom_kill_path) as f:
+            for line in f:
+                name, _, count = line.partition(" ")
+                if name == "oom_kill":
+                    return int(count)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _oom_killed(before):
+    """
+    Whether the OOM killer struck the cgroup since its kill count was before.
+    """
+    after = _oom_kills()
+    return before is not None and after is not None and after > before
+
+
+def classify(returncode, stderr, timed_out, limits=None, oom_killed=False):
+    """
+    Classifies the end of a run.
+
+    Programs are started through the shell, which reports a child killed by signal N as
+    exit status 128 + N, so both forms are recognized. A SIGKILL is taken for the hard CPU
+    limit when a cpu_time limit was set. A run is only reported as "oom" on evidence: a failed
+    allocation message on stderr, or a SIGKILL while the kernel OOM killer struck the cgroup.
+
+    Args:
+        returncode (int): The return code of the run.
+        stderr (str): The standard error of the run.
+        timed_out (bool): Whether the wall-clock limit expired.
+        limits (dict): The limits the program ran under, or None if unknown.
+        oom_killed (bool): Whether the OOM kill count of the cgroup grew during the run.
+
+    Returns:
+        str: One of outcomes.
+    """
+    if timed_out:
+        return "timeout"
+    if returncode == 0:
+        return "ok"
+    signum = -returncode if returncode < 0 else returncode - 128 if 128 < returncode < 128 + signal.NSIG else None
+    limits = limits or {}
+    if signum == signal.SIGXCPU or signum == signal.SIGKILL and limits.get("cpu_time") is not None:
+        return "timeout"
+    if _oom_messages.search(stderr or "") or signum == signal.SIGKILL and oom_killed:
+        return "oom"
+    if signum is not None:
+        return "signal"
+    return "error"
+
+
+class SandboxResult(subprocess.CompletedProcess):
+    """
+    The result of a sandboxed run. stdout and stderr are decoded when first read.
+
+    Attributes:
+        outcome (str): One of outcomes.
+        stdout_truncated (bool): Whether the middle of stdout was dropped to respect the output limit.
+        stderr_truncated (bool): Whether the middle of stderr was dropped to respect the output limit.
+        stdout_bytes (int): Bytes the program wrote to stdout, kept or not, or None if unknown.
+        stderr_bytes (int): Bytes the program wrote to stderr, kept or not, or None if unknown.
+        matched (bool): Whether stdout matched the expected output, or None if none was given.
+    """
+
+    def __init__(self, args, returncode, stdout, stderr, timed_out=False, matched=None, limits=None,
+                 oom_killed=False):
+        super().__init__(args, returncode, stdout, stderr)
+        self.stdout_truncated = getattr(stdout, "truncated", False)
+        self.stderr_truncated = getattr(stderr, "truncated", False)
+        self.stdout_bytes = getattr(stdout, "total", None)
+        self.stderr_bytes = getattr(stderr, "total", None)
+        self.matched = matched
+        self._timed_out = timed_out
+        self._limits = limits
+        self._oom_killed = oom_killed
+        self._outcome = None
+
+    @property
+    def stdout(self):
+        if isinstance(self._stdout, BoundedCapture):
+            self._stdout = self._stdout.text()
+        return self._stdout
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = value
+
+    @property
+    def stderr(self):
+        if isinstance(self._stderr, BoundedCapture):
+            self._stderr = self._stderr.text()
+        return self._stderr
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = value
+
+    @property
+    def outcome(self):
+        if self._outcome is None:
+            self._outcome = classify(self.returncode, self.stderr, self._timed_out, self._limits,
+                                     self._oom_killed)
+        return self._outcome
+
+
+class SandboxCommand:
+    """
+    A shell command run under resource limits, in place of a plain command string.
+
+    Output is read as it is produced. At most limits["output"] bytes of each stream are kept
+    (the head and the tail), so a program printing without end cannot exhaust memory.
+
+    Attributes:
+        args (str): The shell command.
+        limits (dict): wall_time and cpu_time in seconds, memory (address space), file_size and
+            output (per captured stream) in bytes, processes as a count. Missing or None limits
+            are not applied. The process limit counts every process of the user and is not
+            enforced for root.
+        input (str): Text written to the program's standard input, or None to inherit it.
+        expected (str): Expected standard output. When given, stdout is compared with it while
+            it streams in and the result's matched attribute holds the verdict.
+
+    Methods:
+        run(cwd, env): Runs the command and waits for it.
+        arun(cwd, env): Runs the command on the running asyncio event loop.
+    """
+
+    chunk_size = 65536
+    # Seconds allowed for the pipes to close once the process group has been killed
+    drain_time = 1.0
+
+    def __init__(self, args, limits=None, input=None, expected=None):
+        self.args = args
+        self.limits = default_limits if limits is None else limits
+        self.input = input
+        self.expected = expected
+
+    def _rlimits(self):
+        # (name, (soft, hard)) for every limit that maps to an rlimit
+        for name, limit in self.limits.items():
+            if name in _rlimits and limit is not None:
+                limit = int(limit)
+                # One extra second of CPU between SIGXCPU and SIGKILL
+                yield name, (limit, limit + 1 if name == "cpu_time" else limit)
+
+    def _argv(self):
+        # The shell is exec'd by a wrapper that set the limits, so they hold from its first
+        # instruction. No code runs between fork and exec, which would not be safe in a
+        # threaded worker.
+        argv = ["/bin/sh", "-c", self.args]
+        limits = list(self._rlimits())
+        if limits and _prlimit is not None:
+            argv = [_prlimit, *(f"{_rlimits[name][1]}={soft}:{hard}" for name, (soft, hard) in limits), "--", *argv]
+        elif limits:
+            limits = [[_rlimits[name][0], soft, hard] for name, (soft, hard) in limits]
+            argv = [sys.executable, "-I", "-S", "-c", _set_limits, json.dumps(limits), *argv]
+        return argv
+
+    def _popen_args(self, cwd, env):
+        stdin = None if self.input is None else subprocess.PIPE
+        return dict(stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env,
+                    start_new_session=True)
+
+    def _sinks(self):
+        stdout = BoundedCapture(self.limits.get("output"))
+        stderr = BoundedCapture(self.limits.get("output"))
+        matcher = None if self.expected is None else OutputMatcher(self.expected)
+        return stdout, stderr, matcher
+
+    def _input_bytes(self):
+        return None if self.input is None else self.input.encode(locale.getpreferredencoding(False))
+
+    @staticmethod
+    def _kill_group(pid):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _pump(self, process, sinks, data, deadline):
+        # Moves data between the pipes and the sinks until every pipe is closed. Returns False
+        # if the deadline passed first.
+        with selectors.DefaultSelector() as selector:
+            for stream, stream_sinks in zip((process.stdout, process.stderr), sinks):
+                selector.register(stream, selectors.EVENT_READ, stream_sinks)
+            if process.stdin is not None and not process.stdin.closed:
+                if data:
+                    os.set_blocking(process.stdin.fileno(), False)
+                    selector.register(process.stdin, selectors.EVENT_WRITE, None)
+                else:
+                    process.stdin.close()
+            while selector.get_map():
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return False
+                for key, _ in selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            written = os.write(key.fd, data[:self.chunk_size])
+                        except BlockingIOError:
+                            continue
+                        except BrokenPipeError:
+                            written = len(data)
+                        data = data[written:]
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            key.fileobj.close()
+                        continue
+                    chunk = os.read(key.fd, self.chunk_size)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        continue
+                    for sink in key.data:
+                        sink.feed(chunk)
+        return True
+
+    def run(self, cwd=None, env=None):
+        """
+        Runs the command and waits for it. Processes it left behind are killed as well.
+
+        Args:
+            cwd (str): Directory to run the command in. Defaults to the current directory.
+            env (dict): Environment of the command. Defaults to the current environment.
+
+        Returns:
+            SandboxResult: The result of the run, with its outcome.
+        """
+        stdout, stderr, matcher = self._sinks()
+        sinks = ([stdout] if matcher is None else [stdout, matcher], [stderr])
+        oom_kills = _oom_kills()
+        process = subprocess.Popen(self._argv(), **self._popen_args(cwd, env))
+        wall_time = self.limits.get("wall_time")
+        timed_out = False
+        with process:
+            data = self._input_bytes()
+            if not self._pump(process, sinks, data, None if wall_time is None else time.monotonic() + wall_time):
+                # A program that exited but left children holding its output did not time out
+                timed_out = process.poll() is None
+                self._kill_group(process.pid)
+                self._pump(process, sinks, b"", time.monotonic() + self.drain_time)
+            self._kill_group(process.pid)
+        return SandboxResult(self.args, process.returncode, stdout, stderr, timed_out,
+                             None if matcher is None else matcher.finish(), self.limits,
+                             _oom_killed(oom_kills))
+
+    async def arun(self, cwd=None, env=None):
+        """
+        Asynchronous version of run.
+        """
+        stdout, stderr, matcher = self._sinks()
+        oom_kills = _oom_kills()
+        process = await asyncio.create_subprocess_exec(*self._argv(), **self._popen_args(cwd, env))
+
+        async def read(stream, sinks):
+            while True:
+                chunk = await stream.read(self.chunk_size)
+                if not chunk:
+                    return
+                for sink in sinks:
+                    sink.feed(chunk)
+
+        async def write(data):
+            try:
+                if data:
+                    process.stdin.write(data)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                process.stdin.close()
+
+        tasks = [read(process.stdout, [stdout] if matcher is None else [stdout, matcher]),
+                 read(process.stderr, [stderr])]
+        if process.stdin is not None:
+            tasks.append(write(self._input_bytes()))
+        pump = asyncio.ensure_future(asyncio.gather(*tasks))
+        try:
+            done, _ = await asyncio.wait({pump}, timeout=self.limits.get("wall_time"))
+        except asyncio.CancelledError:
+            # A cancelled step does not leave its program running
+            self._kill_group(process.pid)
+            pump.cancel()
+            await process.wait()
+            raise
+        timed_out = False
+        if not done:
+            timed_out = process.returncode is None
+            self._kill_group(process.pid)
+            done, _ = await asyncio.wait({pump}, timeout=self.drain_time)
+            if not done:
+                pump.cancel()
+        await process.wait()
+        self._kill_group(process.pid)
+        return SandboxResult(self.args, process.returncode, stdout, stderr, timed_out,
+                             None if matcher is None else matcher.finish(), self.limits,
+                             _oom_killed(oom_kills))
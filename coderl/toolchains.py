@@ -0,0 +1,186 @@
+"""
+toolchains.py
+====================================
+A registry of the compilers and interpreters available on this host.
+
+Each language is probed at most once per process, and only when it is first used. Probe
+results are also kept in a small JSON file in the coderl cache directory, keyed by the
+resolved binary path and its modification time, so new processes usually skip the
+``--version`` spawn entirely.
+
+Classes:
+
+    Toolchain: Structured description of a detected toolchain (command, path, version, vendor).
+    ToolchainRegistry: Memoized, persisted toolchain detection.
+
+Global Variables:
+    toolchain_candidates: Candidate commands per language, in order of preference.
+    registry: The process-wide ToolchainRegistry used by CodeCompilerEnv.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+
+from .utils import cache_dir, language_check_functions
+
+logger = logging.getLogger(__name__)
+
+Toolchain = namedtuple("Toolchain", ["lang", "command", "path", "version", "vendor"])
+Toolchain.__doc__ = """
+    A detected toolchain.
+
+    Attributes:
+        lang (str): The language key, e.g. "c".
+        command (str): The command used to invoke it, e.g. "gcc".
+        path (str): The resolved path of the binary.
+        version (str): The version reported by the binary, or "unknown version".
+        vendor (str): Who ships the toolchain, e.g. "GNU" or "Clang".
+"""
+
+# (command, version arguments, version pattern, vendor); the first group of the pattern is
+# used as the version if it has one
+toolchain_candidates = {
+    "c": [("gcc", ["--version"], r"\d+\.\d+\.\d+", "GNU"), ("clang", ["--version"], r"\d+\.\d+\.\d+", "Clang")],
+    "cpp": [("g++", ["--version"], r"\d+\.\d+\.\d+", "GNU"), ("clang++", ["--version"], r"\d+\.\d+\.\d+", "Clang")],
+    "java": [("javac", ["-version"], r"\d+(?:\.\d+)*", "Java")],
+    "go": [("go", ["version"], r"go\d+\.\d+(?:\.\d+)?", "Go")],
+    "cs": [("csc", ["--version"], r"\d+\.\d+\.\d+", "Microsoft"), ("mcs", ["--version"], r"\d+\.\d+\.\d+", "Mono")],
+    "rust": [("rustc", ["--version"], r"\d+\.\d+\.\d+", "Rust")],
+    "ts": [("tsc", ["--version"], r"\d+\.\d+\.\d+", "Microsoft")],
+    "php": [("php", ["--version"], r"\d+\.\d+\.\d+", "PHP")],
+    "haskell": [("ghc", ["--version"], r"\d+\.\d+\.\d+", "GHC")],
+    "ruby": [("ruby", ["--version"], r"\d+\.\d+\.\d+", "Ruby")],
+    "swift": [("swift", ["--version"], r"\d+\.\d+(?:\.\d+)?", "Swift")],
+    "cuda": [("nvcc", ["--version"], r"release (\d+\.\d+)", "NVIDIA")],
+    "kotlin": [("kotlinc", ["-version"], r"\d+\.\d+\.\d+", "JetBrains")],
+    "js": [("node", ["--version"], r"\d+\.\d+\.\d+", "Node.js")],
+    "systemverilog": [("iverilog", ["-V"], r"\d+\.\d+", "Icarus")],
+}
+
+
+class ToolchainRegistry:
+    """
+    Memoized, persisted toolchain detection.
+
+    Attributes:
+        path (str): Location of the JSON file holding probe results, or None to keep them in memory only.
+
+    Methods:
+        get(lang, command): Returns the Toolchain for a language, probing it if needed.
+        clear(): Forgets every probe result, in memory and on disk.
+    """
+
+    def __init__(self, path=""):
+        """
+        Initializes the registry.
+
+        Args:
+            path (str): JSON file for persisted probe results. Defaults to toolchains.json in the
+                coderl cache directory; None disables persistence.
+        """
+        self._path = path
+        self._toolchains = {}
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path == "":
+            self._path = os.path.join(cache_dir(), "toolchains.json")
+        return self._path
+
+    def get(self, lang, command=None):
+        """
+        Returns the toolchain for a language. The first call per process checks the on-disk
+        record and only spawns the binary if the record is missing or stale.
+
+        Args:
+            lang (str): The language key, e.g. "c".
+            command (str): One of the language's candidate commands, e.g. "clang". Defaults to
+                the first candidate that is installed.
+
+        Returns:
+            Toolchain: The detected toolchain, or None if none of the candidates is installed.
+        """
+        name = lang if command is None else f"{lang}:{command}"
+        with self._lock:
+            if name in self._toolchains:
+                return self._toolchains[name]
+            toolchain = self._detect(lang, command)
+            self._toolchains[name] = toolchain
+            return toolchain
+
+    def clear(self):
+        """
+        Forgets every probe result, in memory and on disk.
+        """
+        with self._lock:
+            self._toolchains.clear()
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _detect(self, lang, only=None):
+        name = lang if only is None else f"{lang}:{only}"
+        for command, version_args, pattern, vendor in toolchain_candidates.get(lang, []):
+            if only is not None and command != only:
+                continue
+            path = shutil.which(command)
+            if path is None:
+                continue
+            mtime = os.stat(path).st_mtime
+            records = self._load()
+            record = records.get(name)
+            if record and record["path"] == path and record["mtime"] == mtime:
+                return Toolchain(**record["toolchain"])
+            toolchain = Toolchain(lang, command, path, self._version(path, version_args, pattern), vendor)
+            logger.info("Detected %s toolchain: %s %s (%s)", lang, command, toolchain.version, path)
+            records[name] = {"path": path, "mtime": mtime, "toolchain": toolchain._asdict()}
+            self._save(records)
+            return toolchain
+        if only is not None:
+            logger.warning("%s is not an installed %s toolchain", only, lang)
+            return None
+        check = language_check_functions.get(lang)
+        logger.warning("No %s toolchain found. %s", lang, check()[0] if check else "")
+        return None
+
+    @staticmethod
+    def _version(path, version_args, pattern):
+        try:
+            result = subprocess.run([path] + version_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    text=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            return "unknown version"
+        match = re.search(pattern, result.stdout + result.stderr)
+        if not match:
+            return "unknown version"
+        return match.group(1) if match.groups() else match.group(0)
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, records):
+        if self.path is None:
+            return
+        # Write through a temporary file so concurrent processes never read a partial record
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(records, file, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.debug("Could not persist toolchain records: %s", error)
+
+
+registry = ToolchainRegistry()
@@ -0,0 +1,362 @@
+"""
+tuning.py
+====================================
+Per-host calibration of the C and C++ build setup.
+
+By default every build uses the first installed compiler (gcc before clang, g++ before
+clang++) with the default linker and optimization settings. Calibration is an opt-in step
+that grades a reference corpus with each combination of compiler, linker (bfd, gold, lld,
+mold), -pipe, -O0 and static linking, and keeps the fastest setup whose observations, rewards
+and outputs match those of the default one on every program. Combinations are searched one
+dimension at a time (compiler, then linker, and so on), keeping the best choice of each, so
+calibration grades the corpus a few dozen times rather than once per combination.
+
+The result is stored in tuning.json in the coderl cache directory, per host name and per
+configuration (only the keys that change what is built or graded count, see build_keys).
+CodeCompilerEnv then uses it automatically, until one of the compilers that were timed is
+replaced. Set config["tuning"] to False to ignore it, or to {"command": ..., "flags": ...}
+to force a setup.
+
+    python -m coderl.tuning --lang c cpp --repeat 3
+
+Classes:
+
+    Setup: A compiler command and the flags added to config["pre_flag"].
+    TuningStore: The calibrated setups of this host, persisted as JSON.
+
+Functions:
+
+    setup(config): The setup a CodeCompilerEnv with this configuration builds with, or None.
+    calibrate(config, corpus, repeat, margin, dimensions, tuning_store): Times the combinations and
+        stores the fastest equivalent one.
+    main(): The command line entry point, python -m coderl.tuning.
+
+Global Variables:
+    tunable_languages: The configuration languages that can be calibrated.
+    build_keys: The configuration keys a calibration is specific to.
+    reference_corpus: The default calibration programs per language, one per grading outcome.
+    store: The process-wide TuningStore used by CodeCompilerEnv.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from . import toolchains
+from .utils import cache_dir
+
+logger = logging.getLogger(__name__)
+
+tunable_languages = ("c", "cpp")
+
+build_keys = ("lang", "reward_levels", "execute", "run_command", "input_filename", "io_args", "output_filename",
+              "post_output_args", "pre_flag", "post_flag", "run_file", "grading", "staged", "pch")
+
+Setup = namedtuple("Setup", ["command", "flags"])
+Setup.__doc__ = """
+    A build setup.
+
+    Attributes:
+        command (str): The compiler command, one of the language's toolchain candidates.
+        flags (str): Flags added to config["pre_flag"], e.g. "-pipe -fuse-ld=gold".
+"""
+
+reference_corpus = {
+    "c": [
+        '#include <stdio.h>\nint main(){ printf("Hello World"); return 0; }',
+        '#include <stdio.h>\nint main(){ int *p = 1; printf("%d", p == 0); return 0; }',
+        "int main(){ int unused; return 0; }",
+        "int main(){ unsigned u = 1; int i = -1; return u < i; }",
+        "int main(){ return x; }",
+        "void missing(void);\nint main(){ missing(); return 0; }",
+        "int main(){ int *p = 0; return *p; }",
+        '#include <stdio.h>\n#include <stdlib.h>\n#include <string.h>\n#include <math.h>\n'
+        'int main(){ char s[16]; strcpy(s, "42"); printf("%.1f", sqrt(atoi(s))); return 0; }',
+    ],
+    "cpp": [
+        '#include <iostream>\nint main(){ std::cout << "Hello World"; return 0; }',
+        "int main(){ int unused; return 0; }",
+        "int main(){ unsigned u = 1; int i = -1; return u < i; }",
+        "int main(){ return x; }",
+        "void missing();\nint main(){ missing(); return 0; }",
+        "int main(){ int *p = nullptr; return *p; }",
+        '#include <iostream>\n#include <map>\n#include <string>\n#include <vector>\n'
+        'int main(){ std::map<std::string, std::vector<int>> m; m["a"].push_back(1); '
+        'std::cout << m.size(); return 0; }',
+    ],
+}
+
+
+def _fingerprint(config):
+    build = {key: config.get(key) for key in build_keys}
+    return hashlib.sha256(json.dumps(build, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _binaries(lang):
+    # The compilers a calibration compares; replacing any of them invalidates it
+    binaries = {}
+    for command, *_ in toolchains.toolchain_candidates.get(lang, []):
+        path = shutil.which(command)
+        if path is not None:
+            binaries[path] = os.stat(path).st_mtime
+    return binaries
+
+
+class TuningStore:
+    """
+    The calibrated setups of this host, persisted as JSON.
+
+    Attributes:
+        path (str): Location of the JSON file, or None to keep calibrations in memory only.
+
+    Methods:
+        lookup(config): Returns the calibrated Setup of a configuration, or None.
+        save(config, record): Stores the calibration of a configuration.
+        clear(): Forgets every calibration of this host.
+    """
+
+    def __init__(self, path=""):
+        """
+        Initializes the store.
+
+        Args:
+            path (str): JSON file for calibrations. Defaults to tuning.json in the coderl cache
+                directory; None disables persistence.
+        """
+        self._path = path
+        self._records = None
+        self._lock = threading.Lock()
+        self.host = socket.gethostname()
+
+    @property
+    def path(self):
+        if self._path == "":
+            self._path = os.path.join(cache_dir(), "tuning.json")
+        return self._path
+
+    def lookup(self, config):
+        """
+        Returns the calibrated setup of a configuration, if the compilers it was calibrated
+        against are still the installed ones.
+
+        Args:
+            config (dict): The environment configuration.
+
+        Returns:
+            Setup: The setup, or None if the configuration has no valid calibration.
+        """
+        if config.get("lang") not in tunable_languages:
+            return None
+        with self._lock:
+            record = self._load().get(self.host, {}).get(_fingerprint(config))
+        if record is None:
+            return None
+        if record["binaries"] != _binaries(config["lang"]):
+            logger.info("Ignoring the %s calibration, the installed compilers changed", config["lang"])
+            return None
+        return Setup(record["command"], record["flags"])
+
+    def save(self, config, record):
+        """
+        Stores the calibration of a configuration.
+
+        Args:
+            config (dict): The calibrated configuration.
+            record (dict): The calibration, as returned by calibrate.
+        """
+        with self._lock:
+            # Merge into the file as it is now, other processes may have calibrated meanwhile
+            self._records = None
+            records = self._load()
+            records.setdefault(self.host, {})[_fingerprint(config)] = record
+            self._save(records)
+
+    def clear(self):
+        """
+        Forgets every calibration of this host.
+        """
+        with self._lock:
+            records = self._load()
+            records.pop(self.host, None)
+            self._save(records)
+
+    def _load(self):
+        if self._records is None:
+            self._records = {}
+            if self.path is not None:
+                try:
+                    with open(self.path) as file:
+                        self._records = json.load(file)
+                except (OSError, ValueError):
+                    pass
+        return self._records
+
+    def _save(self, records):
+        self._records = records
+        if self.path is None:
+            return
+        # Write through a temporary file so concurrent processes never read a partial record
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(records, file, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            logger.warning("Could not persist the calibration: %s", error)
+
+
+store = TuningStore()
+
+
+def setup(config):
+    """
+    Returns the setup a CodeCompilerEnv with this configuration builds with.
+
+    Args:
+        config (dict): The environment configuration.
+
+    Returns:
+        Setup: The setup forced by config["tuning"], else the calibrated one, else None (the
+            default compiler with no extra flags).
+    """
+    tuning = config.get("tuning", True)
+    if tuning is False or tuning is None:
+        return None
+    if isinstance(tuning, dict):
+        return Setup(tuning.get("command"), tuning.get("flags", ""))
+    return store.lookup(config)
+
+
+def default_dimensions():
+    """
+    Returns the flag choices calibrated after the compiler, the default choice first: the
+    installed linkers, -pipe, -O0 and static linking.
+
+    Returns:
+        list: One list of alternative flags per dimension.
+    """
+    linkers = [""] + [f"-fuse-ld={name}" for name, binary in (("gold", "ld.gold"), ("lld", "ld.lld"),
+                                                                  ("mold", "mold")) if shutil.which(binary)]
+    return [linkers, ["", "-pipe"], ["", "-O0"], ["", "-static"]]
+
+
+def _measure(config, setup, corpus, repeat):
+    # Grades the corpus once to compare results, then times the fastest of repeat passes
+    from .main import CodeCompilerEnv
+    env = CodeCompilerEnv(dict(config, tuning=setup._asdict()))
+    try:
+        results = [(observation, reward, info.get("stdout"))
+                   for observation, reward, done, info in map(env.step, corpus)]
+        seconds = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for source in corpus:
+                env.step(source)
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+    finally:
+        env.close()
+    return results, seconds
+
+
+def calibrate(config, corpus=None, repeat=3, margin=0.05, dimensions=None, tuning_store=None):
+    """
+    Times the build setups on a corpus and stores the fastest one that grades every program
+    exactly like the default setup.
+
+    Args:
+        config (dict): The configuration to calibrate, for a language in tunable_languages.
+        corpus (list): The programs to grade. Defaults to reference_corpus for the language.
+        repeat (int): Timed passes over the corpus per setup; the fastest pass counts.
+            Defaults to 3.
+        margin (float): How much faster than the current best a setup must be to replace it,
+            so that timing noise does not pick a setup. Defaults to 0.05 (5%).
+        dimensions (list): The flag choices to search, as returned by default_dimensions.
+            Defaults to default_dimensions().
+        tuning_store (TuningStore): Where the result is saved. Defaults to the process-wide store.
+
+    Returns:
+        dict: The calibration: "command", "flags", the "seconds" of a pass with it, the
+            "baseline" seconds of the default setup, the timed "binaries" and the "setups"
+            that were tried, each with its flags, seconds and whether it was "equivalent".
+    """
+    lang = config["lang"]
+    if lang not in tunable_languages:
+        raise ValueError(f"Calibration is not supported for '{lang}', expected one of {tunable_languages}")
+    corpus = corpus if corpus is not None else reference_corpus[lang]
+    dimensions = dimensions if dimensions is not None else default_dimensions()
+    commands = [command for command, *_ in toolchains.toolchain_candidates[lang] if shutil.which(command)]
+    if not commands:
+        raise ValueError(f"No {lang} compiler is installed")
+    tried = []
+
+    def measure(command, choices):
+        candidate = Setup(command, " ".join(flag for flag in choices if flag))
+        results, seconds = _measure(config, candidate, corpus, repeat)
+        tried.append({"command": candidate.command, "flags": candidate.flags, "seconds": seconds,
+                      "equivalent": results == expected})
+        logger.info("%s %s: %.3fs per pass%s", candidate.command, candidate.flags or "(default flags)", seconds,
+                    "" if results == expected else ", results differ")
+        return results == expected, seconds
+
+    best = (commands[0], [options[0] for options in dimensions])
+    expected, baseline = _measure(config, Setup(best[0], ""), corpus, repeat)
+    tried.append({"command": best[0], "flags": "", "seconds": baseline, "equivalent": True})
+    best_seconds = baseline
+    for command in commands[1:]:
+        equivalent, seconds = measure(command, best[1])
+        if equivalent and seconds < best_seconds * (1 - margin):
+            best, best_seconds = (command, best[1]), seconds
+    for index, options in enumerate(dimensions):
+        current = best
+        for option in options:
+            if option == current[1][index]:
+                continue
+            choices = current[1][:index] + [option] + current[1][index + 1:]
+            equivalent, seconds = measure(current[0], choices)
+            if equivalent and seconds < best_seconds * (1 - margin):
+                best, best_seconds = (current[0], choices), seconds
+
+    record = {"command": best[0], "flags": " ".join(flag for flag in best[1] if flag), "seconds": best_seconds,
+              "baseline": baseline, "binaries": _binaries(lang), "setups": tried, "calibrated": time.time()}
+    (tuning_store or store).save(config, record)
+    logger.info("Calibrated %s: %s %s, %.3fs per pass instead of %.3fs", lang, record["command"],
+                record["flags"] or "(default flags)", best_seconds, baseline)
+    return record
+
+
+def main():
+    from .main import default_configs
+
+    parser = argparse.ArgumentParser(description="Calibrate the C and C++ build setup of this host.")
+    parser.add_argument("--lang", nargs="+", default=list(tunable_languages), choices=tunable_languages,
+                        help="languages of the default configurations to calibrate")
+    parser.add_argument("--config", default=None, help="JSON file with a configuration, overriding --lang")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the corpus per setup")
+    parser.add_argument("--margin", type=float, default=0.05, help="speed-up required to prefer a setup")
+    parser.add_argument("--clear", action="store_true", help="forget this host's calibrations instead")
+    args = parser.parse_args()
+
+    if args.clear:
+        store.clear()
+        return
+    configs = [default_configs[lang] for lang in args.lang]
+    if args.config is not None:
+        with open(args.config) as file:
+            configs = [json.load(file)]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    for config in configs:
+        record = calibrate(config, repeat=args.repeat, margin=args.margin)
+        print(f"{config['lang']}: {record['command']} {record['flags'] or '(default flags)'}, "
+              f"{record['seconds']:.3f}s per pass instead of {record['baseline']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
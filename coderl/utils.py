@@ -1,7 +1,45 @@
 
+import importlib
+import logging
+import os
 import subprocess
 import platform
 import re
+import sys
+
+
+def cache_dir():
+    # Persistent caches live under $CODERL_CACHE_DIR, or $XDG_CACHE_HOME/coderl by default
+    path = os.environ.get("CODERL_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "coderl")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def set_verbosity(level=logging.DEBUG):
+    # Verbosity switch for coderl's logs: DEBUG shows every compile and run result, the default
+    # (no handler, WARNING through logging.lastResort) shows only problems
+    logger = logging.getLogger("coderl")
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+
+
+def lazy_imports(module_name, attributes):
+    # Builds a module-level __getattr__ that imports each attribute on first access. attributes maps
+    # names to "module" or "module:attribute", relative module paths are resolved against module_name.
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        module_path, _, attribute = attributes[name].partition(":")
+        value = importlib.import_module(module_path, module_name)
+        if attribute:
+            value = getattr(value, attribute)
+        setattr(sys.modules[module_name], name, value)
+        return value
+    return __getattr__
 
 
 def check_c_compiler():
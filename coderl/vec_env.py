@@ -0,0 +1,189 @@
+"""
+vec_env.py
+====================================
+A vectorized version of CodeCompilerEnv that grades a whole batch of sources at once.
+
+Compilation and execution are spread over a pool of worker processes. Every worker owns
+one CodeCompilerEnv, whose steps run in private scratch directories.
+
+Classes:
+
+    CodeCompilerVecEnv: A gym vector environment that grades batches of sources on a
+    process pool and returns the results in input order.
+"""
+
+import os
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
+
+import gym.vector
+import numpy as np
+
+from . import coalesce
+from .actions import as_source, batch_sources
+from .main import CodeCompilerEnv, defaultConfig
+
+_worker_env = None
+
+
+def _init_worker(config, cache, metrics=None, store=None):
+    """
+    Initializes a pool worker by building the environment it will use for every step.
+
+    Args:
+        config (dict): The language configuration for CodeCompilerEnv.
+        cache (coderl.db.CompileCache): Result cache for the worker's environment, or None.
+        metrics (coderl.metrics.Metrics): Metrics of the worker's environment, or None.
+        store (coderl.db.TrajectoryStore): Trajectory store of the worker's environment, or None.
+    """
+    global _worker_env
+    _worker_env = CodeCompilerEnv(config, cache=cache, metrics=metrics, store=store)
+    # Pool workers skip atexit handlers, so register the cleanup with multiprocessing instead
+    multiprocessing.util.Finalize(None, _worker_env.close, exitpriority=10)
+    if store is not None:
+        multiprocessing.util.Finalize(None, store.close, exitpriority=10)
+
+
+def _step_worker(source, tests=None):
+    """
+    Grades one source in a pool worker.
+
+    Args:
+        source (str): The source code to be compiled and executed.
+        tests (list): Optional test cases of the source.
+
+    Returns:
+        tuple: The (observation, reward, done, info) tuple returned by CodeCompilerEnv.step.
+    """
+    return _worker_env.step(source, tests)
+
+
+class CodeCompilerVecEnv(gym.vector.VectorEnv):
+    """
+    A gym vector environment that grades batches of sources in parallel.
+
+    Attributes:
+        config (dict): Configuration dictionary for the selected language.
+        num_workers (int): Number of worker processes in the pool.
+        chunksize (int): Number of sources handed to a worker at a time.
+        batch_stats (dict): Dedup statistics of the last batch when config["coalesce"] is set,
+            see coderl.coalesce.batch_stats. Batches are only deduplicated within themselves,
+            so in_flight is left out.
+
+    Methods:
+        step_batch(sources, tests): Grades a list of sources and returns the results in input order.
+        step(actions): Gym vector step, equivalent to step_batch.
+        reset(): Resets the environments to an initial state.
+        close(): Shuts the worker pool down.
+    """
+
+    def __init__(self, config=defaultConfig, num_envs=None, num_workers=None, chunksize=1,
+                 mp_context=None, scratch_dir=None, cache=None, metrics=None, store=None):
+        """
+        Initializes the vector environment and starts the worker pool.
+
+        Args:
+            config (dict): A dictionary containing configuration parameters. Defaults to defaultConfig.
+            num_envs (int): Batch size advertised through the gym vector spaces. Defaults to num_workers.
+                step_batch accepts batches of any size.
+            num_workers (int): Number of worker processes. Defaults to the number of CPUs.
+            chunksize (int): Number of sources sent to a worker per task. Larger chunks cut IPC
+                overhead for big batches of cheap programs.
+            mp_context (str): Multiprocessing start method ("fork", "forkserver" or "spawn").
+                Defaults to the platform default. "forkserver" avoids forking large trainer processes.
+            scratch_dir (str): Directory under which worker scratch directories are created.
+                Defaults to config["scratch_dir"], or /dev/shm when it allows execution.
+            cache (coderl.db.CompileCache): Optional result cache. Every worker gets its own
+                memory tier and shares the disk tier.
+            metrics (coderl.metrics.Metrics): Optional metrics. Every worker aggregates its own
+                copy; give the metrics a callback or a per-process path ("{pid}") to collect them.
+            store (coderl.db.TrajectoryStore): Optional trajectory store. Every worker records
+                the steps it grades through its own writer, into the same file. Duplicates
+                removed by config["coalesce"] are not recorded.
+        """
+        if scratch_dir is not None:
+            config = dict(config, scratch_dir=scratch_dir)
+        self.config = config
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        # Builds the spaces and computes the coalescing keys of requests; never steps
+        self._env = CodeCompilerEnv(config)
+        super(CodeCompilerVecEnv, self).__init__(num_envs or self.num_workers, self._env.observation_space,
+                                                 self._env.action_space)
+        self.batch_stats = None
+        context = multiprocessing.get_context(mp_context) if mp_context else None
+        self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(config, cache, metrics, store))
+        self._actions = None
+
+    def step_batch(self, sources, tests=None, lengths=None):
+        """
+        Grades a batch of sources on the worker pool. With config["coalesce"], every distinct
+        request of the batch is sent to the pool once.
+
+        Args:
+            sources (list or numpy.ndarray): The source codes to be compiled and executed, as for
+                CodeCompilerEnv.step, or a 2-D uint8 matrix with one source per row. Buffers
+                are pickled to the workers as they are, without being decoded.
+            tests (list): Optional test cases of every source, in the same order as sources.
+                See CodeCompilerEnv.step.
+            lengths (sequence): The length in bytes of every row of a sources matrix.
+
+        Returns:
+            tuple: (observations, rewards, dones, infos) where the first three are numpy arrays
+            and infos is a list of dicts, all in the same order as sources.
+        """
+        sources = batch_sources(sources, lengths)
+        tests = [None] * len(sources) if tests is None else tests
+        keys = [self._env.coalesce_key(as_source(source), source_tests) for source, source_tests in zip(sources, tests)]
+        first, index = coalesce.dedupe(keys)
+        # memoryviews cannot be pickled; arrays and bytes are sent as they are
+        sources = [source.tobytes() if isinstance(source, memoryview) else source for source in sources]
+        unique = list(self._pool.map(_step_worker, [sources[position] for position in first],
+                                     [tests[position] for position in first], chunksize=self.chunksize))
+        if self._env.coalesce:
+            # Batches are not shared with other callers, so there is no in_flight count
+            self.batch_stats = coalesce.batch_stats(len(sources), len(first))
+        results = [unique[entry] if position == first[entry] else coalesce.copy_result(unique[entry])
+                   for position, entry in enumerate(index)]
+        observations = np.array([result[0] for result in results], dtype=np.int64)
+        rewards = np.array([result[1] for result in results], dtype=np.float64)
+        dones = np.array([result[2] for result in results], dtype=bool)
+        infos = [result[3] for result in results]
+        return observations, rewards, dones, infos
+
+    def step_async(self, actions):
+        """
+        Stores a batch of sources for the following step_wait call.
+
+        Args:
+            actions (list): The source codes to be compiled and executed.
+        """
+        self._actions = list(actions)
+
+    def step_wait(self):
+        """
+        Grades the batch passed to step_async.
+
+        Returns:
+            tuple: The (observations, rewards, dones, infos) returned by step_batch.
+        """
+        actions, self._actions = self._actions, None
+        return self.step_batch(actions)
+
+    def reset_wait(self, seed=None, options=None):
+        """
+        Resets the environments to an initial state.
+
+        Returns:
+            numpy.ndarray: A batch of sample observations.
+        """
+        return self.observation_space.sample()
+
+    def close_extras(self, **kwargs):
+        """
+        Shuts the worker pool down. Workers remove their scratch directories on exit.
+        """
+        self._pool.shutdown()
+        self._env.close()
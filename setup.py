@@ -31,6 +31,7 @@ setuptools.setup(
 	# Any link to reach this module, ***if*** you have any webpage or github profile
 	url="https://github.com/dheerajmpai/code-rl",
 	packages=setuptools.find_packages(),
+	package_data={"coderl": ["resources/*.java"]},
 
 
 	# if module has dependencies i.e. if your package rely on other package at pypi.org
@@ -40,6 +41,9 @@ setuptools.setup(
 
 	install_requires=requirements,
 
+	# The coderl command line
+	entry_points={"console_scripts": ["coderl=coderl.cli:main"]},
+
 
 	license="MIT",
 
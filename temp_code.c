@@ -1,14 +0,0 @@
-
-    #include<stdio.h>
-    void foo(void){
-        // int a = 2;
-        return;
-        }
-
-    int main(){
-        printf("Hello World");
-        foo();
-
-        // return 0;
-        }
-    
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from coderl.actions import SourceSpace, as_source, batch_sources
+from coderl.db import CompileCache
+from coderl.main import CodeCompilerEnv, defaultConfig
+from coderl.vec_env import CodeCompilerVecEnv
+
+sources = [
+    '#include <stdio.h>\nint main(){ printf("h\xe9llo"); return 0; }',
+    "int main(){ return x; }",
+    "int main(){ int unused; return 0; }",
+]
+
+
+def matrix(width=128):
+    encoded = [source.encode() for source in sources]
+    batch = np.zeros((len(encoded), width), dtype=np.uint8)
+    for row, source in enumerate(encoded):
+        batch[row, :len(source)] = np.frombuffer(source, dtype=np.uint8)
+    return batch, np.array([len(source) for source in encoded])
+
+
+def test_step_accepts_buffers():
+    env = CodeCompilerEnv()
+    expected = env.step(sources[0])
+    assert expected[3] == {"stdout": "h\xe9llo"}
+    encoded = sources[0].encode()
+    for action in (encoded, bytearray(encoded), memoryview(encoded), np.frombuffer(encoded, dtype=np.uint8)):
+        assert env.step(action) == expected
+    # A strided view is made contiguous, other arrays are rejected
+    spread = np.zeros(2 * len(encoded), dtype=np.uint8)
+    spread[::2] = np.frombuffer(encoded, dtype=np.uint8)
+    assert env.step(spread[::2]) == expected
+    with pytest.raises(TypeError):
+        env.step(np.zeros((2, 2), dtype=np.uint8))
+    with pytest.raises(TypeError):
+        env.step(np.zeros(4, dtype=np.int32))
+
+
+def test_batch_sources_are_views():
+    batch, lengths = matrix()
+    rows = batch_sources(batch, lengths)
+    assert [bytes(row) for row in rows] == [source.encode() for source in sources]
+    assert all(np.shares_memory(row, batch) for row in rows)
+    assert np.shares_memory(np.asarray(as_source(rows[0])), batch)
+
+
+def test_astep_many_matrix():
+    env = CodeCompilerEnv()
+    expected = [env.step(source) for source in sources]
+    batch, lengths = matrix()
+    assert asyncio.run(env.astep_many(batch, lengths=lengths)) == expected
+
+
+def test_vec_env_matrix():
+    env = CodeCompilerEnv()
+    expected = [env.step(source) for source in sources]
+    batch, lengths = matrix()
+    vec_env = CodeCompilerVecEnv(dict(defaultConfig, coalesce=True), num_workers=2)
+    try:
+        observations, rewards, dones, infos = vec_env.step_batch(batch, lengths=lengths)
+        assert list(rewards) == [result[1] for result in expected]
+        vec_env.step_batch([memoryview(source.encode()) for source in sources])
+    finally:
+        vec_env.close()
+
+
+def test_cache_key_of_buffers():
+    encoded = sources[0].encode()
+    key = CompileCache.key(sources[0], defaultConfig, "gcc")
+    assert CompileCache.key(encoded, defaultConfig, "gcc") == key
+    assert CompileCache.key(np.frombuffer(encoded, dtype=np.uint8), defaultConfig, "gcc") == key
+
+
+def test_source_space():
+    space = CodeCompilerEnv().action_space
+    assert space == SourceSpace(65536)
+    assert space.contains("int main(){}")
+    assert space.contains(b"int main(){}")
+    assert space.contains(np.zeros(10, dtype=np.uint8))
+    assert not space.contains(np.zeros(65537, dtype=np.uint8))
+    assert not space.contains(42)
+    space = SourceSpace(16, seed=0)
+    sample = space.sample()
+    assert sample.dtype == np.uint8 and len(sample) <= 16 and space.contains(sample)
@@ -0,0 +1,29 @@
+import asyncio
+import re
+
+from coderl.main import CodeCompilerEnv, defaultConfig
+from test_grading import c_corpus
+
+
+def normalize(result):
+    # The linker names gcc's randomly named temporary object files
+    info = {key: re.sub(r"/tmp/cc\w+\.o", "/tmp/cc.o", value) for key, value in result[3].items()}
+    return result[:3] + (info,)
+
+
+def test_astep_many_matches_step():
+    env = CodeCompilerEnv()
+    expected = [env.step(code) for code in c_corpus]
+    try:
+        results = asyncio.run(env.astep_many(c_corpus, concurrency=4))
+    finally:
+        env.close()
+    assert [normalize(result) for result in results] == [normalize(result) for result in expected]
+
+
+def test_astep_single_mode():
+    env = CodeCompilerEnv(dict(defaultConfig, grading="single"))
+    try:
+        assert asyncio.run(env.astep(c_corpus[0])) == env.step(c_corpus[0])
+    finally:
+        env.close()
@@ -0,0 +1,68 @@
+from coderl.db import CompileCache
+from coderl.main import CodeCompilerEnv, defaultConfig
+
+code = """
+#include<stdio.h>
+int main(){
+printf("Hello World");
+return 0;
+}"""
+
+
+def test_cache_hits_and_misses(tmp_path):
+    cache = CompileCache(path=str(tmp_path / "cache.sqlite"))
+    env = CodeCompilerEnv(cache=cache)
+    first = env.step(code)
+    second = env.step(code)
+    assert first == second == (1, 1, True, {"stdout": "Hello World"})
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+    # A fresh process-local tier falls through to the shared disk tier
+    other = CompileCache(path=str(tmp_path / "cache.sqlite"))
+    assert CodeCompilerEnv(cache=other).step(code) == first
+    assert other.stats()["disk_hits"] == 1
+
+
+def test_cache_key_depends_on_config():
+    config = {"reward_levels": [("", -1)], "run_command": "./a.out"}
+    key = CompileCache.key(code, config, "gcc 12.2.0")
+    assert key == CompileCache.key(code, dict(config), "gcc 12.2.0")
+    assert key != CompileCache.key(code, dict(config, run_command="./b.out"), "gcc 12.2.0")
+    assert key != CompileCache.key(code, config, "gcc 13.1.0")
+    assert key != CompileCache.key(code + " ", config, "gcc 12.2.0")
+
+
+def exact(stdout, expected, input):
+    return stdout == expected
+
+
+def test_cache_key_of_checkers():
+    config = {"reward_levels": [("", -1)]}
+    key = CompileCache.key(code, config, "gcc", [("", "x", exact)])
+    assert key == CompileCache.key(code, config, "gcc", [("", "x", exact)])
+    assert key != CompileCache.key(code, config, "gcc", [("", "x", str.__eq__)])
+    assert CompileCache.key(code, config, "gcc", [("", "x", lambda *args: True)]) is None
+
+
+def test_cache_drops_timings(tmp_path):
+    cache = CompileCache(path=str(tmp_path / "cache.sqlite"))
+    env = CodeCompilerEnv(dict(defaultConfig, timings=True), cache=cache)
+    assert "compile_time" in env.step(code)[3]
+    info = env.step(code)[3]
+    assert info == {"stdout": "Hello World"}
+    assert CompileCache(path=str(tmp_path / "cache.sqlite")).get(CompileCache.key(code, env.config, env.toolchain)) \
+        == (1, 1, True, info)
+
+
+def test_cache_eviction(tmp_path):
+    cache = CompileCache(max_entries=2, path=str(tmp_path / "cache.sqlite"), max_bytes=2000)
+    cache.evict_interval = 1
+    for index in range(50):
+        cache.put(str(index), (1, 1, True, {"stdout": "x" * 100}))
+    assert cache.stats()["memory_entries"] == 2
+    db = cache._db()
+    total = db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+    assert total <= 2000
+    assert cache.get("49") is not None
+    assert CompileCache(path=str(tmp_path / "cache.sqlite")).get("0") is None
@@ -0,0 +1,58 @@
+import asyncio
+
+from coderl.capture import BoundedCapture, OutputMatcher
+from coderl.main import CodeCompilerEnv, defaultConfig
+from coderl.sandbox import SandboxCommand
+
+flood = """
+#include <stdio.h>
+int main(){
+    for (long i = 0; i < 20000000; i++) printf("line %ld\\n", i);
+    return 0;
+}"""
+
+
+def test_bounded_capture():
+    capture = BoundedCapture(10)
+    for chunk in (b"abc", b"defgh", b"ijklmnop", b"qrstuvwxyz"):
+        capture.feed(chunk)
+    assert capture.truncated and capture.total == 26
+    assert capture.text() == "abcde\n[... 16 bytes truncated ...]\nvwxyz"
+
+    capture = BoundedCapture(10)
+    capture.feed(b"short")
+    assert not capture.truncated and capture.text() == "short"
+
+
+def matches(chunks, expected):
+    matcher = OutputMatcher(expected)
+    for chunk in chunks:
+        matcher.feed(chunk)
+    return matcher.finish()
+
+
+def test_output_matcher():
+    assert matches([b"1 2\n", b"3  \r\n\n\n"], "1 2\n3")
+    assert matches([b"1", b" ", b"2"], "1 2\n")
+    assert matches([b""], "")
+    assert not matches([b"1 2\n3 4"], "1 2\n3")
+    assert not matches([b"1 2\n"], "1 2\n3")
+    assert not matches([b"1 2\n\nx"], "1 2")
+    assert not matches([b"1  2"], "1 2")
+
+
+def test_sandbox_caps_output():
+    result = SandboxCommand("yes | head -c 5000000", {"output": 1000}).run()
+    assert result.stdout_truncated and len(result.stdout) < 1100
+    result = asyncio.run(SandboxCommand("yes | head -c 5000000", {"output": 1000}).arun())
+    assert result.stdout_truncated and len(result.stdout) < 1100
+    result = SandboxCommand("cat", {}, input="y\n" * 100000, expected="y\n" * 100000).run()
+    assert result.matched and not result.stdout_truncated
+
+
+def test_step_reports_truncation():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"output": 4096}))
+    observation, reward, done, info = env.step(flood)
+    assert reward == 1 and info["stdout_truncated"]
+    assert info["stdout"].startswith("line 0\n") and info["stdout"].endswith("line 19999999\n")
+    assert len(info["stdout"]) < 5000
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from coderl.coalesce import SingleFlight, dedupe, normalize, request_key
+from coderl.main import CodeCompilerEnv, defaultConfig
+from coderl.vec_env import CodeCompilerVecEnv
+
+hello = """
+#include <stdio.h>
+int main(){
+    printf("Hello  World"); // greet
+    return 0;
+}"""
+
+hello_respaced = """#include <stdio.h>
+
+int main(){   /* entry */
+  printf("Hello  World");
+  return 0;
+}
+"""
+
+hello_tokens = """#include <stdio.h>
+#define GREETING "Hello  World"
+int main ( ) { printf ( GREETING ) ; return 0 ; }"""
+
+
+def test_normalize_whitespace():
+    assert normalize(hello, "whitespace") == normalize(hello_respaced, "whitespace")
+    assert '"Hello  World"' in normalize(hello, "whitespace")
+    assert normalize('printf("a // b");', "whitespace") == 'printf("a // b");'
+    assert normalize("x = a - -b;", "whitespace") != normalize("x = a--b;", "whitespace")
+    assert normalize("x = a+b;", "whitespace") != normalize("x = a + b;", "whitespace")
+    # A comment separates tokens like a space
+    assert normalize("int/**/x = 1;", "whitespace") != normalize("intx = 1;", "whitespace")
+    assert normalize("int/**/x = 1;", "whitespace") == normalize("int x = 1;", "whitespace")
+    assert normalize("int /* c */ x = 1; // d", "whitespace") == "int x = 1;"
+    assert normalize("int/**/x = 1;", "tokens") != normalize("intx = 1;", "tokens")
+
+
+def test_normalize_tokens():
+    assert normalize("x = a+b;", "tokens") == normalize("x  =  a + b ;", "tokens")
+    assert normalize("x = a - -b;", "tokens") != normalize("x = a--b;", "tokens")
+    assert normalize("double d = 1.5e-3;", "tokens") == "double d = 1.5e-3 ;"
+    assert normalize("#define A 1\nint x;", "tokens") != normalize("#define A 1 int x;", "tokens")
+    env = CodeCompilerEnv()
+    # Through the preprocessor, macros are expanded
+    assert normalize(hello, "tokens", "c", env.command) == normalize(hello_tokens, "tokens", "c", env.command)
+    assert normalize(hello, "tokens") != normalize(hello_tokens, "tokens")
+
+
+def test_request_key():
+    assert request_key(hello, defaultConfig, mode="whitespace") == request_key(hello_respaced, defaultConfig,
+                                                                               mode="whitespace")
+    assert request_key(hello, defaultConfig) != request_key(hello_respaced, defaultConfig)
+    assert request_key(hello, defaultConfig) != request_key(hello, defaultConfig, [("", "Hello  World")])
+    assert dedupe(["a", "b", "a", None, None]) == ([0, 1, 3, 4], [0, 1, 0, 2, 3])
+
+
+def test_single_flight_threads():
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def evaluate():
+        calls.append(1)
+        time.sleep(0.2)
+        return 1, 1, True, {"stdout": ""}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", evaluate))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert flight.stats() == {"calls": 4, "shared": 3}
+    # Every caller owns its info
+    assert len({id(result[3]) for result, _ in results}) == 4
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.1)
+        raise RuntimeError("boom")
+
+    async def main():
+        return await asyncio.gather(flight.ado("key", failing), flight.ado("key", failing), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(main())] == [RuntimeError, RuntimeError]
+    assert flight._inflight == {}
+
+
+def test_single_flight_cancelled_leader():
+    flight = SingleFlight()
+    calls = []
+
+    async def evaluate():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return 1, 1, True, {"stdout": ""}
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", evaluate))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.ensure_future(flight.ado("key", evaluate)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        # One follower takes over the evaluation, and the other shares it
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(main())
+    assert sorted(shared for _, shared in results) == [False, True]
+    assert len(calls) == 2
+    assert flight.stats() == {"calls": 3, "shared": 1}
+    assert flight._inflight == {}
+
+
+def test_astep_many_coalesces():
+    sources = [hello, hello_respaced, hello, "int main(){return 1;}"]
+    env = CodeCompilerEnv(dict(defaultConfig, coalesce="whitespace"))
+    expected = [CodeCompilerEnv().step(source) for source in sources]
+    results = asyncio.run(env.astep_many(sources, concurrency=4))
+    assert results == expected
+    assert env.batch_stats == {"requests": 4, "unique": 2, "duplicates": 2, "in_flight": 0, "evaluated": 2}
+    assert results[0][3] is not results[2][3]
+
+
+def test_vec_env_coalesces():
+    sources = [hello] * 3 + [hello_respaced]
+    vec_env = CodeCompilerVecEnv(dict(defaultConfig, coalesce=True), num_workers=2)
+    try:
+        observations, rewards, dones, infos = vec_env.step_batch(sources)
+    finally:
+        vec_env.close()
+    assert list(rewards) == [1, 1, 1, 1]
+    assert vec_env.batch_stats == {"requests": 4, "unique": 2, "duplicates": 2, "evaluated": 2}
+
+
+def test_unknown_normalization():
+    with pytest.raises(ValueError):
+        CodeCompilerEnv(dict(defaultConfig, coalesce="ast"))
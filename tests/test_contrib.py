@@ -1,6 +1,99 @@
+import time
+
+import pytest
+
 import coderl.contrib
+from coderl.contrib.trl import CodeRewardFunction, extract_code
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from coderl.vec_env import CodeCompilerVecEnv
+
 
 def test_ae_trl():
     assert(coderl.contrib.trl!=0)
-    
 
+
+clean = "int main(){return 0;}"
+failing = "int main(){return x;}"
+adder = "#include <stdio.h>\nint main(){int a, b; scanf(\"%d %d\", &a, &b); printf(\"%d\", a + b); return 0;}"
+
+
+def test_extract_code():
+    assert extract_code(clean) == clean
+    assert extract_code(f"Here:\n```c\n{clean}\n```\nDone.") == clean + "\n"
+    assert extract_code(f"```python\nprint(1)\n```\n```cpp\n{clean}\n```", "cpp") == clean + "\n"
+    assert extract_code(f"```c\n{failing}\n```\nFixed:\n```\n{clean}\n```", "c") == clean + "\n"
+    assert extract_code("```python\nprint(1)\n```", "c") == "print(1)\n"
+    assert extract_code([{"role": "assistant", "content": f"```c\n{clean}\n```"}]) == clean + "\n"
+
+
+def test_reward_function_matches_step():
+    completions = [f"```c\n{clean}\n```", failing, f"```c\n{clean}\n```", "not code"]
+    env = CodeCompilerEnv()
+    expected = [float(env.step(extract_code(completion, "c"))[1]) for completion in completions]
+    reward_function = CodeRewardFunction()
+    try:
+        assert reward_function(["prompt"] * 4, completions) == expected
+        assert reward_function.__name__ == "coderl_reward"
+        # Chat completions and a tests column, as GRPOTrainer passes them
+        chat = [[{"role": "assistant", "content": f"```c\n{adder}\n```"}]] * 2
+        tests = [[("1 2", "3")], [("1 2", "4"), ("2 2", "4")]]
+        assert reward_function(["prompt"] * 2, chat, tests=tests) == [1.0, 0.5]
+    finally:
+        reward_function.close()
+
+
+def test_reward_function_submit():
+    reward_function = CodeRewardFunction(config=defaultConfigCPP, transform=lambda reward, info: reward * 2)
+    try:
+        completions = [f"```cpp\n{clean}\n```", failing]
+        future = reward_function.submit(None, completions)
+        # Generation of the next batch would run here
+        assert reward_function(None, completions) == [2.0, -8.0]
+        assert future.done()
+        assert reward_function._pending == {}
+
+        # Tests are part of the batch, and abandoned batches do not pile up
+        tests = [[("", "")], [("", "")]]
+        reward_function.submit(None, completions, tests=tests)
+        assert reward_function(None, completions) == [2.0, -8.0]
+        for index in range(reward_function.max_pending + 2):
+            reward_function.submit(None, [f"int main(){{return {index};}}"])
+        assert len(reward_function._pending) == reward_function.max_pending
+    finally:
+        reward_function.close()
+
+
+def test_reward_function_abandoned_shared_batch():
+    slow = "#include <unistd.h>\nint main(){ usleep(500000); return 0; }"
+    reward_function = CodeRewardFunction(config=dict(defaultConfig, coalesce=True))
+    reward_function.max_pending = 2
+    try:
+        reward_function.submit(None, [slow])
+        time.sleep(0.2)
+        # Coalesced onto the evaluation of the first batch
+        reward_function.submit(None, [slow, clean])
+        time.sleep(0.2)
+        # Abandons the first batch
+        reward_function.submit(None, [failing])
+        assert reward_function(None, [slow, clean]) == [1.0, 1.0]
+    finally:
+        reward_function.close()
+
+
+def test_reward_function_step_batch():
+    vec_env = CodeCompilerVecEnv(num_workers=1)
+    reward_function = CodeRewardFunction(vec_env)
+    try:
+        assert reward_function(None, [clean, failing]) == [1.0, -4.0]
+    finally:
+        reward_function.close()
+        vec_env.close()
+
+
+def test_reward_function_tensors():
+    torch = pytest.importorskip("torch")
+    reward_function = CodeRewardFunction(return_tensors="pt")
+    try:
+        assert torch.equal(reward_function(None, [clean]), torch.tensor([1.0]))
+    finally:
+        reward_function.close()
@@ -0,0 +1,121 @@
+import socket
+import struct
+import time
+
+import pytest
+
+from coderl.daemon import DaemonClient, DaemonCompilerEnv, GradingDaemon, recv_frame, send_frame
+from coderl.main import CodeCompilerEnv, defaultConfig
+from test_vec_env import sources
+
+echo = """
+#include <stdio.h>
+int main(){
+    int a, b;
+    scanf("%d %d", &a, &b);
+    printf("%d", a + b);
+    return 0;
+}"""
+
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    daemon = GradingDaemon(str(tmp_path_factory.mktemp("daemon") / "grading.sock"), num_workers=2).start()
+    yield daemon
+    daemon.stop()
+
+
+def test_daemon_matches_step(daemon):
+    env = CodeCompilerEnv()
+    expected = [env.step(source) for source in sources]
+    client = DaemonClient(daemon.path)
+    try:
+        assert client.step_batch(sources) == expected
+    finally:
+        client.close()
+
+
+def test_daemon_env_step(daemon):
+    env = DaemonCompilerEnv(daemon.path)
+    try:
+        assert env.step(sources[1]) == (1, 1, True, {"stdout": "Hello 1"})
+        observation, reward, done, info = env.step(echo, [("1 2", "3"), ["2 2", "5"]])
+        assert reward == 0.5
+        assert [case["outcome"] for case in info["tests"]] == ["ok", "wrong_answer"]
+    finally:
+        env.close()
+
+
+def test_daemon_pipelined_requests(daemon):
+    # Several requests in flight on one connection are answered by id
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon.path)
+        send_frame(sock, {"id": 1, "op": "step", "sources": sources[:2]})
+        send_frame(sock, {"id": 2, "op": "step", "sources": sources[2:3]})
+        send_frame(sock, {"id": 3, "op": "unknown"})
+        responses = {response["id"]: response for response in (recv_frame(sock) for _ in range(3))}
+    assert [result[1] for result in responses[1]["results"]] == [-2, 1]
+    assert [result[1] for result in responses[2]["results"]] == [1]
+    assert "Unknown op" in responses[3]["error"]
+    client = DaemonClient(daemon.path)
+    try:
+        assert client.call("stats")["workers"] == 2
+        with pytest.raises(RuntimeError):
+            client.call("unknown")
+    finally:
+        client.close()
+
+
+def test_daemon_malformed_request(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon.path)
+        sock.sendall(struct.pack(">I", 9) + b"not json!")
+        response = recv_frame(sock)
+        assert response["id"] is None and "Malformed request" in response["error"]
+        # The connection is still usable
+        send_frame(sock, {"id": 1, "op": "ping"})
+        assert recv_frame(sock) == {"id": 1, "results": None}
+
+
+def test_daemon_client_timeout(daemon):
+    client = DaemonClient(daemon.path, timeout=0.01)
+    try:
+        with pytest.raises(TimeoutError):
+            client.step_batch(["#include <bits/stdc++.h>\nint main(){}"] * 4)
+        # The late response of the abandoned request is not read as this one's
+        client.timeout = None
+        assert client.step_batch(sources[1:2]) == [(1, 1, True, {"stdout": "Hello 1"})]
+    finally:
+        client.close()
+
+
+def test_daemon_throughput(daemon):
+    # The daemon serves the same results as in-process grading, at a throughput within reach of it
+    batch = sources * 2
+    env = CodeCompilerEnv(defaultConfig)
+    start = time.perf_counter()
+    expected = [env.step(source) for source in batch]
+    in_process = len(batch) / (time.perf_counter() - start)
+    env.close()
+    client = DaemonClient(daemon.path)
+    try:
+        start = time.perf_counter()
+        results = client.step_batch(batch)
+        served = len(batch) / (time.perf_counter() - start)
+    finally:
+        client.close()
+    print(f"in-process: {in_process:.1f} steps/s, daemon: {served:.1f} steps/s")
+    assert results == expected
+    assert served > in_process / 2
+
+
+def test_daemon_coalesces(tmp_path):
+    daemon = GradingDaemon(str(tmp_path / "grading.sock"), dict(defaultConfig, coalesce=True), num_workers=1).start()
+    env = DaemonCompilerEnv(daemon.path)
+    try:
+        results = env.step_batch([sources[1], sources[2], sources[1]])
+        assert results[0] == results[2] == (1, 1, True, {"stdout": "Hello 1"})
+        assert env.batch_stats == {"requests": 3, "unique": 2, "duplicates": 1, "in_flight": 0, "evaluated": 2}
+    finally:
+        env.close()
+        daemon.stop()
@@ -0,0 +1,91 @@
+import pytest
+from coderl.diagnostics import format_diagnostics, parse, rows
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from test_grading import c_corpus, cpp_corpus
+
+cascade = """
+int main(){
+    int unused;
+    int *p = 1;
+    return x + y;
+}"""
+
+
+@pytest.mark.parametrize("mode", ["ladder", "single", "bisect"])
+@pytest.mark.parametrize("config, corpus", [(defaultConfig, c_corpus), (defaultConfigCPP, cpp_corpus)])
+def test_diagnostics_parity(mode, config, corpus):
+    plain = CodeCompilerEnv(config)
+    structured = CodeCompilerEnv(dict(config, grading=mode, diagnostics=True))
+    for code in corpus:
+        expected = plain.step(code)
+        result = structured.step(code)
+        assert result[:3] == expected[:3], code
+        if "stderr" in expected[3] and "outcome" not in expected[3]:
+            assert "stderr" not in result[3]
+            assert result[3]["diagnostics"]["severity"]
+
+
+def test_gcc_json_diagnostics():
+    env = CodeCompilerEnv(dict(defaultConfig, diagnostics=True, reward_levels=[("-Wall -Werror", -1)]))
+    observation, reward, done, info = env.step(cascade)
+    diagnostics = info["diagnostics"]
+    assert set(diagnostics) == {"file", "line", "column", "severity", "option", "message", "dropped"}
+    found = {(row.line, row.column, row.severity, row.option) for row in rows(diagnostics)}
+    assert (4, 14, "error", "-Wint-conversion") in found
+    assert any("x" in row.message and "undeclared" in row.message and row.line == 5 for row in rows(diagnostics))
+    assert set(diagnostics["file"]) == {"temp_code.c"}
+
+
+def test_diagnostics_limits():
+    env = CodeCompilerEnv(dict(defaultConfig, diagnostics={"limit": 1, "message_limit": 10}))
+    observation, reward, done, info = env.step(cascade)
+    assert len(info["diagnostics"]["message"]) == 1
+    assert info["diagnostics"]["dropped"] >= 1
+    assert len(info["diagnostics"]["message"][0]) <= 13
+
+
+def test_parse_text_diagnostics():
+    stderr = "\n".join([
+        "temp_code.c: In function 'main':",
+        "temp_code.c:3:9: error: 'x' undeclared (first use in this function)",
+        "    3 |  return x;",
+        "      |         ^",
+        "temp_code.c:3:9: error: 'x' undeclared (first use in this function)",
+        "temp_code.c:2:6: warning: unused variable 'u' [-Wunused-variable]",
+        "Main.java:3: error: incompatible types: String cannot be converted to int",
+        "./temp_code.go:5:5: declared and not used: x",
+        "/usr/bin/ld: /tmp/cc1.o: in function `main':",
+        "temp_code.c:(.text+0xa): undefined reference to `f'",
+        "collect2: error: ld returned 1 exit status",
+    ])
+    diagnostics = parse(stderr)
+    assert list(rows(diagnostics)) == [
+        ("temp_code.c", 3, 9, "error", None, "'x' undeclared (first use in this function)"),
+        ("temp_code.c", 2, 6, "warning", "-Wunused-variable", "unused variable 'u'"),
+        ("Main.java", 3, 0, "error", None, "incompatible types: String cannot be converted to int"),
+        ("./temp_code.go", 5, 5, "error", None, "declared and not used: x"),
+        ("temp_code.c", 0, 0, "error", None, "undefined reference to `f'"),
+        ("collect2", 0, 0, "error", None, "ld returned 1 exit status"),
+    ]
+    assert parse(stderr, limit=2)["dropped"] == 4
+    assert format_diagnostics(diagnostics, limit=2) == (
+        "temp_code.c:3:9: error: 'x' undeclared (first use in this function)\n"
+        "temp_code.c:2:6: warning: unused variable 'u' [-Wunused-variable]\n"
+        "[... 4 more diagnostics]")
+
+
+def test_parse_header_diagnostics():
+    stderr = "\n".join([
+        "In file included from helper.h:1,",
+        "                 from temp_code.c:2:",
+        "util.h: In function 'f':",
+        "util.h:1:22: error: 'y' undeclared (first use in this function)",
+        "    1 | int f(void) { return y; }",
+        "      |                      ^",
+        "In file included from temp_code.c:1:",
+        "util.h:3:5: warning: unused variable 'z' [-Wunused-variable]",
+    ])
+    assert list(rows(parse(stderr))) == [
+        ("util.h", 1, 22, "error", None, "'y' undeclared (first use in this function)"),
+        ("util.h", 3, 5, "warning", "-Wunused-variable", "unused variable 'z'"),
+    ]
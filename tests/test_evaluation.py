@@ -0,0 +1,113 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+from coderl import evaluation
+from coderl.cli import main
+from coderl.evaluation import Evaluation, format_summary
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+programs = ["int main(){ return 0; }", "int main(){ int unused; return 0; }", "int main(){ return x; }"]
+
+
+def write_dataset(path, count):
+    with open(path, "w") as file:
+        for index in range(count):
+            file.write(json.dumps({"id": f"r{index}", "code": programs[index % len(programs)]}) + "\n")
+
+
+def read_rows(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_evaluation(tmp_path):
+    dataset = tmp_path / "data.jsonl"
+    with open(dataset, "w") as file:
+        file.write(json.dumps({"id": 7, "code": programs[0]}) + "\n\n")
+        file.write(json.dumps({"lang": "cpp", "code": "#include <iostream>\nint main(){ int a; std::cin >> a; "
+                                                      "std::cout << 2 * a; }", "tests": [["2", "4"]]}) + "\n")
+        file.write(json.dumps({"id": "x", "lang": "cobol", "code": "x"}) + "\nnot json\n")
+    output = str(tmp_path / "results.jsonl")
+    summary = Evaluation(str(dataset), output, num_workers=2, chunksize=2).run()
+    rows = read_rows(output)
+    assert [(row["id"], row["lang"], row["reward"]) for row in rows] == [
+        (7, "c", 1), (2, "cpp", 1), ("x", "cobol", None), (4, None, None)]
+    assert rows[0]["info"] == {"stdout": ""} and rows[1]["info"]["tests"][0]["passed"]
+    assert "Unknown language" in rows[2]["error"] and "Invalid record" in rows[3]["error"]
+    assert summary["records"] == 4 and summary["errors"] == 2 and summary["rewards"] == {"1": 2}
+    assert "2 errors" in format_summary(summary)
+    # A finished evaluation is not graded again
+    assert Evaluation(str(dataset), output).run() == summary
+
+
+def test_resume_after_kill(tmp_path):
+    dataset = str(tmp_path / "data.jsonl")
+    write_dataset(dataset, 45)
+    expected = str(tmp_path / "expected.jsonl")
+    assert main(["eval", dataset, expected, "--workers", "2"]) == 0
+
+    output = str(tmp_path / "results.jsonl")
+    command = [sys.executable, "-m", "coderl", "eval", dataset, output, "--workers", "2", "--chunksize", "1",
+               "--checkpoint-every", "5"]
+    process = subprocess.Popen(command, cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(output + ".checkpoint") and process.poll() is None:
+            time.sleep(0.05)
+        process.send_signal(signal.SIGKILL)
+    finally:
+        process.wait()
+    with open(output + ".checkpoint") as file:
+        checkpoint = json.load(file)
+    assert not checkpoint["complete"] and 0 < checkpoint["summary"]["records"] < 45
+
+    summary = Evaluation(dataset, output, num_workers=2, checkpoint_every=5).run()
+    assert read_rows(output) == read_rows(expected)
+    assert summary["records"] == 45 and summary["rewards"] == {"1": 15, "-2": 15, "-4": 15}
+
+
+def test_interrupt_checkpoints_whole_chunks(tmp_path, monkeypatch):
+    dataset = str(tmp_path / "data.jsonl")
+    write_dataset(dataset, 12)
+    expected = str(tmp_path / "expected.jsonl")
+    Evaluation(dataset, expected, num_workers=1).run()
+
+    output = str(tmp_path / "results.jsonl")
+    write = evaluation._JsonlWriter.write
+    written = []
+
+    def interrupting_write(self, row):
+        # A SIGINT in the middle of the second chunk
+        written.append(row)
+        if len(written) == 5:
+            signal.raise_signal(signal.SIGINT)
+        write(self, row)
+
+    monkeypatch.setattr(evaluation._JsonlWriter, "write", interrupting_write)
+    with pytest.raises(KeyboardInterrupt):
+        Evaluation(dataset, output, num_workers=1, chunksize=3).run()
+    with open(output + ".checkpoint") as file:
+        assert json.load(file)["summary"]["records"] == 6
+    monkeypatch.setattr(evaluation._JsonlWriter, "write", write)
+
+    assert Evaluation(dataset, output, num_workers=1).run()["records"] == 12
+    assert read_rows(output) == read_rows(expected)
+
+
+def test_parquet_output(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    dataset = str(tmp_path / "data.jsonl")
+    write_dataset(dataset, 7)
+    output = str(tmp_path / "results.parquet")
+    summary = Evaluation(dataset, output, num_workers=2, chunksize=2, checkpoint_every=4).run()
+    assert summary["records"] == 7
+    # One part per checkpoint, and no temporary part left behind
+    assert all(name.startswith("part-") and name.endswith(".parquet") for name in os.listdir(output))
+    rows = parquet.read_table(output).to_pylist()
+    assert [(row["id"], row["reward"]) for row in rows] == [(f"r{index}", [1.0, -2.0, -4.0][index % 3])
+                                                             for index in range(7)]
+    assert json.loads(rows[0]["info"]) == {"stdout": ""}
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+import pytest
+from coderl.main import CodeCompilerEnv, defaultConfigGo
+
+pytestmark = pytest.mark.skipif(shutil.which("go") is None, reason="go is not installed")
+
+hello = """
+package main
+
+import "fmt"
+
+func main() {
+    fmt.Print("Hello World")
+}
+"""
+
+broken = """
+package main
+
+func main() {
+    x := 1
+}
+"""
+
+
+def test_go_build_and_run(tmp_path):
+    env = CodeCompilerEnv(dict(defaultConfigGo, go_cache=str(tmp_path / "go-build")))
+    try:
+        observation, reward, done, info = env.step(hello)
+        assert (observation, reward, done) == (1, 1, True)
+        assert info["stdout"] == "Hello World"
+        assert info["compile_time"] > 0 and info["run_time"] > 0
+        # The cache was warmed once and is marked as such
+        assert any(name.startswith("coderl-warm-") and not name.endswith(".lock")
+                   for name in os.listdir(tmp_path / "go-build"))
+
+        observation, reward, done, info = env.step(broken)
+        assert (observation, reward, done) == (0, -1, True)
+        assert "declared and not used" in info["stderr"]
+        assert "run_time" not in info
+    finally:
+        env.close()
@@ -0,0 +1,142 @@
+import re
+
+import pytest
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from coderl import grading
+
+c_corpus = [
+    # clean
+    """
+    #include<stdio.h>
+    int main(){
+    printf("Hello World");
+    return 0;
+    }""",
+    # hard error
+    """
+    int main(){
+        return x;
+    }""",
+    # link error
+    """
+    void missing(void);
+    int main(){
+        missing();
+        return 0;
+    }""",
+    # warning enabled by default (-Werror)
+    """
+    #include<stdio.h>
+    int main(){
+        int x = "abc";
+        printf("%d", x);
+        return 0;
+    }""",
+    # #warning directive (-Werror)
+    """
+    #warning "todo"
+    int main(){ return 0; }""",
+    # unused variable (-Wall)
+    """
+    int main(){
+        int x;
+        return 0;
+    }""",
+    # format mismatch (-Wall)
+    """
+    #include<stdio.h>
+    int main(){
+        printf("%d", "x");
+        return 0;
+    }""",
+    # missing field initializer (-Wextra)
+    """
+    struct Point { int x, y; };
+    int main(){
+        struct Point p = { 1 };
+        return p.x - 1;
+    }""",
+    # sign compare (-Wextra in C)
+    """
+    int main(){
+        unsigned int a = 1;
+        int b = -1;
+        return a < b;
+    }""",
+    # unused parameter (-Wextra, not classified by -Q)
+    """
+    static int f(int a){ return 0; }
+    int main(){ return f(1); }""",
+    # warnings at several levels
+    """
+    #include<stdio.h>
+    struct Point { int x, y; };
+    int main(){
+        int unused;
+        struct Point p = { 1 };
+        int x = "abc";
+        printf("%d %d", p.x, x);
+        return 0;
+    }""",
+    # runtime error
+    """
+    int main(){ return 3; }""",
+]
+
+cpp_corpus = [
+    """
+    #include <iostream>
+    int main(){ std::cout << "Hello World"; return 0; }""",
+    # sign compare is part of -Wall in C++
+    """
+    #include <vector>
+    int main(){
+        std::vector<int> v;
+        for (int i = 0; i < v.size(); i++) {}
+        return 0;
+    }""",
+    """
+    int main(){ int y; return 0; }""",
+    """
+    int main(){ undefined_call(); }""",
+]
+
+
+def normalize(result):
+    # The linker names gcc's randomly named temporary object files
+    return result[:3] + ({key: re.sub(r"/tmp/cc\w+\.o", "/tmp/cc.o", value) for key, value in result[3].items()},)
+
+
+@pytest.mark.parametrize("mode", ["single", "bisect"])
+@pytest.mark.parametrize("config, corpus", [(defaultConfig, c_corpus), (defaultConfigCPP, cpp_corpus)])
+def test_grading_parity(mode, config, corpus):
+    ladder = CodeCompilerEnv(config)
+    fast = CodeCompilerEnv(dict(config, grading=mode))
+    for code in corpus:
+        expected = ladder.step(code)
+        result = fast.step(code)
+        assert result[:3] == expected[:3], code
+        assert set(result[3]) == set(expected[3]), code
+        if mode == "bisect" or normalize(result) == normalize(expected):
+            assert normalize(result) == normalize(expected), code
+        else:
+            # A level rejected by the single compile reports its warnings, without -Werror
+            assert {key: value for key, value in result[3].items() if key != "stderr"} == \
+                {key: value for key, value in expected[3].items() if key != "stderr"}, code
+            assert "warning" in result[3]["stderr"], code
+
+
+def test_classify():
+    level_info = [
+        (False, set(), {"-Wunused-variable": False}),
+        (True, set(), {"-Wunused-variable": False}),
+        (True, set(), {"-Wunused-variable": True}),
+    ]
+    assert grading.classify(set(), level_info) == (3, None)
+    assert grading.classify({"-Wunused-variable"}, level_info) == (2, None)
+    assert grading.classify({None}, level_info) == (3, 1)
+
+
+def test_unknown_grading_mode():
+    with pytest.raises(ValueError):
+        CodeCompilerEnv(dict(defaultConfig, grading="fast"))
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from coderl.harness import TestCase, outputs_match
+from coderl.main import CodeCompilerEnv, defaultConfig
+from coderl.vec_env import CodeCompilerVecEnv
+
+add = """
+#include <stdio.h>
+int main(){
+    int a, b;
+    scanf("%d %d", &a, &b);
+    if (a == 7) while (1);
+    printf("%d\\n", a + b);
+    return 0;
+}"""
+
+cases = [("1 2", "3"), {"input": "2 2", "output": "4\n"}, TestCase("5 5", "11"), ("7 1", "8")]
+
+
+def close_enough(stdout, expected, stdin):
+    return abs(int(stdout) - int(expected)) <= 1
+
+
+def test_outputs_match():
+    assert outputs_match("1 \n2\n\n", "1\n2")
+    assert not outputs_match("1 2", "1\n2")
+
+
+def test_partial_credit():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 1}))
+    observation, reward, done, info = env.step(add, cases)
+    assert (observation, reward) == (0, 0.5)
+    assert [case["outcome"] for case in info["tests"]] == ["ok", "ok", "wrong_answer", "timeout"]
+
+    observation, reward, done, info = env.step(add, cases[:2] + [TestCase("5 5", "11", close_enough)])
+    assert (observation, reward, done) == (1, 1, True)
+    assert all(case["passed"] for case in info["tests"])
+
+
+def test_early_exit():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 1}, test_workers=1, early_exit=True))
+    start = time.monotonic()
+    observation, reward, done, info = env.step(add, cases)
+    assert [case["outcome"] for case in info["tests"]] == ["ok", "ok", "wrong_answer", "skipped"]
+    assert time.monotonic() - start < 1
+    assert reward == 0.5
+
+
+def test_async_and_vec_env_match_step():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 1}))
+    expected = env.step(add, cases[:3])
+    result = asyncio.run(env.astep_many([add], tests=[cases[:3]]))[0]
+    assert result[:3] == expected[:3]
+    assert [case["outcome"] for case in result[3]["tests"]] == [case["outcome"] for case in expected[3]["tests"]]
+
+    vec_env = CodeCompilerVecEnv(dict(defaultConfig, sandbox={"wall_time": 1}), num_workers=1)
+    try:
+        observations, rewards, dones, infos = vec_env.step_batch([add, add], [cases[:2], cases[:3]])
+    finally:
+        vec_env.close()
+    assert list(rewards) == [1, 2 / 3]
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+# Cumulative import time allowed for `import coderl`, in seconds
+IMPORT_BUDGET = float(os.environ.get("CODERL_IMPORT_BUDGET", "0.2"))
+HEAVY_MODULES = ["gym", "numpy", "transformers", "llama_index", "trl", "pwn", "intercode", "faiss"]
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_import_time_budget():
+    result = run_python("import coderl")
+    assert result.returncode == 0, result.stderr
+    cumulative = None
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "coderl":
+            cumulative = int(fields[1]) / 1e6
+    assert cumulative is not None
+    assert cumulative < IMPORT_BUDGET, f"import coderl took {cumulative:.3f}s"
+
+
+def test_import_is_lazy():
+    result = run_python(
+        "import sys, coderl, coderl.contrib, coderl.contrib.trl, coderl.attack, coderl.defence\n"
+        f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,81 @@
+import shutil
+
+import pytest
+from coderl.main import CodeCompilerEnv, defaultConfigJava
+
+pytestmark = pytest.mark.skipif(shutil.which("javac") is None, reason="javac is not installed")
+
+java_corpus = [
+    """
+    public class Main {
+        public static void main(String[] args) {
+            System.out.print("Hello World");
+        }
+    }""",
+    # -Xlint:all warning (raw type)
+    """
+    import java.util.*;
+    public class Main {
+        public static void main(String[] args) {
+            List list = new ArrayList();
+            list.add("x");
+            System.out.print(list.size());
+        }
+    }""",
+    # compile error
+    """
+    public class Main {
+        public static void main(String[] args) {
+            int x = "abc";
+        }
+    }""",
+    # uncaught exception
+    """
+    public class Main {
+        public static void main(String[] args) {
+            throw new RuntimeException("boom");
+        }
+    }""",
+    # System.exit restarts the server
+    """
+    public class Main {
+        public static void main(String[] args) {
+            System.out.print("bye");
+            System.exit(3);
+        }
+    }""",
+]
+
+
+def test_java_server_matches_javac():
+    process_env = CodeCompilerEnv(defaultConfigJava)
+    server_env = CodeCompilerEnv(dict(defaultConfigJava, java_server=True))
+    try:
+        for code in java_corpus + java_corpus[:1]:
+            expected = process_env.step(code)
+            result = server_env.step(code)
+            assert result[:3] == expected[:3], code
+            if "stdout" in expected[3]:
+                assert result[3] == expected[3]
+        assert server_env.java_server.restarts == 1
+    finally:
+        server_env.close()
+
+
+def test_java_server_output():
+    env = CodeCompilerEnv(dict(defaultConfigJava, java_server=True, sandbox={"output": 1000}))
+    try:
+        # Writes to the JVM's own stdout do not reach the protocol
+        observation, reward, done, info = env.step("""
+        public class Main {
+            public static void main(String[] args) throws Exception {
+                new java.io.FileOutputStream(java.io.FileDescriptor.out).write(new byte[64]);
+                System.out.print("x".repeat(100000));
+            }
+        }""")
+        assert info["stdout_truncated"]
+        assert info["stdout"].startswith("x" * 500) and info["stdout"].endswith("x" * 500)
+        assert env.step(java_corpus[0])[3]["stdout"] == "Hello World"
+        assert env.java_server.restarts == 0
+    finally:
+        env.close()
@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+import pytest
+from coderl import memfd
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP, defaultConfigJava
+from test_async import normalize
+from test_grading import c_corpus, cpp_corpus
+
+pytestmark = pytest.mark.skipif(not memfd.supported, reason="memfd_create is not available")
+
+crash = "int main(){ int *p = 0; return *p; }"
+
+
+def untimed(result):
+    return normalize(result[:3] + ({key: value for key, value in result[3].items() if not key.endswith("_time")},))
+
+
+@pytest.mark.parametrize("mode", ["ladder", "single", "staged"])
+@pytest.mark.parametrize("config, corpus", [(defaultConfig, c_corpus + [crash]), (defaultConfigCPP, cpp_corpus)])
+def test_memfd_parity(mode, config, corpus):
+    options = {"staged": True} if mode == "staged" else {"grading": mode}
+    disk = CodeCompilerEnv(dict(config, **options))
+    memory = CodeCompilerEnv(dict(config, memfd=True, **options))
+    assert memory.memfd
+    for code in corpus:
+        assert untimed(memory.step(code)) == untimed(disk.step(code)), code
+    assert [untimed(result) for result in asyncio.run(memory.astep_many(corpus))] == \
+        [untimed(disk.step(code)) for code in corpus]
+
+
+def test_memfd_leaves_no_binary(tmp_path):
+    env = CodeCompilerEnv(dict(defaultConfig, memfd=True))
+    workdir = str(tmp_path)
+    result = env._drive(env._grade('#include <stdio.h>\nint main(){ printf("x"); return 0; }', workdir), workdir)
+    assert result[:3] == (1, 1, True) and result[3] == {"stdout": "x"}
+    assert os.listdir(tmp_path) == [env.input_filename]
+
+
+def test_memfd_file():
+    binary = memfd.MemoryFile("test")
+    with open(binary.path, "wb") as file:
+        file.write(b"abc")
+    path = binary.seal()
+    assert binary.size() == 3
+    with open(path, "rb") as file:
+        assert file.read() == b"abc"
+    binary.close()
+    assert not os.path.exists(path)
+
+
+def test_memfd_needs_a_built_program():
+    with pytest.raises(ValueError):
+        CodeCompilerEnv(dict(defaultConfigJava, memfd=True))
@@ -0,0 +1,40 @@
+import logging
+
+from coderl.main import CodeCompilerEnv, defaultConfig
+from coderl.metrics import Metrics
+from coderl.utils import set_verbosity
+from test_grading import c_corpus
+
+
+def test_trace_and_metrics(tmp_path, capsys):
+    records = []
+    metrics = Metrics(path=str(tmp_path / "coderl.prom"), callback=records.append)
+    env = CodeCompilerEnv(dict(defaultConfig, timings=True), metrics=metrics)
+    observation, reward, done, info = env.step(c_corpus[0])
+    assert reward == 1
+    assert [event["stage"] for event in info["trace"]] == ["write"] + ["compile"] * 4 + ["run"]
+    assert [event["flags"] for event in info["trace"][1:5]] == [flags for flags, _ in defaultConfig["reward_levels"]]
+    run = info["trace"][-1]
+    assert (run["returncode"], run["stdout_bytes"], run["stderr_bytes"]) == (0, 11, 0)
+    assert {"write_time", "compile_time", "run_time"} <= set(info)
+
+    env.step(c_corpus[1])
+    assert [record["stage"] for record in records] == ["run", "compile"]
+    text = metrics.prometheus()
+    assert 'coderl_steps_total{stage="run"} 1' in text
+    assert 'coderl_commands_total{stage="compile",returncode="1"} 1' in text
+    assert 'coderl_stage_seconds_count{stage="compile"} 5' in text
+    metrics.write()
+    assert (tmp_path / "coderl.prom").read_text() == text
+    # Results are logged, not printed
+    assert capsys.readouterr().out == ""
+
+
+def test_set_verbosity(caplog):
+    set_verbosity(logging.DEBUG)
+    try:
+        with caplog.at_level(logging.DEBUG, logger="coderl"):
+            CodeCompilerEnv().step(c_corpus[0])
+        assert any("run result" in record.getMessage() for record in caplog.records)
+    finally:
+        set_verbosity(logging.WARNING)
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from coderl.pch import PchCache
+from test_async import normalize
+from test_grading import c_corpus, cpp_corpus
+
+missing_header = """
+#include <no_such_header.h>
+int main(){ return 0; }"""
+
+
+def test_prelude():
+    source = "// solution\n#include <stdio.h>\n\n#  include<stdlib.h> /* malloc */\nint main(){}\n#include <string.h>\n"
+    assert PchCache.prelude(source) == "#include <stdio.h>\n#include <stdlib.h>"
+    assert PchCache.prelude('#include "local.h"\n#include <stdio.h>\n') is None
+    assert PchCache.prelude("int main(){}") is None
+    assert PchCache.prelude("#include <stdio.h>\n#include <assert.h>\n#include <stdlib.h>\n") == "#include <stdio.h>"
+    assert PchCache.prelude("#include <cassert>\n") is None
+
+
+@pytest.mark.parametrize("config, corpus", [(defaultConfig, c_corpus), (defaultConfigCPP, cpp_corpus)])
+def test_pch_parity(tmp_path, config, corpus):
+    plain = CodeCompilerEnv(config)
+    env = CodeCompilerEnv(dict(config, pch=str(tmp_path)))
+    corpus = corpus + [missing_header]
+    for code in corpus:
+        assert normalize(env.step(code)) == normalize(plain.step(code)), code
+    built = env.pch.stats()
+    assert built["builds"] > 0
+
+    # Every precompiled header is reused on the second pass
+    for code in corpus:
+        assert normalize(env.step(code)) == normalize(plain.step(code)), code
+    stats = env.pch.stats()
+    assert stats["builds"] == built["builds"]
+    assert stats["hits"] >= built["hits"] + built["builds"]
+    assert any(name.endswith(".gch") for entry in os.listdir(tmp_path) for name in os.listdir(tmp_path / entry))
+
+
+def test_pch_unsupported_language():
+    with pytest.raises(ValueError):
+        CodeCompilerEnv(dict(defaultConfigCPP, lang="cuda", pch=True))
+
+
+def test_pch_failed_prelude_is_retried_with_another_compiler(tmp_path):
+    env = CodeCompilerEnv(dict(defaultConfig, pch=str(tmp_path)))
+    env.step(missing_header)
+    marker, = (tmp_path / entry / "prelude.h.failed" for entry in os.listdir(tmp_path))
+    fallbacks = env.pch.stats()["fallbacks"]
+    env.step(missing_header)
+    assert env.pch.stats()["fallbacks"] == fallbacks + 1
+
+    env.pch._compiler_id = lambda compiler: "upgraded"
+    env.step(missing_header)
+    assert marker.read_text() == "upgraded"
+
+
+def test_pch_eviction(tmp_path):
+    env = CodeCompilerEnv(dict(defaultConfig, pch=str(tmp_path), pch_max_bytes=1))
+    env.step("#include <stdio.h>\nint main(){ return 0; }")
+    env.step("#include <stdlib.h>\nint main(){ return 0; }")
+    builds = env.pch.stats()["builds"]
+    headers = [name for entry in os.listdir(tmp_path) for name in os.listdir(tmp_path / entry)]
+    # Only the last header built is kept; the preludes stay for compiles still using them
+    assert headers.count("prelude.h.gch") == 1 and headers.count("prelude.h") == builds
+    assert env.step("#include <stdio.h>\nint main(){ return 0; }")[1] == 1
+    assert env.pch.stats()["builds"] == builds * 3 // 2
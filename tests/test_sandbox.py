@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from coderl import sandbox
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from coderl.sandbox import SandboxCommand, classify
+
+busy_loop = """
+int main(){ while(1); }"""
+
+segfault = """
+int main(){ int *p = 0; return *p; }"""
+
+allocate = """
+#include <vector>
+int main(){
+    std::vector<char *> blocks;
+    while (true) blocks.push_back(new char[1 << 20]());
+}"""
+
+orphan = """
+#include <stdio.h>
+#include <unistd.h>
+int main(){
+    pid_t pid = fork();
+    if (pid == 0) { close(1); close(2); sleep(1000); }
+    printf("%d", pid);
+    return 0;
+}"""
+
+rewards = {"timeout": -10, "oom": -11, "signal": -12}
+
+
+def test_classify():
+    assert classify(0, "", False) == "ok"
+    assert classify(1, "", False) == "error"
+    assert classify(0, "", True) == "timeout"
+    assert classify(139, "Segmentation fault", False) == "signal"
+    assert classify(-11, "", False) == "signal"
+    assert classify(134, "terminate called after throwing an instance of 'std::bad_alloc'", False) == "oom"
+    assert classify(-9, "", False) == "signal"
+    assert classify(137, "", False, {"cpu_time": 1, "memory": 2 ** 30}) == "timeout"
+    assert classify(-9, "", False, {"memory": 2 ** 30}) == "signal"
+    assert classify(-9, "", False, {"memory": 2 ** 30}, oom_killed=True) == "oom"
+
+
+@pytest.mark.parametrize("prlimit", [sandbox._prlimit, None])
+def test_limits_are_applied(monkeypatch, prlimit):
+    monkeypatch.setattr(sandbox, "_prlimit", prlimit)
+    limits = {"wall_time": 5, "cpu_time": 3, "memory": 256 * 1024 * 1024, "file_size": 1024 * 1024}
+    result = SandboxCommand("ulimit -t; ulimit -v; ulimit -f", limits).run()
+    assert result.stdout.split() == ["3", str(256 * 1024), str(1024 * 1024 // 512)]
+    result = asyncio.run(SandboxCommand("ulimit -v", limits).arun())
+    assert result.stdout.split() == [str(256 * 1024)]
+
+
+def test_wall_time_kills_process_group():
+    start = time.monotonic()
+    result = SandboxCommand("sleep 100 & sleep 100", {"wall_time": 0.5}).run()
+    assert result.outcome == "timeout"
+    assert time.monotonic() - start < 5
+
+
+def test_run_outcomes():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 1}, run_rewards=rewards))
+    observation, reward, done, info = env.step(busy_loop)
+    assert (observation, reward, info["outcome"]) == (0, -10, "timeout")
+    observation, reward, done, info = env.step(segfault)
+    assert (observation, reward, info["outcome"]) == (0, -12, "signal")
+
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 10, "cpu_time": 1}, run_rewards=rewards))
+    observation, reward, done, info = env.step(busy_loop)
+    assert (reward, info["outcome"]) == (-10, "timeout")
+
+
+def test_memory_limit():
+    env = CodeCompilerEnv(dict(defaultConfigCPP, sandbox={"memory": 256 * 1024 * 1024}, run_rewards=rewards))
+    observation, reward, done, info = env.step(allocate)
+    assert (reward, info["outcome"]) == (-11, "oom")
+
+
+def test_sigkill_without_memory_pressure():
+    assert SandboxCommand("kill -9 $$").run().outcome == "signal"
+    assert asyncio.run(SandboxCommand("kill -9 $$").arun()).outcome == "signal"
+
+
+def test_oom_kill_count(tmp_path, monkeypatch):
+    events = tmp_path / "memory.events"
+    events.write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n")
+    monkeypatch.setattr(sandbox, "_oom_kill_path", str(events))
+    assert sandbox._oom_kills() == 1
+    assert not sandbox._oom_killed(1)
+    events.write_text("oom_kill_disable 0\nunder_oom 0\noom_kill 2\n")
+    assert sandbox._oom_killed(1)
+    assert not sandbox._oom_killed(None)
+
+
+def test_orphans_are_killed():
+    env = CodeCompilerEnv(defaultConfig)
+    observation, reward, done, info = env.step(orphan)
+    assert reward == 1
+    pid = int(info["stdout"])
+    time.sleep(0.1)
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            assert file.read().split(")")[-1].split()[0] == "Z"
+    except FileNotFoundError:
+        pass
+
+
+def test_async_timeout():
+    env = CodeCompilerEnv(dict(defaultConfig, sandbox={"wall_time": 1}, run_rewards=rewards))
+    observation, reward, done, info = asyncio.run(env.astep(busy_loop))
+    assert (reward, info["outcome"]) == (-10, "timeout")
+
+
+def test_async_cancel_kills_process_group(tmp_path):
+    pid_file = tmp_path / "pid"
+
+    async def cancel():
+        task = asyncio.ensure_future(SandboxCommand(f"sleep 100 & echo $! > {pid_file}; wait").arun())
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    pid = int(pid_file.read_text())
+    time.sleep(0.1)
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            assert file.read().split(")")[-1].split()[0] == "Z"
+    except FileNotFoundError:
+        pass
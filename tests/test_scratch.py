@@ -0,0 +1,48 @@
+import os
+import threading
+
+from coderl.main import CodeCompilerEnv, defaultConfigCPP
+from coderl.scratch import ScratchPool, default_scratch_root
+
+
+def test_step_does_not_touch_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    env = CodeCompilerEnv()
+    assert env.step('int main(){return 0;}')[:3] == (1, 1, True)
+    assert os.listdir(tmp_path) == []
+    env.close()
+
+
+def test_concurrent_envs_in_one_cwd():
+    envs = [CodeCompilerEnv(defaultConfigCPP) for _ in range(4)]
+    results = [None] * len(envs)
+
+    def grade(index):
+        code = '#include <cstdio>\nint main(){ printf("%d", NUMBER); return 0; }'.replace("NUMBER", str(index))
+        results[index] = [envs[index].step(code) for _ in range(3)]
+
+    threads = [threading.Thread(target=grade, args=(index,)) for index in range(len(envs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index, env in enumerate(envs):
+        assert results[index] == [(1, 1, True, {"stdout": str(index)})] * 3
+        env.close()
+
+
+def test_scratch_pool_reuses_and_cleans(tmp_path):
+    pool = ScratchPool(str(tmp_path))
+    directory = pool.acquire()
+    with open(os.path.join(directory, "leftover"), "w") as file:
+        file.write("x")
+    pool.release(directory)
+    assert pool.acquire() == directory
+    assert os.listdir(directory) == []
+    pool.release(directory)
+    pool.close()
+    assert not os.path.exists(directory)
+
+
+def test_default_scratch_root_is_writable():
+    assert os.access(default_scratch_root(), os.W_OK)
@@ -0,0 +1,54 @@
+import pytest
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from test_async import normalize
+from test_grading import c_corpus, cpp_corpus
+
+syntax_error = """
+int main(){
+    return 0
+}"""
+
+# Fails to link, and also fails a warning level
+link_error = """
+void missing(void);
+int main(){ int x; missing(); return 0; }"""
+
+
+@pytest.mark.parametrize("mode", ["ladder", "single"])
+@pytest.mark.parametrize("config, corpus", [(defaultConfig, c_corpus), (defaultConfigCPP, cpp_corpus)])
+def test_staged_parity(mode, config, corpus):
+    ladder = CodeCompilerEnv(config)
+    staged = CodeCompilerEnv(dict(config, grading=mode, staged=True))
+    for code in corpus + [syntax_error, link_error]:
+        expected = ladder.step(code)
+        result = staged.step(code)
+        assert result[:3] == expected[:3], code
+        assert {"syntax_time", "compile_time"} <= set(result[3])
+        if expected[1] == 1:
+            assert result[3]["stage"] == "run"
+            assert result[3]["stdout"] == expected[3]["stdout"]
+
+
+def test_staged_stages():
+    env = CodeCompilerEnv(dict(defaultConfig, staged=True, stage_rewards={"syntax": -10, "link": -5}))
+    observation, reward, done, info = env.step(syntax_error)
+    assert (observation, reward, info["stage"]) == (0, -10, "syntax")
+    assert info["compile_time"] == 0.0 and "link_time" not in info
+
+    observation, reward, done, info = env.step("void missing(void);\nint main(){ missing(); return 0; }")
+    assert (observation, reward, info["stage"]) == (0, -5, "link")
+    assert "undefined reference" in info["stderr"]
+
+
+@pytest.mark.parametrize("mode", ["ladder", "single", "bisect"])
+def test_staged_link_error_without_execution(mode):
+    config = dict(defaultConfig, execute=False)
+    expected = CodeCompilerEnv(config).step(link_error)
+    observation, reward, done, info = CodeCompilerEnv(dict(config, grading=mode, staged=True)).step(link_error)
+    assert (observation, reward) == expected[:2] == (0, -4)
+    assert info["stage"] == "link"
+
+
+def test_staged_unknown_language():
+    with pytest.raises(ValueError):
+        CodeCompilerEnv(dict(defaultConfig, lang="php", staged=True))
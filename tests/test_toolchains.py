@@ -0,0 +1,37 @@
+import json
+import shutil
+
+from coderl import toolchains
+from coderl.toolchains import ToolchainRegistry
+
+
+def test_registry_probes_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "toolchains.json")
+    gcc = ToolchainRegistry(path).get("c")
+    assert gcc.command == "gcc"
+    assert gcc.path == shutil.which("gcc")
+    assert gcc.vendor == "GNU"
+    assert gcc.version[0].isdigit()
+
+    def no_spawn(*args, **kwargs):
+        raise AssertionError("toolchain probed again")
+
+    # A new process reads the persisted record instead of spawning the compiler
+    monkeypatch.setattr(toolchains.subprocess, "run", no_spawn)
+    registry = ToolchainRegistry(path)
+    assert registry.get("c") == gcc
+    assert registry.get("c") is registry.get("c")
+
+
+def test_registry_invalidates_on_mtime(tmp_path):
+    path = tmp_path / "toolchains.json"
+    ToolchainRegistry(str(path)).get("c")
+    records = json.loads(path.read_text())
+    records["c"]["mtime"] -= 1
+    records["c"]["toolchain"]["version"] = "0.0.0"
+    path.write_text(json.dumps(records))
+    assert ToolchainRegistry(str(path)).get("c").version != "0.0.0"
+
+
+def test_registry_missing_language():
+    assert ToolchainRegistry(None).get("brainfuck") is None
@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+
+from coderl.db import CompileCache, TrajectoryStore, trajectories
+from coderl.db.trajectories import source_hash
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigCPP
+from coderl.vec_env import CodeCompilerVecEnv
+
+programs = ['#include <stdio.h>\nint main(){ printf("%s", "x"); return 0; }', "int main(){ int unused; return 0; }",
+            "int main(){ return x; }"]
+
+
+def test_store_records_steps(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.sqlite"), output_limit=20)
+    env = CodeCompilerEnv(dict(defaultConfig, staged=True), store=store)
+    results = [env.step(program) for program in programs]
+    episodes = store.episodes()
+    assert [(row["source_hash"], row["lang"], row["reward"], row["observation"], row["origin"])
+            for row in episodes] == [(source_hash(program), "c", result[1], result[0], "graded")
+                                     for program, result in zip(programs, results)]
+    assert [row["stage"] for row in episodes] == ["run", "compile", "syntax"]
+    assert set(episodes[0]["timings"]) >= {"compile_time", "run_time"}
+    assert episodes[0]["stdout"] == "x" and episodes[0]["info"]["stage"] == "run"
+    assert len(episodes[2]["stderr"]) == 23 and episodes[2]["stderr"].endswith("...")
+    assert store.reward_counts() == {1: 1, -2: 1, -4: 1}
+    assert store.episodes(min_reward=0) == episodes[:1]
+    assert store.stats() == {"recorded": 3, "written": 3, "dropped": 0, "queued": 0}
+    store.close()
+
+    with sqlite3.connect(store.path) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"episodes_source_hash", "episodes_lang_reward", "episodes_reward"} <= indexes
+        assert connection.execute("SELECT COUNT(*) FROM configs").fetchone() == (1,)
+
+
+def test_store_records_cached_and_shared_steps(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.sqlite"), keep_sources=True)
+    env = CodeCompilerEnv(dict(defaultConfigCPP, coalesce=True), cache=CompileCache(path=None), store=store)
+    source = "#include <iostream>\nint main(){ std::cout << 1; }"
+    env.step(source)
+    env.step(source)
+    asyncio.run(env.astep_many([source + " ", source + " "]))
+    assert [row["origin"] for row in store.episodes(lang="cpp")] == ["graded", "cache", "graded", "shared"]
+    assert store.duplicates() == [(source_hash(source), 2), (source_hash(source + " "), 2)]
+    assert store.episodes(source_hash=source_hash(source))[1]["stdout"] == "1"
+    store.close()
+    with sqlite3.connect(store.path) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM sources").fetchone() == (2,)
+
+
+def test_store_in_vec_env_workers(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.sqlite"))
+    vec_env = CodeCompilerVecEnv(num_workers=2, store=store)
+    try:
+        observations, rewards, dones, infos = vec_env.step_batch(programs * 2)
+    finally:
+        vec_env.close()
+    counts = store.reward_counts("c")
+    assert counts == {1: 2, -2: 2, -4: 2}
+
+
+def test_store_survives_bad_batches(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(trajectories.atexit, "register", registered.append)
+    store = TrajectoryStore(str(tmp_path / "trajectories.sqlite"))
+    # Too large for an SQLite integer: the batch fails outside of sqlite3.Error
+    store.record(programs[0], defaultConfig, (2 ** 70, 1, True, {}))
+    store.flush()
+    store.record(programs[0], defaultConfig, (0, 1, True, {}))
+    assert len(store.episodes()) == 1
+    store.close()
+    store.record(programs[1], defaultConfig, (0, 1, True, {}))
+    store.close()
+    assert registered == [store.close]
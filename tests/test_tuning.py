@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from coderl import toolchains, tuning
+from coderl.main import CodeCompilerEnv, defaultConfig, defaultConfigJava
+from coderl.tuning import TuningStore, calibrate
+
+corpus = tuning.reference_corpus["c"][:3] + ["int main(){ return x; }"]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = TuningStore(str(tmp_path / "tuning.json"))
+    monkeypatch.setattr(tuning, "store", store)
+    return store
+
+
+def test_calibrate_keeps_equivalent_setups(store):
+    # -w silences the warnings the reward levels grade, so it must never be picked
+    record = calibrate(defaultConfig, corpus, repeat=1, margin=-100, dimensions=[["", "-w"], ["", "-pipe"]])
+    assert record["command"] == "gcc" and record["flags"] == "-pipe"
+    assert [setup["equivalent"] for setup in record["setups"] if setup["flags"] == "-w"] == [False]
+    assert store.lookup(defaultConfig) == tuning.Setup("gcc", "-pipe")
+    # Keys that do not change the build share the calibration
+    assert store.lookup(dict(defaultConfig, coalesce=True)) == tuning.Setup("gcc", "-pipe")
+    assert store.lookup(dict(defaultConfig, pre_flag="-O2")) is None
+    assert TuningStore(store.path).lookup(defaultConfig) == tuning.Setup("gcc", "-pipe")
+
+    env = CodeCompilerEnv(defaultConfig)
+    assert env.tuning == tuning.Setup("gcc", "-pipe") and env.pre_flag == "-pipe"
+    assert [env.step(source)[:2] for source in corpus] == [(1, 1), (0, -3), (0, -2), (0, -4)]
+    assert CodeCompilerEnv(dict(defaultConfig, tuning=False)).pre_flag == ""
+
+
+def test_calibration_invalidated_by_new_compiler(store):
+    calibrate(defaultConfig, corpus[:1], repeat=1, dimensions=[])
+    records = json.loads(open(store.path).read())
+    for record in records[store.host].values():
+        record["binaries"] = {path: mtime - 1 for path, mtime in record["binaries"].items()}
+    with open(store.path, "w") as file:
+        json.dump(records, file)
+    assert TuningStore(store.path).lookup(defaultConfig) is None
+
+
+def test_forced_setup():
+    env = CodeCompilerEnv(dict(defaultConfig, pre_flag="-g", tuning={"command": "gcc", "flags": "-pipe -O0"}))
+    assert env.pre_flag == "-g -pipe -O0" and env.command == "gcc"
+    assert env.step(corpus[0])[:2] == (1, 1)
+    with pytest.raises(ValueError):
+        calibrate(defaultConfigJava)
+
+
+def test_calibrate_picks_another_compiler(store, monkeypatch):
+    # cc stands in for a second compiler such as clang, which may not be installed
+    candidates = dict(toolchains.toolchain_candidates, c=toolchains.toolchain_candidates["c"][:1] +
+                      [("cc", ["--version"], r"\d+\.\d+\.\d+", "GNU")])
+    monkeypatch.setattr(toolchains, "toolchain_candidates", candidates)
+    monkeypatch.setattr(toolchains, "registry", toolchains.ToolchainRegistry(None))
+    record = calibrate(defaultConfig, corpus, repeat=1, margin=-100, dimensions=[["", "-pipe"]])
+    assert record["command"] == "cc" and record["flags"] == "-pipe"
+    assert CodeCompilerEnv(defaultConfig).command == "cc"
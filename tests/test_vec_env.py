@@ -0,0 +1,40 @@
+from coderl.main import CodeCompilerEnv
+from coderl.vec_env import CodeCompilerVecEnv
+
+sources = [
+    """
+    #include<stdio.h>
+    int main(){
+    printf("Hello NUMBER");
+    return 0;
+    }""".replace("NUMBER", str(i)) if i % 3 else """
+    int main(){
+        int x;
+        return 0;
+    }"""
+    for i in range(8)
+]
+
+
+def test_vec_env_matches_step():
+    env = CodeCompilerEnv()
+    expected = [env.step(source) for source in sources]
+    vec_env = CodeCompilerVecEnv(num_workers=2)
+    try:
+        observations, rewards, dones, infos = vec_env.step_batch(sources)
+    finally:
+        vec_env.close()
+    assert list(observations) == [result[0] for result in expected]
+    assert list(rewards) == [result[1] for result in expected]
+    assert all(dones)
+    assert [info.get("stdout") for info in infos] == [result[3].get("stdout") for result in expected]
+
+
+def test_vec_env_gym_step():
+    vec_env = CodeCompilerVecEnv(num_workers=2, num_envs=2)
+    try:
+        observations, rewards, dones, infos = vec_env.step(sources[:2])
+    finally:
+        vec_env.close()
+    assert list(rewards) == [-2, 1]
+    assert infos[1] == {"stdout": "Hello 1"}